@@ -0,0 +1,387 @@
+import csv
+import io
+from collections import defaultdict
+from datetime import date, datetime, timedelta
+
+import click
+from flask.cli import AppGroup
+from sqlalchemy import delete, func, insert, select, tuple_, update
+from sqlalchemy.dialects import postgresql, sqlite
+
+from app import db
+from availability import parse_date
+from booking import locked_get
+from models import (AnalyticsWatermark, Car, CarModel, Rental, RentalDailyStat, RentalMonthlyStat,
+                    RentalRollupEntry)
+
+# Rentals whose booked days and revenue count towards the reports
+COUNTED_STATUSES = ('active', 'completed')
+
+WATERMARK = 'rental_rollups'
+WATERMARK_EPOCH = datetime(1970, 1, 1)
+# Rentals read and folded into the rollups per transaction
+DEFAULT_CHUNK_SIZE = 2000
+# Additive columns shared by the daily and monthly rollups
+ROLLUP_COLUMNS = ('booked_days', 'revenue', 'rentals_started', 'rental_days_started')
+# Each refresh re-reads rentals changed shortly before the watermark, in case
+# a slower transaction committed them after a later one; the ledger makes
+# re-reading an unchanged rental a no-op
+REFRESH_OVERLAP = timedelta(minutes=5)
+# Reports reach at most this many years either side of today
+MAX_REPORT_YEARS = 10
+
+
+# Incremental refresh
+
+def _contribute(deltas, car_model_id, start_day, end_day, total_price, sign):
+    # Spread a rental over its days: one booked day and an equal share of
+    # the price per day, plus the rental itself on its first day
+    days = max((end_day - start_day).days + 1, 1)
+    per_day = total_price / days
+    for offset in range(days):
+        delta = deltas[(car_model_id, start_day + timedelta(days=offset))]
+        delta[0] += sign
+        delta[1] += sign * per_day
+    first = deltas[(car_model_id, start_day)]
+    first[2] += sign
+    first[3] += sign * days
+
+
+def _apply_deltas(model, key_column, deltas):
+    """Add ``deltas`` keyed by (car_model_id, key) onto the rollup rows of ``model``.
+
+    A single ``INSERT ... ON CONFLICT DO UPDATE SET x = x + excluded.x``
+    batch, so no rollup row is read back into Python.
+    """
+    rows = [{
+        'car_model_id': car_model_id,
+        key_column.key: key,
+        'booked_days': booked,
+        'revenue': revenue,
+        'rentals_started': started,
+        'rental_days_started': started_days,
+    } for (car_model_id, key), (booked, revenue, started, started_days) in deltas.items()
+        if booked or started or started_days or abs(revenue) > 1e-9]
+    if not rows:
+        return
+
+    dialect_insert = postgresql.insert if db.session.get_bind().dialect.name == 'postgresql' else sqlite.insert
+    table = model.__table__
+    statement = dialect_insert(table)
+    statement = statement.on_conflict_do_update(
+        index_elements=[table.c.car_model_id, table.c[key_column.key]],
+        set_={column: table.c[column] + statement.excluded[column] for column in ROLLUP_COLUMNS}
+    )
+    db.session.execute(statement, rows)
+
+
+def _monthly(deltas):
+    months = defaultdict(lambda: [0, 0.0, 0, 0])
+    for (car_model_id, day), delta in deltas.items():
+        totals = months[(car_model_id, day.replace(day=1))]
+        for index, value in enumerate(delta):
+            totals[index] += value
+    return months
+
+
+def _lock_watermark():
+    # Serialises refreshes: a second run waits, then sees the advanced watermark
+    watermark = locked_get(AnalyticsWatermark, WATERMARK)
+    if watermark is None:
+        watermark = AnalyticsWatermark(name=WATERMARK, updated_at=WATERMARK_EPOCH, rental_id=0)
+        db.session.add(watermark)
+    return watermark
+
+
+def _refresh_chunk(cursor, chunk_size):
+    """Fold the next ``chunk_size`` changed rentals after ``cursor`` into the rollups.
+
+    Returns the number of rentals read, how many of them changed the
+    rollups, and the cursor to continue from.
+    """
+    watermark = _lock_watermark()
+    rentals = db.session.execute(
+        select(Rental.id, Rental.car_model_id, Rental.start_date, Rental.end_date,
+               Rental.total_price, Rental.status, Rental.updated_at)
+        .where(tuple_(Rental.updated_at, Rental.id) > cursor)
+        .order_by(Rental.updated_at, Rental.id)
+        .limit(chunk_size)
+    ).all()
+    if not rentals:
+        return 0, 0, cursor
+
+    ledger = {
+        row.rental_id: (row.car_model_id, row.start_day, row.end_day, row.total_price)
+        for row in db.session.execute(select(RentalRollupEntry).where(
+            RentalRollupEntry.rental_id.in_([rental.id for rental in rentals])
+        )).scalars()
+    }
+
+    deltas = defaultdict(lambda: [0, 0.0, 0, 0])
+    ledger_inserts, ledger_updates, ledger_deletes = [], [], []
+    changed = 0
+    for rental in rentals:
+        current = None
+        if rental.status in COUNTED_STATUSES:
+            current = (rental.car_model_id, rental.start_date.date(), rental.end_date.date(), rental.total_price)
+        previous = ledger.get(rental.id)
+        if previous == current:
+            continue
+        changed += 1
+        if previous is not None:
+            _contribute(deltas, *previous, -1)
+        if current is not None:
+            _contribute(deltas, *current, 1)
+            entry = dict(zip(('car_model_id', 'start_day', 'end_day', 'total_price'), current), rental_id=rental.id)
+            (ledger_updates if previous is not None else ledger_inserts).append(entry)
+        else:
+            ledger_deletes.append(rental.id)
+
+    _apply_deltas(RentalDailyStat, RentalDailyStat.day, deltas)
+    _apply_deltas(RentalMonthlyStat, RentalMonthlyStat.month, _monthly(deltas))
+    if ledger_updates:
+        db.session.execute(update(RentalRollupEntry), ledger_updates)
+    if ledger_inserts:
+        db.session.execute(insert(RentalRollupEntry), ledger_inserts)
+    if ledger_deletes:
+        db.session.execute(delete(RentalRollupEntry).where(RentalRollupEntry.rental_id.in_(ledger_deletes)))
+
+    last = rentals[-1]
+    if (last.updated_at, last.id) > (watermark.updated_at, watermark.rental_id):
+        watermark.updated_at, watermark.rental_id = last.updated_at, last.id
+    return len(rentals), changed, (last.updated_at, last.id)
+
+
+def refresh_rollups(chunk_size=DEFAULT_CHUNK_SIZE):
+    """Fold rentals created or changed since the last refresh into the rollups.
+
+    Each chunk commits together with the advanced watermark, so an
+    interrupted refresh resumes where it stopped. Returns the number of
+    rentals that changed the rollups; rentals re-read within
+    ``REFRESH_OVERLAP`` without changes do not count.
+    """
+    since = db.session.execute(
+        select(AnalyticsWatermark.updated_at).where(AnalyticsWatermark.name == WATERMARK)
+    ).scalar()
+    cursor = (since - REFRESH_OVERLAP, 0) if since else (WATERMARK_EPOCH, 0)
+
+    total = 0
+    while True:
+        try:
+            count, changed, cursor = _refresh_chunk(cursor, chunk_size)
+            db.session.commit()
+        except Exception:
+            db.session.rollback()
+            raise
+        total += changed
+        if count < chunk_size:
+            return total
+
+
+def rebuild_rollups(chunk_size=DEFAULT_CHUNK_SIZE):
+    """Drop every rollup and recompute them from the full rental history."""
+    for model in (RentalDailyStat, RentalMonthlyStat, RentalRollupEntry, AnalyticsWatermark):
+        db.session.execute(delete(model))
+    db.session.commit()
+    return refresh_rollups(chunk_size)
+
+
+def last_refreshed():
+    # Change time of the newest rental folded into the rollups
+    return db.session.execute(
+        select(AnalyticsWatermark.updated_at).where(AnalyticsWatermark.name == WATERMARK)
+    ).scalar()
+
+
+# Reports
+#
+# Reports read the monthly rollups, so a period is always whole months and
+# the cost depends on the fleet size and number of months, not on history.
+
+def _month_start(value):
+    return date(value.year, value.month, 1)
+
+
+def _next_month(month):
+    return date(month.year + month.month // 12, month.month % 12 + 1, 1)
+
+
+def _parse_month(value, today):
+    # ``YYYY-MM`` from a month input, or any ISO date within the month;
+    # months more than MAX_REPORT_YEARS from today count as missing
+    if value and len(value) == 7:
+        value += '-01'
+    parsed = parse_date(value)
+    if parsed is None or abs(parsed.year - today.year) > MAX_REPORT_YEARS:
+        return None
+    return _month_start(parsed)
+
+
+def report_period(args, today=None):
+    """First and last day of the ``start``/``end`` months, defaulting to the last twelve.
+
+    Missing, malformed or far-off months fall back to those defaults.
+    """
+    today = today or date.today()
+    current = _month_start(today)
+    start = _parse_month(args.get('start'), today) or _next_month(date(current.year - 1, current.month, 1))
+    end = _parse_month(args.get('end'), today) or current
+    if end < start:
+        start, end = end, start
+    return start, _next_month(end) - timedelta(days=1)
+
+
+def _months(start, end):
+    month = _month_start(start)
+    while month <= end:
+        yield month
+        month = _next_month(month)
+
+
+def _fleet_days(start, end, by_month=False):
+    """Days each car model was in the catalog within ``[start, end]``.
+
+    Returns ``{car_model_id: days}``, or with ``by_month=True`` the fleet's
+    total per month start. The catalog is small, so this is computed from
+    creation dates rather than stored.
+    """
+    totals = defaultdict(int)
+    for model_id, created_at in db.session.execute(select(CarModel.id, CarModel.created_at)):
+        first = max(start, created_at.date()) if created_at else start
+        if first > end:
+            continue
+        if not by_month:
+            totals[model_id] += (end - first).days + 1
+            continue
+        for month in _months(first, end):
+            period_start = max(first, month)
+            period_end = min(end, _next_month(month) - timedelta(days=1))
+            totals[month] += (period_end - period_start).days + 1
+    return totals
+
+
+def _ratio(numerator, denominator):
+    return numerator / denominator if denominator else 0.0
+
+
+def _totals():
+    return (
+        func.sum(RentalMonthlyStat.booked_days),
+        func.sum(RentalMonthlyStat.revenue),
+        func.sum(RentalMonthlyStat.rentals_started),
+        func.sum(RentalMonthlyStat.rental_days_started),
+    )
+
+
+def _in_period(start, end):
+    return RentalMonthlyStat.month.between(_month_start(start), end)
+
+
+def monthly_report(start, end):
+    """Revenue, utilization and average rental length per month."""
+    rows = db.session.execute(
+        select(RentalMonthlyStat.month, *_totals())
+        .where(_in_period(start, end))
+        .group_by(RentalMonthlyStat.month)
+        .order_by(RentalMonthlyStat.month)
+    ).all()
+    fleet_days = _fleet_days(start, end, by_month=True)
+    return [{
+        'month': month.strftime('%Y-%m'),
+        'revenue': round(revenue or 0.0, 2),
+        'booked_days': booked or 0,
+        'rentals': started or 0,
+        'utilization': round(_ratio(booked or 0, fleet_days.get(month, 0)), 4),
+        'avg_rental_days': round(_ratio(started_days or 0, started or 0), 2),
+    } for month, booked, revenue, started, started_days in rows]
+
+
+def _per_model(start, end):
+    # Period totals per car model, with its brand and name when it still exists
+    totals = (
+        select(RentalMonthlyStat.car_model_id, *_totals())
+        .where(_in_period(start, end))
+        .group_by(RentalMonthlyStat.car_model_id)
+        .subquery()
+    )
+    return db.session.execute(
+        select(totals, Car.brand, CarModel.name)
+        .outerjoin(CarModel, CarModel.id == totals.c.car_model_id)
+        .outerjoin(Car, Car.id == CarModel.car_id)
+    ).all()
+
+
+def brand_report(start, end):
+    """Revenue, utilization and average rental length per brand."""
+    fleet_days = _fleet_days(start, end)
+    brands = defaultdict(lambda: [0, 0.0, 0, 0])
+    for model_id, booked, revenue, started, started_days, brand, _ in _per_model(start, end):
+        totals = brands[brand or 'Removed models']
+        totals[0] += booked or 0
+        totals[1] += revenue or 0.0
+        totals[2] += started or 0
+        totals[3] += started_days or 0
+
+    brand_fleet_days = defaultdict(int)
+    for model_id, brand in db.session.execute(select(CarModel.id, Car.brand).join(Car, Car.id == CarModel.car_id)):
+        brand_fleet_days[brand] += fleet_days.get(model_id, 0)
+
+    rows = [{
+        'brand': brand,
+        'revenue': round(revenue, 2),
+        'booked_days': booked,
+        'rentals': started,
+        'utilization': round(_ratio(booked, brand_fleet_days.get(brand, 0)), 4),
+        'avg_rental_days': round(_ratio(started_days, started), 2),
+    } for brand, (booked, revenue, started, started_days) in brands.items()]
+    return sorted(rows, key=lambda row: row['revenue'], reverse=True)
+
+
+def model_report(start, end, limit=50):
+    """The ``limit`` highest-earning car models in the period."""
+    fleet_days = _fleet_days(start, end)
+    rows = [{
+        'car_model_id': model_id,
+        'brand': brand or 'Removed',
+        'model': name or f'#{model_id}',
+        'revenue': round(revenue or 0.0, 2),
+        'booked_days': booked or 0,
+        'rentals': started or 0,
+        'utilization': round(_ratio(booked or 0, fleet_days.get(model_id, 0)), 4),
+        'avg_rental_days': round(_ratio(started_days or 0, started or 0), 2),
+    } for model_id, booked, revenue, started, started_days, brand, name in _per_model(start, end)]
+    rows.sort(key=lambda row: row['revenue'], reverse=True)
+    return rows[:limit] if limit else rows
+
+
+REPORTS = {
+    'monthly': monthly_report,
+    'brands': brand_report,
+    'models': lambda start, end: model_report(start, end, limit=None),
+}
+
+
+def report_csv(rows):
+    buffer = io.StringIO()
+    if rows:
+        writer = csv.DictWriter(buffer, fieldnames=list(rows[0]))
+        writer.writeheader()
+        writer.writerows(rows)
+    return buffer.getvalue()
+
+
+analytics_cli = AppGroup('analytics', help='Revenue and utilization rollups.')
+
+
+@analytics_cli.command('refresh')
+@click.option('--chunk-size', default=DEFAULT_CHUNK_SIZE, show_default=True)
+def refresh_command(chunk_size):
+    """Fold new and changed rentals into the rollups."""
+    click.echo(f'{refresh_rollups(chunk_size)} rentals processed')
+
+
+@analytics_cli.command('rebuild')
+@click.option('--chunk-size', default=DEFAULT_CHUNK_SIZE, show_default=True)
+def rebuild_command(chunk_size):
+    """Recompute the rollups from the full rental history."""
+    click.echo(f'{rebuild_rollups(chunk_size)} rentals processed')
@@ -0,0 +1,347 @@
+import json
+from functools import wraps
+
+from flask import Blueprint, current_app, request, stream_with_context
+from flask_login import current_user
+from werkzeug.exceptions import HTTPException
+
+from app import db
+from models import Car, CarModel
+from availability import available_model_ids, parse_date
+from booking import BookingConflict, create_booking, validate_dates
+from occupancy import get_occupancy
+from pricing import quote, validate_quote_dates
+from pagination import clamp_per_page, keyset_paginate
+from replicas import read_replica
+
+try:
+    import orjson
+except ImportError:  # pragma: no cover - the stdlib encoder is a fine fallback
+    orjson = None
+
+api = Blueprint('api', __name__, url_prefix='/api/v1')
+
+# Upper bounds for batch requests
+MAX_BATCH_MODELS = 1000
+MAX_BATCH_BOOKINGS = 100
+MAX_QUOTE_RANGES = 50
+STREAM_CHUNK_SIZE = 1000
+
+# Public car model fields and the columns they are read from
+MODEL_FIELDS = {
+    'id': CarModel.id,
+    'car_id': CarModel.car_id,
+    'brand': Car.brand,
+    'year': Car.year,
+    'name': CarModel.name,
+    'price_per_day': CarModel.price_per_day,
+    'mileage': CarModel.mileage,
+    'fuel_type': CarModel.fuel_type,
+    'transmission': CarModel.transmission,
+    'seats': CarModel.seats,
+    'air_conditioning': CarModel.air_conditioning,
+    'image_url': CarModel.image_url,
+    'is_available': CarModel.is_available,
+    'created_at': CarModel.created_at,
+    'updated_at': CarModel.updated_at,
+}
+
+CAR_FIELDS = {
+    'id': Car.id,
+    'brand': Car.brand,
+    'year': Car.year,
+    'description': Car.description,
+    'is_available': Car.is_available,
+    'created_at': Car.created_at,
+    'updated_at': Car.updated_at,
+}
+
+
+class ApiError(Exception):
+    def __init__(self, message, status=400):
+        super().__init__(message)
+        self.message = message
+        self.status = status
+
+
+def _default(value):
+    # Dates and datetimes for the stdlib encoder (orjson handles them natively)
+    if hasattr(value, 'isoformat'):
+        return value.isoformat()
+    raise TypeError(f'{type(value).__name__} is not JSON serializable')
+
+
+def dumps(payload):
+    if orjson is not None:
+        return orjson.dumps(payload)
+    return json.dumps(payload, separators=(',', ':'), default=_default).encode()
+
+
+def json_response(payload, status=200):
+    return current_app.response_class(dumps(payload), status=status, mimetype='application/json')
+
+
+@api.errorhandler(ApiError)
+def handle_api_error(error):
+    return json_response({'error': error.message}, error.status)
+
+
+@api.errorhandler(HTTPException)
+def handle_http_error(error):
+    return json_response({'error': error.description}, error.code)
+
+
+def api_login_required(view):
+    # Like login_required, but answers 401 JSON instead of redirecting
+    @wraps(view)
+    def wrapped(*args, **kwargs):
+        if not current_user.is_authenticated:
+            raise ApiError('Authentication required.', 401)
+        return view(*args, **kwargs)
+    return wrapped
+
+
+def selected_fields(available, default=None):
+    requested = request.args.get('fields')
+    if not requested:
+        return list(default or available)
+    fields = [field.strip() for field in requested.split(',') if field.strip()]
+    unknown = [field for field in fields if field not in available]
+    if unknown:
+        raise ApiError(f"Unknown fields: {', '.join(unknown)}")
+    return fields
+
+
+def parse_bool(value):
+    if value is None:
+        return None
+    return value.lower() in ('1', 'true', 'yes')
+
+
+def parse_number(name, cast=float):
+    value = request.args.get(name)
+    if value is None or value == '':
+        return None
+    try:
+        return cast(value)
+    except ValueError:
+        raise ApiError(f'{name} must be a number.')
+
+
+def car_model_query(fields):
+    # Always select id and created_at so rows can be keyset-paginated
+    columns = dict.fromkeys(['id', 'created_at', *fields])
+    query = db.session.query(*[MODEL_FIELDS[field].label(field) for field in columns]).join(
+        Car, Car.id == CarModel.car_id
+    )
+
+    filters = {
+        'brand': Car.brand,
+        'fuel_type': CarModel.fuel_type,
+        'transmission': CarModel.transmission,
+    }
+    for name, column in filters.items():
+        if request.args.get(name):
+            query = query.filter(column == request.args[name])
+
+    available = parse_bool(request.args.get('available'))
+    if available is not None:
+        query = query.filter(CarModel.is_available == available)
+    min_price = parse_number('min_price')
+    if min_price is not None:
+        query = query.filter(CarModel.price_per_day >= min_price)
+    max_price = parse_number('max_price')
+    if max_price is not None:
+        query = query.filter(CarModel.price_per_day <= max_price)
+    seats = parse_number('seats', int)
+    if seats is not None:
+        query = query.filter(CarModel.seats >= seats)
+    return query
+
+
+def stream_rows(query, fields):
+    # Newline-delimited JSON, fetched and encoded in bounded chunks
+    def generate():
+        for row in query.order_by(CarModel.created_at.desc(), CarModel.id.desc()).yield_per(STREAM_CHUNK_SIZE):
+            mapping = row._mapping
+            yield dumps({field: mapping[field] for field in fields}) + b'\n'
+    return current_app.response_class(stream_with_context(generate()), mimetype='application/x-ndjson')
+
+
+@api.route('/models')
+@read_replica
+def list_car_models():
+    fields = selected_fields(MODEL_FIELDS)
+    query = car_model_query(fields)
+
+    if request.args.get('format') == 'ndjson':
+        return stream_rows(query, fields)
+
+    page = keyset_paginate(
+        query, CarModel,
+        after=request.args.get('after'),
+        before=request.args.get('before'),
+        per_page=clamp_per_page(request.args.get('limit'))
+    )
+    return json_response({
+        'items': [{field: row._mapping[field] for field in fields} for row in page.items],
+        'next_cursor': page.next_cursor,
+        'prev_cursor': page.prev_cursor,
+    })
+
+
+@api.route('/models/<int:model_id>')
+@read_replica
+def get_car_model(model_id):
+    fields = selected_fields(MODEL_FIELDS)
+    row = car_model_query(fields).filter(CarModel.id == model_id).first()
+    if row is None:
+        raise ApiError('Car model not found.', 404)
+    return json_response({field: row._mapping[field] for field in fields})
+
+
+@api.route('/cars')
+@read_replica
+def list_cars():
+    fields = selected_fields(CAR_FIELDS)
+    columns = dict.fromkeys(['id', 'created_at', *fields])
+    query = db.session.query(*[CAR_FIELDS[field].label(field) for field in columns])
+    if request.args.get('brand'):
+        query = query.filter(Car.brand == request.args['brand'])
+
+    page = keyset_paginate(
+        query, Car,
+        after=request.args.get('after'),
+        before=request.args.get('before'),
+        per_page=clamp_per_page(request.args.get('limit'))
+    )
+    return json_response({
+        'items': [{field: row._mapping[field] for field in fields} for row in page.items],
+        'next_cursor': page.next_cursor,
+        'prev_cursor': page.prev_cursor,
+    })
+
+
+def request_json():
+    payload = request.get_json(silent=True)
+    if not isinstance(payload, dict):
+        raise ApiError('Expected a JSON object body.')
+    return payload
+
+
+def date_range(payload, priced=False):
+    # Ranges that get priced also follow the quote limits
+    start_date = parse_date(payload.get('start_date'))
+    end_date = parse_date(payload.get('end_date'))
+    if start_date is None or end_date is None:
+        raise ApiError('start_date and end_date must be YYYY-MM-DD dates.')
+    try:
+        (validate_quote_dates if priced else validate_dates)(start_date, end_date)
+    except ValueError as error:
+        raise ApiError(str(error))
+    return start_date, end_date
+
+
+@api.route('/availability', methods=['POST'])
+def batch_availability():
+    payload = request_json()
+    start_date, end_date = date_range(payload)
+    model_ids = payload.get('model_ids')
+    if not isinstance(model_ids, list) or not all(isinstance(model_id, int) for model_id in model_ids):
+        raise ApiError('model_ids must be a list of integers.')
+    if len(model_ids) > MAX_BATCH_MODELS:
+        raise ApiError(f'At most {MAX_BATCH_MODELS} model_ids per request.')
+
+    # One query for existence; availability comes from the occupancy bitmaps,
+    # or one more query for ranges beyond their horizon
+    existing = set(db.session.execute(
+        db.select(CarModel.id).where(CarModel.id.in_(model_ids))
+    ).scalars())
+    occupancy = get_occupancy()
+    occupancy.refresh([model_id for model_id in existing if model_id not in occupancy])
+    free = occupancy.free_model_ids(start_date, end_date)
+    available = existing & free if free is not None else available_model_ids(start_date, end_date, existing)
+    return json_response({
+        'start_date': start_date,
+        'end_date': end_date,
+        'available': sorted(available),
+        'unavailable': sorted(existing - available),
+        'unknown': sorted(set(model_ids) - existing),
+    })
+
+
+@api.route('/quotes', methods=['POST'])
+@read_replica
+def batch_quotes():
+    payload = request_json()
+    model_ids = payload.get('model_ids')
+    if not isinstance(model_ids, list) or not all(isinstance(model_id, int) for model_id in model_ids):
+        raise ApiError('model_ids must be a list of integers.')
+    if len(model_ids) > MAX_BATCH_MODELS:
+        raise ApiError(f'At most {MAX_BATCH_MODELS} model_ids per request.')
+    ranges = payload.get('ranges')
+    if not isinstance(ranges, list) or not ranges:
+        raise ApiError('ranges must be a non-empty list.')
+    if len(ranges) > MAX_QUOTE_RANGES:
+        raise ApiError(f'At most {MAX_QUOTE_RANGES} ranges per request.')
+    ranges = [date_range(item if isinstance(item, dict) else {}, priced=True) for item in ranges]
+    try:
+        # The span of the whole request, which sizes the calendar quote() builds
+        validate_quote_dates(min(start for start, _ in ranges), max(end for _, end in ranges))
+    except ValueError as error:
+        raise ApiError(str(error))
+
+    prices = dict(db.session.execute(
+        db.select(CarModel.id, CarModel.price_per_day).where(CarModel.id.in_(model_ids))
+    ).all())
+    totals = quote(prices, ranges)
+    return json_response({
+        'quotes': [{
+            'car_model_id': model_id,
+            'start_date': start_date,
+            'end_date': end_date,
+            'days': (end_date - start_date).days + 1,
+            'base_price': round(price_per_day * ((end_date - start_date).days + 1), 2),
+            'total_price': totals[(model_id, start_date, end_date)],
+        } for start_date, end_date in ranges for model_id, price_per_day in prices.items()],
+        'unknown': sorted(set(model_ids) - set(prices)),
+    })
+
+
+@api.route('/bookings', methods=['POST'])
+@api_login_required
+def batch_bookings():
+    bookings = request_json().get('bookings')
+    if not isinstance(bookings, list) or not bookings:
+        raise ApiError('bookings must be a non-empty list.')
+    if len(bookings) > MAX_BATCH_BOOKINGS:
+        raise ApiError(f'At most {MAX_BATCH_BOOKINGS} bookings per request.')
+
+    # Each booking commits on its own, so one conflict does not sink the batch
+    results = []
+    for item in bookings:
+        if not isinstance(item, dict) or not isinstance(item.get('car_model_id'), int):
+            results.append({'status': 'invalid', 'error': 'car_model_id must be an integer.'})
+            continue
+        result = {'car_model_id': item['car_model_id']}
+        try:
+            start_date, end_date = date_range(item, priced=True)
+            rental = create_booking(current_user.id, item['car_model_id'], start_date, end_date)
+        except ApiError as error:
+            result.update(status='invalid', error=error.message)
+        except LookupError:
+            result.update(status='not_found', error='Car model not found.')
+        except BookingConflict:
+            result.update(status='conflict', error='This car is already booked for the selected dates.')
+        else:
+            result.update(
+                status='confirmed',
+                rental_id=rental.id,
+                start_date=start_date,
+                end_date=end_date,
+                total_price=rental.total_price
+            )
+        results.append(result)
+
+    confirmed = sum(1 for result in results if result['status'] == 'confirmed')
+    return json_response({'results': results, 'confirmed': confirmed}, 201 if confirmed else 200)
@@ -4,6 +4,11 @@ from flask import Flask
 from flask_sqlalchemy import SQLAlchemy
 from werkzeug.middleware.proxy_fix import ProxyFix
 from flask_login import LoginManager
+
+from assets import Assets
+from instrumentation import Instrumentation
+from passwords import PasswordHasher
+from replicas import RoutingSession, remember_writes, replica_binds
 import logging
 
 
@@ -15,54 +20,170 @@ is only available in SQLAlchemy 2.x.
 
 
 # Set up logging
-logging.basicConfig(level=logging.DEBUG)
+logging.basicConfig(level=os.environ.get("LOG_LEVEL", "DEBUG").upper())
 
-# Initialize SQLAlchemy with the default model base
-db = SQLAlchemy()
+# Extensions are created unbound and attached to each app in create_app()
+db = SQLAlchemy(session_options={"class_": RoutingSession})
 
-# Create the Flask application
-app = Flask(__name__)
-app.secret_key = os.environ.get("SESSION_SECRET", "dev-secret-key")
-app.wsgi_app = ProxyFix(app.wsgi_app, x_proto=1, x_host=1)  # needed for url_for to generate with https
+login_manager = LoginManager()
+login_manager.login_view = 'main.login'
+login_manager.login_message_category = 'info'
 
-# Configure the database
-app.config["SQLALCHEMY_DATABASE_URI"] = os.environ.get("DATABASE_URL", "sqlite:///car_rental.db")
-app.config["SQLALCHEMY_ENGINE_OPTIONS"] = {
-    "pool_recycle": 300,
-    "pool_pre_ping": True,
-}
-app.config["SQLALCHEMY_TRACK_MODIFICATIONS"] = False
+instrumentation = Instrumentation()
+assets = Assets()
+password_hasher = PasswordHasher()
 
-# Initialize the database with the app
-db.init_app(app)
 
-# Initialize Flask-Login
-login_manager = LoginManager()
-login_manager.init_app(app)
-login_manager.login_view = 'login'
-login_manager.login_message_category = 'info'
+def configure(app):
+    app.secret_key = os.environ.get("SESSION_SECRET", "dev-secret-key")
+
+    # Configure the database
+    app.config["SQLALCHEMY_DATABASE_URI"] = os.environ.get("DATABASE_URL", "sqlite:///car_rental.db")
+    app.config["SQLALCHEMY_ENGINE_OPTIONS"] = {
+        "pool_recycle": 300,
+        "pool_pre_ping": True,
+    }
+    # Connection pool per process. The pool is thread- and greenlet-safe;
+    # size it to the requests one worker serves at once (gunicorn.conf.py
+    # derives this from the worker class). Requests wait up to
+    # DB_POOL_TIMEOUT seconds for a connection once all are checked out.
+    app.config["DB_POOL_SIZE"] = int(os.environ.get("DB_POOL_SIZE", 5))
+    app.config["DB_MAX_OVERFLOW"] = int(os.environ.get("DB_MAX_OVERFLOW", 10))
+    app.config["DB_POOL_TIMEOUT"] = float(os.environ.get("DB_POOL_TIMEOUT", 30))
+    app.config["SQLALCHEMY_TRACK_MODIFICATIONS"] = False
+
+    # Read replicas, as comma-separated URLs. Views marked @read_replica send
+    # their SELECTs to a random replica; a user who writes reads from the
+    # primary for the next REPLICA_STICKY_SECONDS, to cover replication lag
+    app.config["DATABASE_REPLICA_URLS"] = [
+        url.strip() for url in os.environ.get("DATABASE_REPLICA_URLS", "").split(",") if url.strip()
+    ]
+    app.config["REPLICA_STICKY_SECONDS"] = int(os.environ.get("REPLICA_STICKY_SECONDS", 10))
+
+    # Password hashing runs on a pool of PASSWORD_HASH_WORKERS threads per
+    # process, with up to PASSWORD_HASH_QUEUE more requests waiting; beyond
+    # that sign-ins get a 503. Stored hashes made with another method are
+    # upgraded on the user's next login. Any werkzeug method works, e.g.
+    # "pbkdf2:sha256:600000" or "scrypt:32768:8:1"
+    app.config["PASSWORD_HASH_METHOD"] = os.environ.get("PASSWORD_HASH_METHOD", "pbkdf2:sha256:600000")
+    app.config["PASSWORD_HASH_WORKERS"] = int(os.environ.get("PASSWORD_HASH_WORKERS", os.cpu_count() or 1))
+    app.config["PASSWORD_HASH_QUEUE"] = int(os.environ.get("PASSWORD_HASH_QUEUE", 8))
+
+    # Cache for the per-request user lookup of renters; admins are always read
+    # from the database (see cache.py for backend options)
+    app.config["IDENTITY_CACHE_SIZE"] = int(os.environ.get("IDENTITY_CACHE_SIZE", 1024))
+    app.config["IDENTITY_CACHE_TTL"] = int(os.environ.get("IDENTITY_CACHE_TTL", 300))
+    app.config["IDENTITY_CACHE_BACKEND"] = os.environ.get("IDENTITY_CACHE_BACKEND")
+
+    # Cache for rendered catalog fragments and query results; entries are also
+    # invalidated explicitly whenever cars, models or bookings change
+    app.config["CATALOG_CACHE_SIZE"] = int(os.environ.get("CATALOG_CACHE_SIZE", 512))
+    app.config["CATALOG_CACHE_TTL"] = int(os.environ.get("CATALOG_CACHE_TTL", 60))
+    app.config["CATALOG_CACHE_BACKEND"] = os.environ.get("CATALOG_CACHE_BACKEND")
+
+    # Per-worker bitmaps of booked days for the calendar and date-range
+    # availability: days tracked ahead, and seconds between catching up with
+    # bookings made by other workers
+    app.config["OCCUPANCY_HORIZON_DAYS"] = int(os.environ.get("OCCUPANCY_HORIZON_DAYS", 366))
+    app.config["OCCUPANCY_SYNC_SECONDS"] = float(os.environ.get("OCCUPANCY_SYNC_SECONDS", 5))
+
+    # Car model images are stored here under content hashes, with resized
+    # WebP and JPEG variants when Pillow is installed
+    app.config["IMAGE_STORAGE_DIR"] = os.environ.get("IMAGE_STORAGE_DIR", os.path.join(app.instance_path, "images"))
+    app.config["IMAGE_MAX_BYTES"] = int(os.environ.get("IMAGE_MAX_BYTES", 10 * 1024 * 1024))
+    app.config["IMAGE_MAX_PIXELS"] = int(os.environ.get("IMAGE_MAX_PIXELS", 40_000_000))
+    app.config["IMAGE_FETCH_TIMEOUT"] = float(os.environ.get("IMAGE_FETCH_TIMEOUT", 10))
+
+    # gzip level for HTML and JSON responses (0 disables, e.g. when a proxy
+    # compresses); static files are precompressed by `flask assets build`
+    app.config["RESPONSE_COMPRESSION_LEVEL"] = int(os.environ.get("RESPONSE_COMPRESSION_LEVEL", 6))
+
+    # Request timing, SQL counters and /metrics; statements slower than
+    # SLOW_QUERY_MS are logged. The admin dashboard's toggle is stored in the
+    # database and reaches every worker within INSTRUMENTATION_SYNC_SECONDS.
+    # Workers on one host that share METRICS_DIR (gunicorn.conf.py sets it)
+    # serve combined metrics; without it each scrape shows a single worker
+    app.config["INSTRUMENTATION_ENABLED"] = os.environ.get("INSTRUMENTATION_ENABLED", "1").lower() in ("1", "true", "yes")
+    app.config["INSTRUMENTATION_SYNC_SECONDS"] = float(os.environ.get("INSTRUMENTATION_SYNC_SECONDS", 5))
+    app.config["METRICS_DIR"] = os.environ.get("METRICS_DIR")
+    app.config["SLOW_QUERY_MS"] = float(os.environ.get("SLOW_QUERY_MS", 200))
+    app.config["METRICS_TOKEN"] = os.environ.get("METRICS_TOKEN")
+
+    # Seconds between runs of the rental lifecycle jobs in `flask jobs worker`
+    # (the Procfile's worker process) and the dev server, where 0 disables them
+    app.config["JOBS_INTERVAL"] = int(os.environ.get("JOBS_INTERVAL", 300))
+
+    # Credentials used by `flask seed-admin`
+    app.config["ADMIN_USERNAME"] = os.environ.get("ADMIN_USERNAME", "admin")
+    app.config["ADMIN_EMAIL"] = os.environ.get("ADMIN_EMAIL", "admin@carrental.com")
+    app.config["ADMIN_PASSWORD"] = os.environ.get("ADMIN_PASSWORD", "admin123")
+
+
+def create_app(config=None):
+    """Build the application without touching the database.
+
+    Schema creation and the admin account are handled by the ``init-db``
+    and ``seed-admin`` CLI commands, so importing and booting a worker only
+    wires up configuration, extensions and routes. Engines connect lazily on
+    the first query, which keeps the app safe to preload before forking.
+    """
+    app = Flask(__name__)
+    app.wsgi_app = ProxyFix(app.wsgi_app, x_proto=1, x_host=1)  # needed for url_for to generate with https
+
+    configure(app)
+    if config:
+        app.config.update(config)
+
+    engine_options = app.config["SQLALCHEMY_ENGINE_OPTIONS"]
+    database_uri = app.config["SQLALCHEMY_DATABASE_URI"]
+    if database_uri.startswith("sqlite"):
+        # Let concurrent bookings wait for the write lock instead of failing fast
+        engine_options.setdefault("connect_args", {"timeout": 30})
+    # In-memory SQLite uses a single shared connection rather than a queue pool
+    if ":memory:" not in database_uri and database_uri not in ("sqlite://", "sqlite:///"):
+        engine_options.setdefault("pool_size", app.config["DB_POOL_SIZE"])
+        engine_options.setdefault("max_overflow", app.config["DB_MAX_OVERFLOW"])
+        engine_options.setdefault("pool_timeout", app.config["DB_POOL_TIMEOUT"])
+
+    if app.config["DATABASE_REPLICA_URLS"]:
+        app.config["SQLALCHEMY_BINDS"] = {
+            **app.config.get("SQLALCHEMY_BINDS", {}), **replica_binds(app.config["DATABASE_REPLICA_URLS"])
+        }
+
+    # Initialize the database and Flask-Login with the app
+    db.init_app(app)
+    app.after_request(remember_writes)
+    login_manager.init_app(app)
+    instrumentation.init_app(app)
+    assets.init_app(app)
+    password_hasher.init_app(app)
+
+    # Import models so their tables are registered on the metadata
+    import models  # noqa: F401
+
+    # Register routes and the JSON API
+    from routes import main
+    from api import api
+    from images import images
+    app.register_blueprint(main)
+    app.register_blueprint(api)
+    app.register_blueprint(images)
+
+    # CLI commands
+    from commands import init_db_command, seed_admin_command
+    from fleet_io import fleet_cli
+    from jobs import jobs_cli
+    from analytics import analytics_cli
+    from images import images_cli
+    from assets import assets_cli
+    from bulk import bulk_cli
+    app.cli.add_command(init_db_command)
+    app.cli.add_command(seed_admin_command)
+    app.cli.add_command(fleet_cli)
+    app.cli.add_command(jobs_cli)
+    app.cli.add_command(analytics_cli)
+    app.cli.add_command(images_cli)
+    app.cli.add_command(assets_cli)
+    app.cli.add_command(bulk_cli)
 
-# Import routes after app is created to avoid circular imports
-with app.app_context():
-    # Import models for table creation
-    from models import User, Car, CarModel, Rental
-    
-    # Create all tables in the database
-    db.create_all()
-    
-    # Create admin user if it doesn't exist
-    from werkzeug.security import generate_password_hash
-    admin = User.query.filter_by(username='admin').first()
-    if not admin:
-        admin = User(
-            username='admin',
-            email='admin@carrental.com',
-            password_hash=generate_password_hash('admin123'),
-            is_admin=True
-        )
-        db.session.add(admin)
-        db.session.commit()
-        logging.info("Admin user created")
-
-    # Import and register routes
-    import routes
\ No newline at end of file
+    return app
@@ -0,0 +1,201 @@
+import gzip
+import hashlib
+import json
+import mimetypes
+import os
+import re
+import shutil
+
+import click
+from flask import current_app, request, send_from_directory, url_for
+from flask.cli import AppGroup
+
+try:
+    import brotli
+except ImportError:  # pragma: no cover - gzip alone is served without it
+    brotli = None
+
+# Build output, relative to the static folder; everything in it is fingerprinted
+DIST_DIR = 'dist'
+MANIFEST = 'manifest.json'
+# Files worth precompressing
+COMPRESSIBLE_EXTENSIONS = ('.css', '.js', '.svg', '.json', '.txt', '.map')
+# Precompressed variants, in order of preference
+ENCODINGS = (('br', '.br'), ('gzip', '.gz'))
+# Fingerprinted files never change under the same name
+CACHE_MAX_AGE = 365 * 24 * 3600
+# Dynamic responses compressed on the fly, and the size below which it is not worth it
+COMPRESSIBLE_MIMETYPES = ('text/html', 'application/json')
+MIN_COMPRESS_SIZE = 500
+
+_CSS_STRING = r'"(?:\\.|[^"\\])*"|\'(?:\\.|[^\'\\])*\''
+_CSS_COMMENTS = re.compile(rf'({_CSS_STRING})|/\*.*?\*/', re.S)
+_CSS_STRINGS = re.compile(rf'({_CSS_STRING})')
+
+
+def _minify_css_code(code):
+    code = re.sub(r'\s+', ' ', code)
+    code = re.sub(r'\s*([{};,])\s*', r'\1', code)
+    # A space before ":" is significant in selectors, one after it never is
+    return re.sub(r':\s+', ':', code).replace(';}', '}')
+
+
+def minify_css(text):
+    # Drop comments, then collapse whitespace outside of strings
+    text = _CSS_COMMENTS.sub(lambda match: match.group(1) or '', text)
+    parts = _CSS_STRINGS.split(text)
+    return ''.join(part if index % 2 else _minify_css_code(part) for index, part in enumerate(parts)).strip()
+
+
+def minify_js(text):
+    """Strip indentation, blank lines and whole-line comments.
+
+    Line breaks are kept, so automatic semicolon insertion is unaffected,
+    and lines inside multi-line template literals are left alone.
+    """
+    lines = []
+    in_template = False
+    for line in text.splitlines():
+        stripped = line.strip()
+        if in_template:
+            lines.append(line)
+        elif stripped and not stripped.startswith('//'):
+            lines.append(stripped)
+        if len(re.findall(r'(?<!\\)`', line)) % 2:
+            in_template = not in_template
+    return '\n'.join(lines) + '\n'
+
+
+MINIFIERS = {'.css': minify_css, '.js': minify_js}
+
+
+def _fingerprinted_name(path, content):
+    root, ext = os.path.splitext(path)
+    return f'{root}.{hashlib.sha256(content).hexdigest()[:12]}{ext}'
+
+
+def build_assets(static_folder):
+    """Minify, fingerprint and precompress every file under ``static_folder``.
+
+    Output goes to ``static/dist`` (rebuilt from scratch) together with a
+    manifest mapping each source path to its fingerprinted path. Returns
+    the manifest.
+    """
+    dist = os.path.join(static_folder, DIST_DIR)
+    shutil.rmtree(dist, ignore_errors=True)
+    manifest = {}
+    for directory, subdirectories, filenames in os.walk(static_folder):
+        if os.path.abspath(directory) == os.path.abspath(static_folder):
+            subdirectories[:] = [name for name in subdirectories if name != DIST_DIR]
+        for filename in sorted(filenames):
+            source = os.path.relpath(os.path.join(directory, filename), static_folder).replace(os.sep, '/')
+            ext = os.path.splitext(filename)[1].lower()
+            with open(os.path.join(directory, filename), 'rb') as stream:
+                content = stream.read()
+            if ext in MINIFIERS:
+                content = MINIFIERS[ext](content.decode('utf-8')).encode('utf-8')
+
+            target = f'{DIST_DIR}/{_fingerprinted_name(source, content)}'
+            path = os.path.join(static_folder, target)
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            with open(path, 'wb') as stream:
+                stream.write(content)
+            if ext in COMPRESSIBLE_EXTENSIONS:
+                with open(path + '.gz', 'wb') as stream:
+                    stream.write(gzip.compress(content, 9, mtime=0))
+                if brotli is not None:
+                    with open(path + '.br', 'wb') as stream:
+                        stream.write(brotli.compress(content, quality=11))
+            manifest[source] = target
+
+    with open(os.path.join(dist, MANIFEST), 'w') as stream:
+        json.dump(manifest, stream, indent=2, sort_keys=True)
+    return manifest
+
+
+class Assets:
+    """Fingerprinted static URLs, precompressed static files and gzipped pages.
+
+    Without a built manifest (e.g. in development) ``asset_url`` falls back
+    to the plain static URL, so the build step is only needed for deploys.
+    """
+
+    def __init__(self, app=None):
+        self.manifest = {}
+        self.encodings = {}
+        self.compression_level = 0
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self.compression_level = app.config['RESPONSE_COMPRESSION_LEVEL']
+        self.load_manifest(app.static_folder)
+        app.extensions['assets'] = self
+
+        app.add_template_global(self.asset_url)
+        app.view_functions['static'] = self.send_static
+        app.after_request(self._compress_response)
+
+    def load_manifest(self, static_folder):
+        try:
+            with open(os.path.join(static_folder, DIST_DIR, MANIFEST)) as stream:
+                self.manifest = json.load(stream)
+        except FileNotFoundError:
+            self.manifest = {}
+        # Precompressed variants present on disk, per fingerprinted file
+        self.encodings = {
+            target: [(encoding, suffix) for encoding, suffix in ENCODINGS
+                     if os.path.exists(os.path.join(static_folder, target + suffix))]
+            for target in self.manifest.values()
+        }
+
+    def asset_url(self, filename):
+        return url_for('static', filename=self.manifest.get(filename, filename))
+
+    def send_static(self, filename):
+        if filename not in self.encodings:
+            return current_app.send_static_file(filename)
+        # Serve the best precompressed variant the client accepts
+        for encoding, suffix in self.encodings[filename]:
+            if request.accept_encodings[encoding]:
+                response = send_from_directory(
+                    current_app.static_folder, filename + suffix, max_age=CACHE_MAX_AGE,
+                    mimetype=mimetypes.guess_type(filename)[0] or 'application/octet-stream'
+                )
+                response.headers['Content-Encoding'] = encoding
+                break
+        else:
+            response = send_from_directory(current_app.static_folder, filename, max_age=CACHE_MAX_AGE)
+        if self.encodings[filename]:
+            response.vary.add('Accept-Encoding')
+        response.cache_control.public = True
+        response.cache_control.immutable = True
+        return response
+
+    def _compress_response(self, response):
+        if (not self.compression_level or response.direct_passthrough or response.is_streamed
+                or response.status_code in (204, 206, 304) or response.mimetype not in COMPRESSIBLE_MIMETYPES
+                or 'Content-Encoding' in response.headers):
+            return response
+        response.vary.add('Accept-Encoding')
+        data = response.get_data()
+        if not request.accept_encodings['gzip'] or len(data) < MIN_COMPRESS_SIZE:
+            return response
+
+        response.set_data(gzip.compress(data, self.compression_level, mtime=0))
+        response.headers['Content-Encoding'] = 'gzip'
+        # The compressed body is no longer byte-identical to the original
+        etag, weak = response.get_etag()
+        if etag and not weak:
+            response.set_etag(etag, weak=True)
+        return response
+
+
+assets_cli = AppGroup('assets', help='Static asset build.')
+
+
+@assets_cli.command('build')
+def build_command():
+    """Minify, fingerprint and precompress static files into static/dist."""
+    manifest = build_assets(current_app.static_folder)
+    click.echo(f"{len(manifest)} assets built{'' if brotli is not None else ' (gzip only; install brotli for .br)'}.")
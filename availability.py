@@ -0,0 +1,83 @@
+from datetime import date, datetime, time
+
+from sqlalchemy import and_, exists, select, true
+
+from app import db
+from models import CarModel, Rental
+
+# Rental statuses that hold a car model for their date range
+BLOCKING_STATUSES = ('pending', 'active')
+
+
+def as_datetime(value):
+    # Rental dates are stored as midnight datetimes; normalise form dates to match
+    if isinstance(value, datetime):
+        return value
+    if isinstance(value, date):
+        return datetime.combine(value, time.min)
+    return value
+
+
+def parse_date(value):
+    # Parse an ISO ``YYYY-MM-DD`` query-string value, ignoring bad input
+    try:
+        return date.fromisoformat(value) if value else None
+    except ValueError:
+        return None
+
+
+def blocking_overlap(start_date, end_date):
+    """Rentals that hold their model at any point in ``[start_date, end_date]``.
+
+    Both ranges are inclusive, so they overlap exactly when each one starts
+    on or before the other one ends. This single predicate replaces the
+    three-way OR and lets the (car_model_id, status, start_date, end_date)
+    index serve the lookup.
+    """
+    return and_(
+        Rental.status.in_(BLOCKING_STATUSES),
+        Rental.start_date <= as_datetime(end_date),
+        Rental.end_date >= as_datetime(start_date)
+    )
+
+
+def find_conflicts(model_id, start_date, end_date):
+    return Rental.query.filter(
+        Rental.car_model_id == model_id,
+        blocking_overlap(start_date, end_date)
+    ).all()
+
+
+def is_available(model_id, start_date, end_date):
+    return db.session.query(
+        select(CarModel.id).where(CarModel.id == model_id, free_between(start_date, end_date)).exists()
+    ).scalar()
+
+
+def unbooked_between(start_date, end_date):
+    # Filter clause for CarModel queries: no blocking rental overlaps the range
+    return ~exists().where(
+        Rental.car_model_id == CarModel.id,
+        blocking_overlap(start_date, end_date)
+    )
+
+
+def free_between(start_date, end_date):
+    # In service and not booked: bookable for the whole range
+    return and_(CarModel.in_service == true(), unbooked_between(start_date, end_date))
+
+
+def booked_model_ids(start_date, end_date, model_ids=None):
+    """Ids of models with a blocking rental in the range, in one query."""
+    query = select(Rental.car_model_id).where(blocking_overlap(start_date, end_date)).distinct()
+    if model_ids is not None:
+        query = query.where(Rental.car_model_id.in_(list(model_ids)))
+    return set(db.session.execute(query).scalars())
+
+
+def available_model_ids(start_date, end_date, model_ids=None):
+    """Ids of models that are free for the whole range, in one query."""
+    query = select(CarModel.id).where(free_between(start_date, end_date))
+    if model_ids is not None:
+        query = query.where(CarModel.id.in_(list(model_ids)))
+    return set(db.session.execute(query).scalars())
@@ -0,0 +1,110 @@
+"""Fire many parallel bookings at car_details and check for double bookings.
+
+Usage: python benchmarks/bench_booking.py [--bookings 400] [--threads 32]
+
+Every request targets one of a few car models with random, heavily
+overlapping date ranges, so most requests must be rejected. The run fails
+(exit code 1) if any two blocking rentals for a model overlap.
+"""
+import argparse
+import os
+import random
+import sys
+import tempfile
+import threading
+import time
+from datetime import date, timedelta
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+OVERLAP_SQL = """
+    SELECT COUNT(*) FROM rental a JOIN rental b
+      ON a.car_model_id = b.car_model_id AND a.id < b.id
+    WHERE a.status IN ('pending', 'active') AND b.status IN ('pending', 'active')
+      AND a.start_date <= b.end_date AND a.end_date >= b.start_date
+"""
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--bookings', type=int, default=400)
+    parser.add_argument('--threads', type=int, default=32)
+    parser.add_argument('--models', type=int, default=3)
+    return parser.parse_args()
+
+
+def main():
+    args = parse_args()
+    if 'DATABASE_URL' not in os.environ:
+        path = os.path.join(tempfile.mkdtemp(), 'bench_booking.db')
+        os.environ['DATABASE_URL'] = f'sqlite:///{path}'
+
+    from werkzeug.security import generate_password_hash
+    from app import create_app, db
+    from commands import init_db
+    from models import User, Car, CarModel
+
+    app = create_app({'WTF_CSRF_ENABLED': False})
+    with app.app_context():
+        init_db()
+        password_hash = generate_password_hash('bench-password')
+        db.session.add_all([
+            User(username=f'bench{i}', email=f'bench{i}@example.com', password_hash=password_hash)
+            for i in range(args.threads)
+        ])
+        car = Car(brand='Bench', year=2024)
+        db.session.add(car)
+        db.session.flush()
+        models = [CarModel(car_id=car.id, name=f'Model {i}', price_per_day=50) for i in range(args.models)]
+        db.session.add_all(models)
+        db.session.commit()
+        model_ids = [model.id for model in models]
+
+    per_thread = args.bookings // args.threads
+    results = {'confirmed': 0, 'rejected': 0, 'errors': 0}
+    lock = threading.Lock()
+    barrier = threading.Barrier(args.threads)
+
+    def worker(index):
+        rng = random.Random(index)
+        client = app.test_client()
+        client.post('/login', data={'username': f'bench{index}', 'password': 'bench-password'})
+        barrier.wait()
+        for _ in range(per_thread):
+            start = date(2030, 1, 1) + timedelta(days=rng.randint(0, 60))
+            end = start + timedelta(days=rng.randint(0, 6))
+            response = client.post(f'/user/car/{rng.choice(model_ids)}', data={
+                'car_model_id': 0,
+                'start_date': start.isoformat(),
+                'end_date': end.isoformat(),
+            })
+            with lock:
+                if response.status_code == 302:
+                    results['confirmed'] += 1
+                elif response.status_code == 200:
+                    results['rejected'] += 1
+                else:
+                    results['errors'] += 1
+
+    threads = [threading.Thread(target=worker, args=(i,)) for i in range(args.threads)]
+    started = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - started
+
+    with app.app_context():
+        overlaps = db.session.execute(db.text(OVERLAP_SQL)).scalar()
+
+    total = per_thread * args.threads
+    print(f'{total} booking attempts from {args.threads} threads in {elapsed:.2f}s '
+          f'({total / elapsed:.1f} req/s)')
+    print(f"confirmed={results['confirmed']} rejected={results['rejected']} errors={results['errors']}")
+    print(f'overlapping bookings: {overlaps}')
+    sys.exit(1 if overlaps or results['errors'] else 0)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,165 @@
+"""Compare gunicorn serving modes under simulated database latency.
+
+Usage:
+    python benchmarks/bench_concurrency.py [--latency-ms 25]
+        [--modes sync:4,gthread:4x8,gevent:4x32] [--clients 4,16,64]
+        [--requests 400] [--database-url postgresql://localhost/bench] [--reset]
+
+Seeds the same synthetic fleet as bench_routes.py, then starts gunicorn
+once per mode through gunicorn.conf.py (configured with the same
+environment variables a deployment would use) and drives the car details
+page with an increasing number of concurrent clients. Every SQL statement
+first sleeps for --latency-ms, standing in for the network round trip to a
+remote database; under gevent the sleep yields like a patched driver would.
+
+Modes are ``sync:WORKERS``, ``gthread:WORKERSxTHREADS`` and
+``gevent:WORKERSxCONNECTIONS``. Modes whose worker class is not installed
+are skipped.
+"""
+import argparse
+import importlib.util
+import os
+import random
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+
+BENCHMARKS = os.path.dirname(os.path.abspath(__file__))
+ROOT = os.path.dirname(BENCHMARKS)
+sys.path.insert(0, ROOT)
+sys.path.insert(0, BENCHMARKS)
+
+from bench_routes import HttpSession, free_port, prepare_database, summarise  # noqa: E402
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--latency-ms', type=float, default=25.0, help='simulated delay per SQL statement')
+    parser.add_argument('--modes', default='sync:4,gthread:4x8,gevent:4x32')
+    parser.add_argument('--clients', default='4,16,64', help='concurrent client counts to try')
+    parser.add_argument('--requests', type=int, default=400, help='requests per client count')
+    parser.add_argument('--cars', type=int, default=50)
+    parser.add_argument('--models-per-car', type=int, default=4)
+    parser.add_argument('--users', type=int, default=65)
+    parser.add_argument('--rentals', type=int, default=500)
+    parser.add_argument('--database-url', help='defaults to a temporary SQLite file')
+    parser.add_argument('--reset', action='store_true', help='drop existing tables before seeding')
+    return parser.parse_args()
+
+
+def create_latency_app():
+    """App factory gunicorn loads instead of ``app:create_app()``."""
+    from sqlalchemy import event
+    from sqlalchemy.engine import Engine
+    from app import create_app
+
+    delay = float(os.environ['BENCH_DB_LATENCY_MS']) / 1000
+
+    def wait(*args):
+        # Resolved at call time so gevent's patched sleep is used
+        time.sleep(delay)
+
+    event.listen(Engine, 'before_cursor_execute', wait)
+    return create_app()
+
+
+def parse_mode(spec):
+    worker_class, _, size = spec.partition(':')
+    workers, _, per_worker = size.partition('x')
+    env = {'GUNICORN_WORKER_CLASS': worker_class, 'WEB_CONCURRENCY': workers}
+    if worker_class == 'gthread':
+        env['GUNICORN_THREADS'] = per_worker
+    elif worker_class == 'gevent':
+        env['GUNICORN_WORKER_CONNECTIONS'] = per_worker
+    return env
+
+
+def start_gunicorn(args, mode_env):
+    port = free_port()
+    env = dict(
+        os.environ, **mode_env, DATABASE_URL=args.database_url, BENCH_DB_LATENCY_MS=str(args.latency_ms),
+        INSTRUMENTATION_ENABLED='0', JOBS_INTERVAL='0', LOG_LEVEL='WARNING',
+        PYTHONPATH=os.pathsep.join([ROOT, BENCHMARKS]),
+    )
+    process = subprocess.Popen(
+        [sys.executable, '-m', 'gunicorn', '-c', 'gunicorn.conf.py', '--bind', f'127.0.0.1:{port}',
+         '--log-level', 'warning', 'bench_concurrency:create_latency_app()'],
+        cwd=ROOT, env=env
+    )
+    base_url = f'http://127.0.0.1:{port}'
+    deadline = time.monotonic() + 30
+    while time.monotonic() < deadline:
+        try:
+            urllib.request.urlopen(base_url + '/login', timeout=1).close()
+            return process, base_url
+        except OSError:
+            time.sleep(0.2)
+    process.terminate()
+    sys.exit('gunicorn did not start within 30 seconds')
+
+
+def login_sessions(base_url, count, users):
+    sessions = []
+    for client in range(count):
+        session = HttpSession(base_url)
+        session.login(f'bench{client % max(1, users - 1) + 1}')
+        sessions.append(session)
+    return sessions
+
+
+def drive(sessions, clients, requests, n_models):
+    def run(client):
+        session, rng = sessions[client], random.Random(client)
+        samples = []
+        for _ in range(client, requests, clients):
+            started = time.perf_counter()
+            status, _, _ = session.open('GET', f'/user/car/{rng.randint(1, n_models)}')
+            samples.append(((time.perf_counter() - started) * 1000, status >= 400))
+        return samples
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(clients) as pool:
+        samples = [sample for chunk in pool.map(run, range(clients)) for sample in chunk]
+    return summarise([latency for latency, _ in samples], [], time.perf_counter() - started,
+                     sum(1 for _, error in samples if error))
+
+
+def main():
+    args = parse_args()
+    workdir = None
+    if not args.database_url:
+        workdir = tempfile.mkdtemp()
+        args.database_url = f"sqlite:///{os.path.join(workdir, 'bench_concurrency.db')}"
+    os.environ['DATABASE_URL'] = args.database_url
+    client_counts = [int(count) for count in args.clients.split(',')]
+
+    try:
+        n_models = prepare_database(args)
+        print(f'Simulated latency: {args.latency_ms:g} ms per SQL statement\n')
+        print(f"{'mode':<18}{'clients':>8}{'p50 ms':>9}{'p95 ms':>9}{'req/s':>9}{'errors':>8}")
+        for spec in args.modes.split(','):
+            mode_env = parse_mode(spec)
+            if mode_env['GUNICORN_WORKER_CLASS'] == 'gevent' and importlib.util.find_spec('gevent') is None:
+                print(f'{spec:<18}skipped: gevent is not installed')
+                continue
+            process, base_url = start_gunicorn(args, mode_env)
+            try:
+                sessions = login_sessions(base_url, max(client_counts), args.users)
+                for clients in client_counts:
+                    row = drive(sessions, clients, args.requests, n_models)
+                    print(f"{spec:<18}{clients:>8}{row['p50_ms']:>9.1f}{row['p95_ms']:>9.1f}"
+                          f"{row['throughput_rps']:>9.1f}{row['errors']:>8}")
+            finally:
+                process.terminate()
+                process.wait(timeout=30)
+    finally:
+        if workdir:
+            shutil.rmtree(workdir, ignore_errors=True)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,115 @@
+"""Measure login throughput per core for password hash settings.
+
+Usage:
+    python benchmarks/bench_login.py
+        [--methods pbkdf2:sha256:600000,pbkdf2:sha256:260000,scrypt:32768:8:1]
+        [--clients 1,4,16] [--logins 64] [--hash-workers N] [--hash-queue 8]
+
+Seeds one user per client into a throwaway SQLite database, hashed with
+each method in turn, then signs in from a growing number of concurrent
+test clients. Hashing runs on the app's bounded pool (PASSWORD_HASH_WORKERS
+threads, PASSWORD_HASH_QUEUE waiting), so past saturation extra sign-ins
+are shed with 503 rather than queued; the "shed" column counts them.
+"""
+import argparse
+import os
+import shutil
+import sys
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+BENCHMARKS = os.path.dirname(os.path.abspath(__file__))
+ROOT = os.path.dirname(BENCHMARKS)
+sys.path.insert(0, ROOT)
+sys.path.insert(0, BENCHMARKS)
+
+from bench_routes import summarise  # noqa: E402
+
+PASSWORD = 'bench-password'
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--methods', default='pbkdf2:sha256:600000,pbkdf2:sha256:260000,scrypt:32768:8:1')
+    parser.add_argument('--clients', default='1,4,16', help='concurrent client counts to try')
+    parser.add_argument('--logins', type=int, default=64, help='sign-ins per client count')
+    parser.add_argument('--hash-workers', type=int, default=os.cpu_count() or 1)
+    parser.add_argument('--hash-queue', type=int, default=8)
+    return parser.parse_args()
+
+
+def build_app(args, method, database_url, users):
+    from werkzeug.security import generate_password_hash
+    from app import create_app, db
+    from commands import init_db
+    from models import User
+
+    app = create_app({
+        'SQLALCHEMY_DATABASE_URI': database_url,
+        'WTF_CSRF_ENABLED': False,
+        'INSTRUMENTATION_ENABLED': False,
+        'PASSWORD_HASH_METHOD': method,
+        'PASSWORD_HASH_WORKERS': args.hash_workers,
+        'PASSWORD_HASH_QUEUE': args.hash_queue,
+    })
+    with app.app_context():
+        db.drop_all()
+        init_db()
+        # Every user shares one hash; verifying it costs the same either way
+        password_hash = generate_password_hash(PASSWORD, method)
+        db.session.add_all([
+            User(username=f'bench{i}', email=f'bench{i}@example.com', password_hash=password_hash)
+            for i in range(users)
+        ])
+        db.session.commit()
+    return app
+
+
+def drive(app, clients, logins):
+    def run(client):
+        samples = []
+        for _ in range(client, logins, clients):
+            # A fresh client per sign-in, so every request really logs in
+            test_client = app.test_client()
+            started = time.perf_counter()
+            response = test_client.post('/login', data={'username': f'bench{client}', 'password': PASSWORD})
+            samples.append(((time.perf_counter() - started) * 1000, response.status_code))
+        return samples
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(clients) as pool:
+        samples = [sample for chunk in pool.map(run, range(clients)) for sample in chunk]
+    wall_seconds = time.perf_counter() - started
+    succeeded = [latency for latency, status in samples if status == 302]
+    shed = sum(1 for _, status in samples if status == 503)
+    errors = len(samples) - len(succeeded) - shed
+    row = summarise(succeeded or [0.0], [], wall_seconds, errors)
+    row['throughput_rps'] = round(len(succeeded) / wall_seconds, 1)
+    row['shed'] = shed
+    return row
+
+
+def main():
+    args = parse_args()
+    client_counts = [int(count) for count in args.clients.split(',')]
+    cores = os.cpu_count() or 1
+    workdir = tempfile.mkdtemp()
+    database_url = f"sqlite:///{os.path.join(workdir, 'bench_login.db')}"
+    try:
+        print(f'{cores} cores, {args.hash_workers} hash workers, queue {args.hash_queue}\n')
+        print(f"{'method':<24}{'clients':>8}{'p50 ms':>9}{'p95 ms':>9}{'logins/s':>10}"
+              f"{'per core':>10}{'shed':>6}{'errors':>8}")
+        for method in args.methods.split(','):
+            app = build_app(args, method, database_url, max(client_counts))
+            for clients in client_counts:
+                row = drive(app, clients, args.logins)
+                print(f"{method:<24}{clients:>8}{row['p50_ms']:>9.1f}{row['p95_ms']:>9.1f}"
+                      f"{row['throughput_rps']:>10.1f}{row['throughput_rps'] / cores:>10.1f}"
+                      f"{row['shed']:>6}{row['errors']:>8}")
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+
+if __name__ == '__main__':
+    main()
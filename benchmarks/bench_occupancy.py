@@ -0,0 +1,108 @@
+"""Compare date-range availability: occupancy bitmaps vs. the NOT EXISTS query.
+
+Usage: python benchmarks/bench_occupancy.py [--models 5000] [--rentals 50000] [--repeat 50]
+
+Seeds a throwaway SQLite database (or DATABASE_URL if set) with a synthetic
+fleet and bookings spread over the coming year, builds the occupancy index
+and times "which models are free for these days" both ways for ranges of
+increasing length, together with the index's build time and size. The range
+check itself is one OR per day (microseconds); turning the result into a set
+of thousands of model ids is most of what the bitmap columns measure.
+"""
+import argparse
+import os
+import random
+import statistics
+import sys
+import tempfile
+import time
+from datetime import date, datetime, timedelta
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+RANGE_DAYS = (1, 7, 30, 90)
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--models', type=int, default=5000)
+    parser.add_argument('--rentals', type=int, default=50_000)
+    parser.add_argument('--repeat', type=int, default=50)
+    return parser.parse_args()
+
+
+def seed(db, n_models, n_rentals):
+    from sqlalchemy import insert
+    from models import Car, CarModel, Rental, User
+
+    rng = random.Random(42)
+    today = datetime.combine(date.today(), datetime.min.time())
+    db.session.execute(insert(User), [{'id': 1, 'username': 'bench', 'email': 'bench@example.com',
+                                       'password_hash': 'x'}])
+    db.session.execute(insert(Car), [{'id': 1, 'brand': 'Bench', 'year': 2024}])
+    db.session.execute(insert(CarModel), [{
+        'id': i + 1, 'car_id': 1, 'name': f'Model {i}', 'price_per_day': 50,
+        'in_service': rng.random() < 0.95, 'updated_at': today,
+    } for i in range(n_models)])
+    rentals = []
+    for _ in range(n_rentals):
+        start = today + timedelta(days=rng.randint(-30, 365))
+        rentals.append({
+            'user_id': 1, 'car_model_id': rng.randint(1, n_models), 'start_date': start,
+            'end_date': start + timedelta(days=rng.randint(0, 10)), 'total_price': 50,
+            'status': rng.choice(['active', 'pending', 'cancelled', 'completed']), 'updated_at': today,
+        })
+    db.session.execute(insert(Rental), rentals)
+    db.session.commit()
+
+
+def timed(fn, repeat):
+    samples = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        samples.append((time.perf_counter() - start) * 1_000_000)
+    return statistics.median(samples)
+
+
+def main():
+    args = parse_args()
+    if 'DATABASE_URL' not in os.environ:
+        path = os.path.join(tempfile.mkdtemp(), 'bench_occupancy.db')
+        os.environ['DATABASE_URL'] = f'sqlite:///{path}'
+
+    from app import create_app, db
+    from availability import available_model_ids
+    from commands import init_db
+    from occupancy import OccupancyIndex
+
+    app = create_app({'INSTRUMENTATION_ENABLED': False})
+    with app.app_context():
+        db.drop_all()
+        init_db()
+        print(f'Seeding {args.models} car models and {args.rentals} rentals...')
+        seed(db, args.models, args.rentals)
+
+        index = OccupancyIndex(app.config['OCCUPANCY_HORIZON_DAYS'])
+        started = time.perf_counter()
+        index.rebuild()
+        stats = index.stats()
+        print(f"Index built in {(time.perf_counter() - started) * 1000:.0f} ms, "
+              f"{stats['bitmap_bytes'] / 1024:.0f} KB of bitmaps for {stats['models']} models\n")
+
+        start = date.today() + timedelta(days=14)
+        # The dashboard filters on the booked ids, the JSON API on the free ones
+        print(f"{'days':>6}{'SQL us':>12}{'free us':>10}{'booked us':>11}{'speedup':>10}{'free':>8}")
+        for days in RANGE_DAYS:
+            end = start + timedelta(days=days - 1)
+            free = index.free_model_ids(start, end)
+            assert free == available_model_ids(start, end), 'index and SQL disagree'
+            sql = timed(lambda: available_model_ids(start, end), args.repeat)
+            bitmap = timed(lambda: index.free_model_ids(start, end), args.repeat)
+            booked = timed(lambda: index.booked_model_ids(start, end), args.repeat)
+            print(f'{days:>6}{sql:>12.0f}{bitmap:>10.0f}{booked:>11.0f}{sql / bitmap:>9.1f}x{len(free):>8}')
+
+
+if __name__ == '__main__':
+    main()
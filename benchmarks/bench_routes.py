@@ -0,0 +1,483 @@
+"""Load-test the main routes in-process and against a multi-worker gunicorn.
+
+Usage:
+    python benchmarks/bench_routes.py [--driver client|gunicorn|both]
+        [--cars 200] [--models-per-car 5] [--users 50] [--rentals 2000]
+        [--requests 200] [--workers 4] [--concurrency 8]
+        [--database-url postgresql://localhost/bench] [--reset]
+        [--save-baseline FILE] [--compare FILE] [--tolerance 0.5] [--min-delta-ms 5]
+
+Seeds a synthetic fleet into a throwaway SQLite database (or the database
+given with --database-url, e.g. a local PostgreSQL), then drives each
+scenario and reports p50/p95/p99 latency, throughput and SQL queries per
+request. Query counts come from the Server-Timing header added by the
+instrumentation middleware, so they are exact for both drivers.
+
+--save-baseline writes the results as JSON; --compare checks them against
+a saved baseline and exits non-zero when p95 latency grows by more than
+--tolerance or any scenario issues more queries than before. Latency
+baselines are machine specific: regenerate them on the machine that
+compares against them.
+"""
+import argparse
+import http.cookiejar
+import json
+import os
+import random
+import re
+import shutil
+import socket
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import urllib.error
+import urllib.parse
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+BRANDS = ['Toyota', 'Honda', 'Ford', 'Tesla', 'BMW', 'Audi', 'Kia', 'Hyundai', 'Volvo', 'Mazda']
+NAMES = ['Corolla', 'Civic', 'Focus', 'Model 3', 'X5', 'A4', 'Sportage', 'Tucson', 'XC90', 'CX-5']
+WORDS = ['comfortable', 'family', 'sedan', 'compact', 'luxury', 'efficient', 'spacious', 'sporty', 'reliable']
+SEARCH_TERMS = ['toyota', 'civic', 'electric', 'luxury sedan', 'automatic', 'model 3', 'hybrid']
+PASSWORD = 'bench-password'
+
+CSRF_PATTERN = re.compile(r'name="csrf_token" type="hidden" value="([^"]+)"')
+QUERIES_PATTERN = re.compile(r'desc="(\d+) queries"')
+
+# Bookings start far beyond any seeded rental so they never conflict
+BOOKING_EPOCH = datetime(2040, 1, 1)
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--driver', choices=['client', 'gunicorn', 'both'], default='client')
+    parser.add_argument('--cars', type=int, default=200)
+    parser.add_argument('--models-per-car', type=int, default=5)
+    parser.add_argument('--users', type=int, default=50)
+    parser.add_argument('--rentals', type=int, default=2000)
+    parser.add_argument('--requests', type=int, default=200, help='requests per scenario')
+    parser.add_argument('--warmup', type=int, default=20, help='unrecorded GETs before each scenario')
+    parser.add_argument('--workers', type=int, default=4, help='gunicorn workers')
+    parser.add_argument('--concurrency', type=int, default=8, help='concurrent gunicorn clients')
+    parser.add_argument('--database-url', help='defaults to a temporary SQLite file')
+    parser.add_argument('--reset', action='store_true', help='drop existing tables before seeding')
+    parser.add_argument('--save-baseline', metavar='FILE')
+    parser.add_argument('--compare', metavar='FILE')
+    parser.add_argument('--tolerance', type=float, default=0.5)
+    parser.add_argument('--min-delta-ms', type=float, default=5.0,
+                        help='ignore p95 changes smaller than this')
+    return parser.parse_args()
+
+
+# Seeding
+
+def seed(db, args):
+    from sqlalchemy import insert
+    from werkzeug.security import generate_password_hash
+    from models import Car, CarModel, Rental, User
+
+    rng = random.Random(42)
+    now = datetime.utcnow()
+    # Hashing is deliberately slow, so every bench user shares one hash
+    password_hash = generate_password_hash(PASSWORD)
+
+    users = [{
+        'id': i + 1,
+        'username': f'bench{i}',
+        'email': f'bench{i}@example.com',
+        'password_hash': password_hash,
+        'is_admin': i == 0,
+        'date_joined': now,
+    } for i in range(args.users)]
+    cars = [{
+        'id': i + 1,
+        'brand': rng.choice(BRANDS),
+        'year': rng.randint(2005, 2024),
+        'description': ' '.join(rng.sample(WORDS, 4)),
+        'is_available': True,
+        'created_at': now - timedelta(minutes=i),
+        'updated_at': now,
+    } for i in range(args.cars)]
+    n_models = args.cars * args.models_per_car
+    models = [{
+        'id': i + 1,
+        'car_id': i % args.cars + 1,
+        'name': f'{rng.choice(NAMES)} {i}',
+        'price_per_day': rng.randint(20, 300),
+        'mileage': rng.randint(1000, 150_000),
+        'fuel_type': rng.choice(['Petrol', 'Diesel', 'Electric', 'Hybrid']),
+        'transmission': rng.choice(['Manual', 'Automatic']),
+        'seats': rng.choice([2, 4, 5, 7]),
+        'air_conditioning': rng.random() < 0.8,
+        'is_available': True,
+        'created_at': now - timedelta(minutes=i),
+        'updated_at': now,
+    } for i in range(n_models)]
+    rentals = []
+    for i in range(args.rentals):
+        start = now + timedelta(days=rng.randint(-365, 365))
+        end = start + timedelta(days=rng.randint(1, 14))
+        rentals.append({
+            'user_id': rng.randint(1, args.users),
+            'car_model_id': rng.randint(1, n_models),
+            'start_date': start,
+            'end_date': end,
+            'total_price': ((end - start).days + 1) * 50.0,
+            'status': 'completed' if end < now else rng.choice(['active', 'active', 'cancelled']),
+            'created_at': now - timedelta(seconds=i),
+            'updated_at': now,
+        })
+
+    for model, rows in ((User, users), (Car, cars), (CarModel, models), (Rental, rentals)):
+        if rows:
+            db.session.execute(insert(model), rows)
+    db.session.commit()
+    return n_models
+
+
+def prepare_database(args):
+    from app import create_app, db
+    from commands import init_db
+    from models import Car
+
+    app = create_app({'SQLALCHEMY_DATABASE_URI': args.database_url})
+    with app.app_context():
+        if args.reset:
+            db.drop_all()
+        init_db()
+        if db.session.query(Car.id).first() is not None:
+            sys.exit('The benchmark database is not empty; pass --reset to drop its tables first.')
+        print(f'Seeding {args.users} users, {args.cars} cars, '
+              f'{args.cars * args.models_per_car} models, {args.rentals} rentals...')
+        n_models = seed(db, args)
+        if db.engine.dialect.name == 'postgresql':
+            # Explicit ids leave sequences behind; move them past the seed data
+            for table in ('user', 'car', 'car_model', 'rental'):
+                db.session.execute(db.text(
+                    f"SELECT setval(pg_get_serial_sequence('\"{table}\"', 'id'), "
+                    f"COALESCE((SELECT MAX(id) FROM \"{table}\"), 1))"
+                ))
+            db.session.commit()
+    return n_models
+
+
+# Scenarios
+
+def scenarios(n_models, offset=0):
+    """(name, needs_admin, request factory) for every benchmarked route.
+
+    A request factory takes ``(rng, iteration)`` and returns
+    ``(method, path, form, csrf_path)``; POSTs fetch a CSRF token from
+    ``csrf_path`` first, like a browser submitting the rendered form.
+    Drivers sharing a database pass distinct ``offset``s to their bookings.
+    """
+    def get(path):
+        return lambda rng, i: ('GET', path(rng, i) if callable(path) else path, None, None)
+
+    def book(rng, i):
+        # A fresh model and week per iteration, so bookings never conflict
+        # and the model page still renders its booking form
+        i += offset
+        model_id = i % n_models + 1
+        start = BOOKING_EPOCH + timedelta(days=7 * i)
+        form = {
+            'car_model_id': model_id,
+            'start_date': start.strftime('%Y-%m-%d'),
+            'end_date': (start + timedelta(days=3)).strftime('%Y-%m-%d'),
+        }
+        path = f'/user/car/{model_id}'
+        return 'POST', path, form, path
+
+    return [
+        ('home', False, get('/')),
+        ('search', False, get(lambda rng, i: '/user/search?' + urllib.parse.urlencode(
+            {'query': rng.choice(SEARCH_TERMS)}))),
+        ('user_dashboard', False, get('/user/dashboard')),
+        ('car_details', False, get(lambda rng, i: f'/user/car/{rng.randint(1, n_models)}')),
+        ('car_details_book', False, book),
+        ('my_rentals', False, get('/user/my_rentals')),
+        ('admin_dashboard', True, get('/admin/dashboard')),
+    ]
+
+
+def csrf_token(page):
+    # A page without the form yields no token, and the POST then fails visibly
+    match = CSRF_PATTERN.search(page)
+    return match.group(1) if match else ''
+
+
+def failed(method, status):
+    # Successful form posts redirect (post/redirect/get); a 200 is a re-rendered form
+    return status >= 400 or (method == 'POST' and status != 302)
+
+
+def queries_from(server_timing):
+    match = QUERIES_PATTERN.search(server_timing or '')
+    return int(match.group(1)) if match else None
+
+
+def summarise(latencies, queries, wall_seconds, errors):
+    latencies = sorted(latencies)
+    cuts = statistics.quantiles(latencies, n=100, method='inclusive') if len(latencies) > 1 else latencies * 99
+    return {
+        'requests': len(latencies),
+        'errors': errors,
+        'p50_ms': round(cuts[49], 3),
+        'p95_ms': round(cuts[94], 3),
+        'p99_ms': round(cuts[98], 3),
+        'throughput_rps': round(len(latencies) / wall_seconds, 1) if wall_seconds else 0.0,
+        'queries_per_request': round(statistics.mean(queries), 2) if queries else None,
+    }
+
+
+# Flask test client driver
+
+def run_client(args, n_models):
+    from app import create_app
+
+    app = create_app({
+        'SQLALCHEMY_DATABASE_URI': args.database_url,
+        'INSTRUMENTATION_ENABLED': True,
+        'SLOW_QUERY_MS': 0,
+    })
+
+    def login(username):
+        client = app.test_client()
+        token = csrf_token(client.get('/login').get_data(as_text=True))
+        client.post('/login', data={'username': username, 'password': PASSWORD, 'csrf_token': token})
+        return client
+
+    clients = {False: login('bench1' if args.users > 1 else 'bench0'), True: login('bench0')}
+    results = {}
+    for name, needs_admin, factory in scenarios(n_models):
+        client = clients[needs_admin]
+        rng = random.Random(name)
+        latencies, queries, errors = [], [], 0
+        # Warm caches and connections; bookings are never replayed
+        for i in range(args.warmup):
+            method, path, form, _ = factory(rng, i)
+            if form is None:
+                client.open(path, method=method)
+        started = time.perf_counter()
+        for i in range(args.requests):
+            method, path, form, csrf_path = factory(rng, i)
+            if form is not None:
+                page = client.get(csrf_path).get_data(as_text=True)
+                form = dict(form, csrf_token=csrf_token(page))
+            request_started = time.perf_counter()
+            response = client.open(path, method=method, data=form)
+            latencies.append((time.perf_counter() - request_started) * 1000)
+            if failed(method, response.status_code):
+                errors += 1
+            count = queries_from(response.headers.get('Server-Timing'))
+            if count is not None:
+                queries.append(count)
+        results[name] = summarise(latencies, queries, time.perf_counter() - started, errors)
+    return results
+
+
+# gunicorn driver
+
+class NoRedirect(urllib.request.HTTPRedirectHandler):
+    # Report redirects as responses, like the test client does
+    def redirect_request(self, *args, **kwargs):
+        return None
+
+
+class HttpSession:
+    def __init__(self, base_url):
+        self.base_url = base_url
+        self.opener = urllib.request.build_opener(
+            urllib.request.HTTPCookieProcessor(http.cookiejar.CookieJar()), NoRedirect()
+        )
+
+    def open(self, method, path, form=None):
+        data = urllib.parse.urlencode(form).encode() if form is not None else None
+        request = urllib.request.Request(self.base_url + path, data=data, method=method)
+        try:
+            with self.opener.open(request, timeout=60) as response:
+                return response.status, response.headers, response.read().decode()
+        except urllib.error.HTTPError as error:
+            return error.code, error.headers, error.read().decode()
+
+    def csrf_token(self, path):
+        return csrf_token(self.open('GET', path)[2])
+
+    def login(self, username):
+        self.open('POST', '/login', {'username': username, 'password': PASSWORD,
+                                     'csrf_token': self.csrf_token('/login')})
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+def start_gunicorn(args):
+    port = free_port()
+    env = dict(
+        os.environ, DATABASE_URL=args.database_url, INSTRUMENTATION_ENABLED='1',
+        SLOW_QUERY_MS='0', LOG_LEVEL='WARNING'
+    )
+    process = subprocess.Popen(
+        [sys.executable, '-m', 'gunicorn', '-c', 'gunicorn.conf.py',
+         '--workers', str(args.workers), '--bind', f'127.0.0.1:{port}', '--log-level', 'warning'],
+        cwd=ROOT, env=env
+    )
+    base_url = f'http://127.0.0.1:{port}'
+    deadline = time.monotonic() + 30
+    while time.monotonic() < deadline:
+        try:
+            urllib.request.urlopen(base_url + '/login', timeout=1).close()
+            return process, base_url
+        except OSError:
+            time.sleep(0.2)
+    process.terminate()
+    sys.exit('gunicorn did not start within 30 seconds')
+
+
+def run_gunicorn(args, n_models):
+    process, base_url = start_gunicorn(args)
+    try:
+        sessions = {}
+        for needs_admin in (False, True):
+            sessions[needs_admin] = []
+            for worker in range(args.concurrency):
+                session = HttpSession(base_url)
+                session.login('bench0' if needs_admin else f'bench{worker % max(1, args.users - 1) + 1}')
+                sessions[needs_admin].append(session)
+
+        results = {}
+        for name, needs_admin, factory in scenarios(n_models, offset=args.requests):
+            def drive(worker):
+                session = sessions[needs_admin][worker]
+                rng = random.Random(f'{name}-{worker}')
+                samples = []
+                for i in range(-(-args.warmup // args.concurrency)):
+                    method, path, form, _ = factory(rng, i)
+                    if form is None:
+                        session.open(method, path)
+                # Workers interleave iteration numbers so booking weeks stay unique
+                for i in range(worker, args.requests, args.concurrency):
+                    method, path, form, csrf_path = factory(rng, i)
+                    if form is not None:
+                        form = dict(form, csrf_token=session.csrf_token(csrf_path))
+                    request_started = time.perf_counter()
+                    status, headers, _ = session.open(method, path, form)
+                    samples.append((
+                        (time.perf_counter() - request_started) * 1000,
+                        queries_from(headers.get('Server-Timing')),
+                        failed(method, status),
+                    ))
+                return samples
+
+            started = time.perf_counter()
+            with ThreadPoolExecutor(args.concurrency) as pool:
+                samples = [sample for chunk in pool.map(drive, range(args.concurrency)) for sample in chunk]
+            wall = time.perf_counter() - started
+            results[name] = summarise(
+                [latency for latency, _, _ in samples],
+                [count for _, count, _ in samples if count is not None],
+                wall,
+                sum(1 for _, _, error in samples if error)
+            )
+        return results
+    finally:
+        process.terminate()
+        process.wait(timeout=30)
+
+
+# Reporting and baselines
+
+def report(driver, results, baseline=None):
+    print(f'\n[{driver}]')
+    print(f"{'scenario':<18}{'p50 ms':>9}{'p95 ms':>9}{'p99 ms':>9}{'req/s':>9}{'queries':>9}{'errors':>8}"
+          + (f"{'p95 vs base':>13}" if baseline else ''))
+    for name, row in results.items():
+        line = (f"{name:<18}{row['p50_ms']:>9.2f}{row['p95_ms']:>9.2f}{row['p99_ms']:>9.2f}"
+                f"{row['throughput_rps']:>9.1f}{row['queries_per_request'] or 0:>9.2f}{row['errors']:>8}")
+        base = (baseline or {}).get(name)
+        if base:
+            line += f"{(row['p95_ms'] / base['p95_ms'] - 1) * 100:>+12.0f}%"
+        print(line)
+
+
+def regressions(results, baseline, tolerance, min_delta_ms):
+    problems = []
+    for driver, scenarios_ in results.items():
+        for name, row in scenarios_.items():
+            base = baseline.get(driver, {}).get(name)
+            if not base:
+                continue
+            # Small absolute changes on fast routes are scheduling jitter
+            if (row['p95_ms'] > base['p95_ms'] * (1 + tolerance)
+                    and row['p95_ms'] - base['p95_ms'] > min_delta_ms):
+                problems.append(f"{driver}/{name}: p95 {base['p95_ms']:.2f} -> {row['p95_ms']:.2f} ms")
+            if (base['queries_per_request'] is not None and row['queries_per_request'] is not None
+                    and row['queries_per_request'] > base['queries_per_request'] + 0.5):
+                problems.append(f"{driver}/{name}: queries/request "
+                                f"{base['queries_per_request']} -> {row['queries_per_request']}")
+            if row['errors'] > base['errors']:
+                problems.append(f"{driver}/{name}: errors {base['errors']} -> {row['errors']}")
+    return problems
+
+
+def main():
+    args = parse_args()
+    workdir = None
+    if not args.database_url:
+        workdir = tempfile.mkdtemp()
+        args.database_url = f"sqlite:///{os.path.join(workdir, 'bench_routes.db')}"
+    os.environ['DATABASE_URL'] = args.database_url
+
+    params = {key: getattr(args, key) for key in (
+        'cars', 'models_per_car', 'users', 'rentals', 'requests', 'workers', 'concurrency')}
+    params['database'] = args.database_url.split(':', 1)[0]
+
+    baseline = None
+    if args.compare:
+        with open(args.compare) as stream:
+            saved = json.load(stream)
+        baseline = saved['results']
+        if saved['params'] != params:
+            print(f"Warning: baseline was recorded with {saved['params']}")
+
+    try:
+        n_models = prepare_database(args)
+        results = {}
+        if args.driver in ('client', 'both'):
+            results['client'] = run_client(args, n_models)
+            report('client', results['client'], (baseline or {}).get('client'))
+        if args.driver in ('gunicorn', 'both'):
+            results['gunicorn'] = run_gunicorn(args, n_models)
+            report(f'gunicorn x{args.workers}, {args.concurrency} clients', results['gunicorn'],
+                   (baseline or {}).get('gunicorn'))
+    finally:
+        if workdir:
+            shutil.rmtree(workdir, ignore_errors=True)
+
+    if args.save_baseline:
+        with open(args.save_baseline, 'w') as stream:
+            json.dump({'params': params, 'results': results}, stream, indent=2, sort_keys=True)
+            stream.write('\n')
+        print(f'\nSaved baseline to {args.save_baseline}')
+
+    if baseline is not None:
+        problems = regressions(results, baseline, args.tolerance, args.min_delta_ms)
+        if problems:
+            print('\nRegressions against the baseline:')
+            for problem in problems:
+                print(f'  {problem}')
+            sys.exit(1)
+        print('\nNo regressions against the baseline.')
+
+
+if __name__ == '__main__':
+    main()
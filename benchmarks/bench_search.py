@@ -0,0 +1,111 @@
+"""Compare /user/search latency: FTS index vs. the old leading-wildcard ILIKE.
+
+Usage: python benchmarks/bench_search.py [--models 100000] [--repeat 20]
+
+Seeds a throwaway SQLite database (or DATABASE_URL if set) with a synthetic
+catalog and times both search paths for a handful of typical queries.
+"""
+import argparse
+import os
+import random
+import statistics
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+BRANDS = ['Toyota', 'Honda', 'Ford', 'Tesla', 'BMW', 'Audi', 'Kia', 'Hyundai', 'Volvo', 'Mazda']
+NAMES = ['Corolla', 'Civic', 'Focus', 'Model 3', 'X5', 'A4', 'Sportage', 'Tucson', 'XC90', 'CX-5']
+WORDS = ['comfortable', 'family', 'sedan', 'compact', 'luxury', 'efficient', 'spacious', 'sporty', 'reliable']
+QUERIES = ['toy', 'civic', 'model 3', 'electric', 'luxury sedan', 'corolla 4242', 'xc90 77']
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--models', type=int, default=100_000)
+    parser.add_argument('--models-per-car', type=int, default=10)
+    parser.add_argument('--repeat', type=int, default=20)
+    return parser.parse_args()
+
+
+def seed(db, n_models, per_car):
+    rng = random.Random(42)
+    n_cars = max(1, n_models // per_car)
+    cars = [{
+        'id': i + 1,
+        'brand': rng.choice(BRANDS),
+        'year': rng.randint(2005, 2024),
+        'description': ' '.join(rng.sample(WORDS, 4)),
+    } for i in range(n_cars)]
+    models = [{
+        'car_id': i % n_cars + 1,
+        'name': f'{rng.choice(NAMES)} {i}',
+        'price_per_day': rng.randint(20, 300),
+        'fuel_type': rng.choice(['Petrol', 'Diesel', 'Electric', 'Hybrid']),
+        'transmission': rng.choice(['Manual', 'Automatic']),
+    } for i in range(n_models)]
+    db.session.execute(db.text(
+        "INSERT INTO car (id, brand, year, description, is_available, created_at, updated_at) "
+        "VALUES (:id, :brand, :year, :description, 1, CURRENT_TIMESTAMP, CURRENT_TIMESTAMP)"
+    ), cars)
+    db.session.execute(db.text(
+        "INSERT INTO car_model (car_id, name, price_per_day, fuel_type, transmission, is_available, "
+        "created_at, updated_at) VALUES (:car_id, :name, :price_per_day, :fuel_type, :transmission, 1, "
+        "CURRENT_TIMESTAMP, CURRENT_TIMESTAMP)"
+    ), models)
+    db.session.commit()
+
+
+def ilike_search(query):
+    # The pre-FTS route: two unbounded leading-wildcard scans
+    from sqlalchemy import or_
+    from models import Car, CarModel
+
+    pattern = f'%{query}%'
+    car_ids = [car.id for car in Car.query.filter(or_(
+        Car.brand.ilike(pattern),
+        Car.description.ilike(pattern)
+    )).all()]
+    return CarModel.query.filter(or_(
+        CarModel.car_id.in_(car_ids),
+        CarModel.name.ilike(pattern),
+        CarModel.fuel_type.ilike(pattern),
+        CarModel.transmission.ilike(pattern)
+    )).all()
+
+
+def timed(fn, repeat):
+    samples = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        samples.append((time.perf_counter() - start) * 1000)
+    return statistics.median(samples)
+
+
+def main():
+    args = parse_args()
+    if 'DATABASE_URL' not in os.environ:
+        path = os.path.join(tempfile.mkdtemp(), 'bench_search.db')
+        os.environ['DATABASE_URL'] = f'sqlite:///{path}'
+
+    from app import create_app, db
+    from commands import init_db
+    import search_index
+
+    app = create_app()
+    with app.app_context():
+        init_db()
+        print(f'Seeding {args.models} car models...')
+        seed(db, args.models, args.models_per_car)
+        print(f"{'query':<16}{'ILIKE ms':>12}{'FTS ms':>12}{'speedup':>10}")
+        for query in QUERIES:
+            ilike = timed(lambda: ilike_search(query), args.repeat)
+            fts = timed(lambda: search_index.search_car_models(query), args.repeat)
+            print(f'{query:<16}{ilike:>12.2f}{fts:>12.2f}{ilike / fts:>9.1f}x')
+
+
+if __name__ == '__main__':
+    main()
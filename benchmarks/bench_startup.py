@@ -0,0 +1,103 @@
+"""Measure cold import and first-request latency of the application.
+
+Usage: python benchmarks/bench_startup.py [--runs 5] [--ref baseline]
+
+Each run starts a fresh interpreter against a fresh SQLite database and
+reports how long it takes to import and build the app, and then to serve
+the first GET /. With --ref, the same measurement is repeated on a git
+revision (e.g. the commit before the application factory) for comparison.
+"""
+import argparse
+import json
+import os
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Runs inside the child interpreter; works with both the module-level app
+# of older revisions and the create_app() factory
+PROBE = r"""
+import json, sys, time
+started = time.perf_counter()
+import app as module
+application = module.create_app() if hasattr(module, 'create_app') else module.app
+imported = time.perf_counter()
+client = application.test_client()
+status = client.get('/').status_code
+served = time.perf_counter()
+print(json.dumps({'import_ms': (imported - started) * 1000,
+                  'first_request_ms': (served - imported) * 1000,
+                  'status': status}))
+"""
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--runs', type=int, default=5)
+    parser.add_argument('--ref', help='git revision to compare against')
+    return parser.parse_args()
+
+
+def prepare_database(source_dir, env):
+    # The factory expects `flask init-db` to have run, as in a deploy
+    if os.path.exists(os.path.join(source_dir, 'commands.py')):
+        subprocess.run(
+            [sys.executable, '-m', 'flask', '--app', 'app', 'init-db'],
+            cwd=source_dir, env=env, check=True, capture_output=True
+        )
+        subprocess.run(
+            [sys.executable, '-m', 'flask', '--app', 'app', 'seed-admin'],
+            cwd=source_dir, env=env, check=True, capture_output=True
+        )
+
+
+def measure(source_dir, runs):
+    samples = []
+    for _ in range(runs):
+        workdir = tempfile.mkdtemp()
+        env = dict(os.environ, DATABASE_URL=f"sqlite:///{os.path.join(workdir, 'startup.db')}")
+        try:
+            prepare_database(source_dir, env)
+            result = subprocess.run(
+                [sys.executable, '-c', PROBE], cwd=source_dir, env=env,
+                check=True, capture_output=True, text=True
+            )
+            samples.append(json.loads(result.stdout.strip().splitlines()[-1]))
+        finally:
+            shutil.rmtree(workdir, ignore_errors=True)
+    return {
+        'import_ms': statistics.median(sample['import_ms'] for sample in samples),
+        'first_request_ms': statistics.median(sample['first_request_ms'] for sample in samples),
+        'status': samples[-1]['status'],
+    }
+
+
+def checkout(ref):
+    target = tempfile.mkdtemp()
+    archive = subprocess.run(['git', 'archive', ref], cwd=ROOT, check=True, capture_output=True).stdout
+    subprocess.run(['tar', '-x', '-C', target], input=archive, check=True)
+    return target
+
+
+def report(label, result):
+    print(f"{label:<12}{result['import_ms']:>14.1f}{result['first_request_ms']:>20.1f}{result['status']:>8}")
+
+
+def main():
+    args = parse_args()
+    print(f"{'revision':<12}{'import ms':>14}{'first request ms':>20}{'status':>8}")
+    if args.ref:
+        source_dir = checkout(args.ref)
+        try:
+            report(args.ref[:12], measure(source_dir, args.runs))
+        finally:
+            shutil.rmtree(source_dir, ignore_errors=True)
+    report('working', measure(ROOT, args.runs))
+
+
+if __name__ == '__main__':
+    main()
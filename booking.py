@@ -0,0 +1,82 @@
+from datetime import date
+
+from app import db
+from cache import bump_catalog_version
+from models import CarModel, Rental
+from availability import as_datetime, find_conflicts
+from occupancy import record_booking
+from pricing import quote_rental
+
+
+class BookingConflict(Exception):
+    """Raised when the requested dates overlap an existing booking."""
+
+
+def locked_get(model, ident):
+    """Load a row and hold its lock until the transaction ends."""
+    connection = db.session.connection()
+    if connection.dialect.name == 'sqlite':
+        # SQLite has no row locks; BEGIN IMMEDIATE takes the database write
+        # lock up front instead of when the first write is flushed
+        if not connection.connection.dbapi_connection.in_transaction:
+            connection.exec_driver_sql('BEGIN IMMEDIATE')
+        return db.session.get(model, ident, populate_existing=True)
+
+    # SELECT ... FOR UPDATE on the row
+    return db.session.get(model, ident, with_for_update=True, populate_existing=True)
+
+
+def lock_car_model(model_id):
+    """Load a car model and hold its booking lock until the transaction ends.
+
+    Every booking for the same model serialises on this lock, so the
+    conflict check and the insert that follows it are atomic even across
+    gunicorn workers.
+    """
+    return locked_get(CarModel, model_id)
+
+
+def validate_dates(start_date, end_date):
+    # Same rule as RentalForm.validate_end_date, for callers without a form
+    if end_date < start_date:
+        raise ValueError('End date must be after start date.')
+
+
+def create_booking(user_id, model_id, start_date, end_date, status='active'):
+    """Book ``model_id`` for the inclusive date range and commit.
+
+    Raises ``ValueError`` for an invalid range, ``LookupError`` for an
+    unknown model and ``BookingConflict`` when the dates overlap an existing
+    booking; the transaction is rolled back in every case.
+    """
+    validate_dates(start_date, end_date)
+    try:
+        car_model = lock_car_model(model_id)
+        if car_model is None:
+            raise LookupError(f'Car model {model_id} does not exist')
+        if not car_model.in_service:
+            raise BookingConflict(f'Car model {model_id} is out of service')
+
+        # Re-check under the lock so concurrent requests cannot both pass
+        if find_conflicts(model_id, start_date, end_date):
+            raise BookingConflict(f'Car model {model_id} is already booked for these dates')
+
+        rental = Rental(
+            user_id=user_id,
+            car_model_id=model_id,
+            start_date=as_datetime(start_date),
+            end_date=as_datetime(end_date),
+            total_price=quote_rental(car_model, start_date, end_date),
+            status=status
+        )
+        db.session.add(rental)
+        # is_available means "free today"; future bookings leave it alone
+        if start_date <= date.today() <= end_date:
+            car_model.is_available = False
+        db.session.commit()
+    except Exception:
+        db.session.rollback()
+        raise
+    record_booking(model_id, start_date, end_date)
+    bump_catalog_version()
+    return rental
@@ -0,0 +1,212 @@
+import time
+from datetime import date, datetime
+
+import click
+from flask.cli import AppGroup
+from sqlalchemy import Numeric, and_, case, cast, delete, distinct, exists, func, select, true, update
+
+from app import db
+from availability import BLOCKING_STATUSES, unbooked_between
+from cache import bump_catalog_version
+from models import Car, CarModel, Rental
+
+BULK_ACTIONS = {
+    'adjust_price': 'Adjust price by percent',
+    'set_price': 'Set price per day',
+    'out_of_service': 'Take out of service',
+    'in_service': 'Return to service',
+    'delete': 'Delete',
+}
+# Actions that take a number, and what it means
+ACTION_VALUES = {'adjust_price': 'percent', 'set_price': 'price per day'}
+
+
+class BulkReport:
+    def __init__(self, action, dry_run):
+        self.action = action
+        self.dry_run = dry_run
+        self.matched = 0
+        # Selected models holding a pending or active booking, and models
+        # with any rentals at all (which deletion keeps for their history)
+        self.booked = 0
+        self.with_rentals = 0
+        self.changed = 0
+        self.skipped = 0
+        self.seconds = 0.0
+
+    def summary(self):
+        verb = 'would change' if self.dry_run else 'changed'
+        text = f'{BULK_ACTIONS[self.action]}: {self.matched} models matched, {self.changed} {verb}'
+        if self.skipped:
+            reason = 'with rental history' if self.action == 'delete' else 'with pending or active bookings'
+            text += f', {self.skipped} skipped {reason}'
+        return f'{text} ({self.seconds * 1000:.0f} ms)'
+
+
+def model_selection(model_ids=None, car_ids=None, brand=None, year=None):
+    """WHERE clause picking car models by id, or by their car's id, brand or year."""
+    conditions = []
+    if model_ids is not None:
+        conditions.append(CarModel.id.in_(list(model_ids)))
+    car_conditions = []
+    if car_ids is not None:
+        car_conditions.append(Car.id.in_(list(car_ids)))
+    if brand:
+        car_conditions.append(func.lower(Car.brand) == brand.lower())
+    if year:
+        car_conditions.append(Car.year == year)
+    if car_conditions:
+        conditions.append(CarModel.car_id.in_(select(Car.id).where(*car_conditions)))
+    if not conditions:
+        raise ValueError('Select models by id, car, brand or year.')
+    return and_(*conditions)
+
+
+def rental_check(selection):
+    """Count the selected models, the booked ones and those with any rentals.
+
+    One aggregate over the selection's rentals, instead of a query per model.
+    """
+    blocking = case((Rental.status.in_(BLOCKING_STATUSES), Rental.car_model_id))
+    return db.session.execute(
+        select(
+            func.count(distinct(CarModel.id)),
+            func.count(distinct(blocking)),
+            func.count(distinct(Rental.car_model_id)),
+        )
+        .select_from(CarModel)
+        .outerjoin(Rental, Rental.car_model_id == CarModel.id)
+        .where(selection)
+    ).one()
+
+
+def _has_rentals(statuses=None):
+    condition = Rental.car_model_id == CarModel.id
+    if statuses is not None:
+        condition = and_(condition, Rental.status.in_(statuses))
+    return exists().where(condition)
+
+
+def _statement(action, selection, value):
+    now = datetime.utcnow()
+    if action == 'adjust_price':
+        # Rounded as NUMERIC, as PostgreSQL has no round() for double precision
+        price = func.round(cast(CarModel.price_per_day * (1 + value / 100), Numeric), 2)
+        return update(CarModel).where(selection).values(price_per_day=price, updated_at=now)
+    if action == 'set_price':
+        return update(CarModel).where(selection).values(price_per_day=value, updated_at=now)
+    if action == 'out_of_service':
+        # The guard is part of the statement, so a booking that lands
+        # between the check and the update still wins
+        return update(CarModel).where(
+            selection, CarModel.in_service == true(), ~_has_rentals(BLOCKING_STATUSES)
+        ).values(in_service=False, is_available=False, updated_at=now)
+    if action == 'in_service':
+        today = date.today()
+        return update(CarModel).where(selection, CarModel.in_service.is_(False)).values(
+            in_service=True, is_available=unbooked_between(today, today), updated_at=now
+        )
+    if action == 'delete':
+        # Rentals keep their model for history and reporting
+        return delete(CarModel).where(selection, ~_has_rentals())
+    raise ValueError(f'Unknown bulk action: {action}')
+
+
+def run_bulk(action, selection, value=None, dry_run=False):
+    """Apply ``action`` to every car model matching ``selection`` in one statement.
+
+    Prices are changed whatever the bookings (rentals keep the total they
+    were quoted); taking models out of service skips booked ones, and
+    deletion skips models with any rentals. With ``dry_run`` the statement
+    is only counted. Returns a :class:`BulkReport`.
+    """
+    if action not in BULK_ACTIONS:
+        raise ValueError(f'Unknown bulk action: {action}')
+    if action in ACTION_VALUES and value is None:
+        raise ValueError(f'{BULK_ACTIONS[action]} needs a {ACTION_VALUES[action]}.')
+    if action == 'adjust_price' and value <= -100:
+        raise ValueError('A price cannot drop by 100% or more.')
+    if action == 'set_price' and value < 0:
+        raise ValueError('Prices cannot be negative.')
+
+    started = time.perf_counter()
+    report = BulkReport(action, dry_run)
+    report.matched, report.booked, report.with_rentals = rental_check(selection)
+    if action == 'out_of_service':
+        report.skipped = report.booked
+    elif action == 'delete':
+        report.skipped = report.with_rentals
+
+    statement = _statement(action, selection, value)
+    if dry_run:
+        # The statement's own WHERE clause, counted instead of applied
+        report.changed = db.session.scalar(
+            select(func.count()).select_from(CarModel).where(statement.whereclause)
+        )
+    else:
+        result = db.session.execute(statement.execution_options(synchronize_session=False))
+        db.session.commit()
+        report.changed = result.rowcount
+        if report.changed:
+            bump_catalog_version()
+    report.seconds = time.perf_counter() - started
+    return report
+
+
+bulk_cli = AppGroup('bulk', help='Set-based changes to many car models at once.')
+
+
+def _selection_options(command):
+    command = click.option('--model-id', 'model_ids', type=int, multiple=True, help='Repeatable.')(command)
+    command = click.option('--car-id', 'car_ids', type=int, multiple=True, help='Repeatable.')(command)
+    command = click.option('--brand', help='Case-insensitive.')(command)
+    command = click.option('--year', type=int)(command)
+    command = click.option('--dry-run', is_flag=True, help='Report what would change; write nothing.')(command)
+    return command
+
+
+def _run(action, model_ids, car_ids, brand, year, dry_run, value=None):
+    try:
+        selection = model_selection(model_ids or None, car_ids or None, brand, year)
+        report = run_bulk(action, selection, value, dry_run)
+    except ValueError as error:
+        raise click.UsageError(str(error))
+    click.echo(('Dry run. ' if dry_run else '') + report.summary())
+
+
+# Lets negative percentages through as the argument rather than as options
+@bulk_cli.command('adjust-price', context_settings={'ignore_unknown_options': True})
+@click.argument('percent', type=float)
+@_selection_options
+def adjust_price_command(percent, **selection):
+    """Change the daily price of the selected models by PERCENT (e.g. 10 or -15)."""
+    _run('adjust_price', value=percent, **selection)
+
+
+@bulk_cli.command('set-price')
+@click.argument('price', type=float)
+@_selection_options
+def set_price_command(price, **selection):
+    """Set the daily price of the selected models to PRICE."""
+    _run('set_price', value=price, **selection)
+
+
+@bulk_cli.command('out-of-service')
+@_selection_options
+def out_of_service_command(**selection):
+    """Take the selected models out of service, skipping booked ones."""
+    _run('out_of_service', **selection)
+
+
+@bulk_cli.command('in-service')
+@_selection_options
+def in_service_command(**selection):
+    """Return the selected models to service."""
+    _run('in_service', **selection)
+
+
+@bulk_cli.command('delete')
+@_selection_options
+def delete_command(**selection):
+    """Delete the selected models, skipping any with rentals."""
+    _run('delete', **selection)
@@ -0,0 +1,137 @@
+import threading
+import time
+from collections import OrderedDict
+
+from flask import current_app
+from werkzeug.utils import import_string
+
+_MISSING = object()
+
+
+class LRUCache:
+    """Thread-safe in-process LRU cache with a per-entry TTL.
+
+    This is the default backend for every named cache. Any object exposing
+    ``get``/``set``/``delete``/``clear`` (and optionally ``stats``) can be
+    plugged in instead, e.g. a thin wrapper around a shared Redis client.
+    """
+
+    def __init__(self, maxsize=1024, ttl=300):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key, default=None):
+        with self._lock:
+            entry = self._data.get(key, _MISSING)
+            if entry is not _MISSING:
+                value, expires_at = entry
+                if expires_at is None or expires_at > time.monotonic():
+                    self._data.move_to_end(key)
+                    self.hits += 1
+                    return value
+                del self._data[key]
+            self.misses += 1
+            return default
+
+    def set(self, key, value, ttl=None):
+        ttl = self.ttl if ttl is None else ttl
+        expires_at = time.monotonic() + ttl if ttl else None
+        with self._lock:
+            self._data[key] = (value, expires_at)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def delete(self, key):
+        with self._lock:
+            self._data.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_rate': round(self.hits / lookups, 4) if lookups else 0.0,
+                'size': len(self._data),
+                'maxsize': self.maxsize,
+                'ttl': self.ttl,
+            }
+
+
+# Named cache backends, created on first use from the app config
+_caches = {}
+_caches_lock = threading.Lock()
+
+
+def get_cache(name):
+    """Return the backend for ``name``, building it from config on first use.
+
+    ``<NAME>_CACHE_SIZE`` and ``<NAME>_CACHE_TTL`` size the default LRU;
+    ``<NAME>_CACHE_BACKEND`` may name a ``module:factory`` called with
+    ``maxsize`` and ``ttl`` to use a different backend.
+    """
+    backend = _caches.get(name)
+    if backend is None:
+        with _caches_lock:
+            backend = _caches.get(name)
+            if backend is None:
+                prefix = name.upper()
+                config = current_app.config
+                maxsize = config.get(f'{prefix}_CACHE_SIZE', 1024)
+                ttl = config.get(f'{prefix}_CACHE_TTL', 300)
+                factory = config.get(f'{prefix}_CACHE_BACKEND')
+                if isinstance(factory, str):
+                    factory = import_string(factory)
+                backend = (factory or LRUCache)(maxsize=maxsize, ttl=ttl)
+                _caches[name] = backend
+    return backend
+
+
+def set_cache_backend(name, backend):
+    _caches[name] = backend
+
+
+def cache_stats():
+    return {name: backend.stats() for name, backend in _caches.items() if hasattr(backend, 'stats')}
+
+
+# Catalog caching: entries are namespaced by a version token, so bumping the
+# version after any catalog write invalidates every cached fragment at once.
+# With several workers and the default in-process backend each worker keeps
+# its own version; CATALOG_CACHE_TTL bounds how stale another worker can be.
+CATALOG_VERSION_KEY = 'catalog:version'
+
+
+def catalog_version():
+    cache = get_cache('catalog')
+    version = cache.get(CATALOG_VERSION_KEY)
+    if version is None:
+        # A fresh token rather than a counter, so an evicted version can
+        # never resurrect entries cached under an older one
+        version = time.time_ns()
+        cache.set(CATALOG_VERSION_KEY, version, ttl=0)
+    return version
+
+
+def bump_catalog_version():
+    get_cache('catalog').set(CATALOG_VERSION_KEY, time.time_ns(), ttl=0)
+
+
+def cached_catalog(key, producer, ttl=None):
+    """Return the cached value for ``key`` under the current catalog version."""
+    cache = get_cache('catalog')
+    versioned_key = f'catalog:{catalog_version()}:{key}'
+    value = cache.get(versioned_key, _MISSING)
+    if value is _MISSING:
+        value = producer()
+        cache.set(versioned_key, value, ttl)
+    return value
@@ -0,0 +1,168 @@
+import hashlib
+
+from flask import request, session
+from flask_login import current_user
+from sqlalchemy import func, literal, select, true, union_all
+
+from app import db
+from cache import cached_catalog
+from models import AnalyticsWatermark, Car, CarModel, PricingRule, Rental
+from pagination import KeysetOrder
+
+# Multi-select facets shown with per-value counts: query-string key -> column
+FACETS = {
+    'brand': Car.brand,
+    'fuel_type': CarModel.fuel_type,
+    'transmission': CarModel.transmission,
+}
+# Upper bound on the values accepted per facet, to keep IN lists small
+MAX_FACET_VALUES = 20
+# Largest integer filter value, what a signed 64-bit column holds
+MAX_FILTER_INT = 2 ** 63 - 1
+
+# Catalog sort options: key -> (label, keyset order)
+CATALOG_SORTS = {
+    'newest': ('Newest listings', KeysetOrder(CarModel.created_at, True, lambda model: model.created_at)),
+    'price_asc': ('Price: low to high', KeysetOrder(CarModel.price_per_day, False, lambda model: model.price_per_day)),
+    'price_desc': ('Price: high to low', KeysetOrder(CarModel.price_per_day, True, lambda model: model.price_per_day)),
+    'year_desc': ('Year: newest first', KeysetOrder(Car.year, True, lambda model: model.car.year)),
+    'year_asc': ('Year: oldest first', KeysetOrder(Car.year, False, lambda model: model.car.year)),
+}
+
+
+def catalog_state():
+    """Latest ``updated_at`` and row counts behind catalog pages.
+
+    Covers cars, car models and rentals (bookings change which models
+    date-filtered listings show) as well as pricing rules and the analytics
+    rollup watermark, which together decide the prices quoted for a date
+    range. Counts are included because deletions do not move ``updated_at``;
+    the watermark only goes into the ETag, as it trails rental changes.
+    """
+    def load():
+        row = db.session.execute(select(
+            select(func.max(Car.updated_at)).scalar_subquery(),
+            select(func.max(CarModel.updated_at)).scalar_subquery(),
+            select(func.max(Rental.updated_at)).scalar_subquery(),
+            select(func.max(PricingRule.updated_at)).scalar_subquery(),
+            select(func.count(Car.id)).scalar_subquery(),
+            select(func.count(CarModel.id)).scalar_subquery(),
+            select(func.count(Rental.id)).scalar_subquery(),
+            select(func.count(PricingRule.id)).scalar_subquery(),
+            select(func.max(AnalyticsWatermark.updated_at)).scalar_subquery()
+        )).one()
+        timestamps = [value for value in row[:4] if value is not None]
+        return max(timestamps) if timestamps else None, tuple(row[4:])
+    return cached_catalog('state', load)
+
+
+def catalog_etag():
+    # Pages embed the signed-in user's name, so validators are per user
+    last_modified, versions = catalog_state()
+    user_key = current_user.get_id() if current_user.is_authenticated else 'anonymous'
+    raw = f"{last_modified}|{'|'.join(map(str, versions))}|{user_key}|{request.full_path}"
+    return hashlib.sha1(raw.encode()).hexdigest(), last_modified
+
+
+def is_not_modified(etag):
+    # Pending flash messages must be rendered, so never short-circuit them
+    if session.get('_flashes'):
+        return False
+    # Weak comparison: compressed pages carry a weak ETag (see assets.py)
+    return request.if_none_match.contains_weak(etag)
+
+
+def make_conditional(response, etag, last_modified):
+    response.set_etag(etag)
+    if last_modified is not None:
+        response.last_modified = last_modified
+    # Browsers may store the page but must revalidate it on every use
+    response.cache_control.private = True
+    response.cache_control.no_cache = True
+    return response
+
+
+def _number(value, cast=float):
+    try:
+        number = cast(value) if value not in (None, '') else None
+    except ValueError:
+        return None
+    # Integers beyond 64 bits would fail as query parameters
+    if cast is int and number is not None and abs(number) > MAX_FILTER_INT:
+        return None
+    return number
+
+
+def catalog_filters(args):
+    """Filter and sort state for the catalog, read from the query string."""
+    filters = {
+        facet: [value for value in args.getlist(facet) if value][:MAX_FACET_VALUES]
+        for facet in FACETS
+    }
+    filters.update(
+        min_price=_number(args.get('min_price')),
+        max_price=_number(args.get('max_price')),
+        min_seats=_number(args.get('min_seats'), int),
+        air_conditioning=args.get('air_conditioning') == '1',
+        sort=args.get('sort') if args.get('sort') in CATALOG_SORTS else 'newest',
+    )
+    return filters
+
+
+def filter_conditions(filters, exclude=None):
+    # Every active filter as a WHERE condition; ``exclude`` skips one facet
+    conditions = [
+        column.in_(filters[facet])
+        for facet, column in FACETS.items()
+        if filters[facet] and facet != exclude
+    ]
+    if filters['min_price'] is not None:
+        conditions.append(CarModel.price_per_day >= filters['min_price'])
+    if filters['max_price'] is not None:
+        conditions.append(CarModel.price_per_day <= filters['max_price'])
+    if filters['min_seats'] is not None:
+        conditions.append(CarModel.seats >= filters['min_seats'])
+    if filters['air_conditioning']:
+        conditions.append(CarModel.air_conditioning == true())
+    return conditions
+
+
+def catalog_facets(filters, availability):
+    """Counts per brand, fuel type and transmission in one grouped query.
+
+    Each facet is counted under every filter except its own, so the counts
+    show what picking another value would return. Selected values are kept
+    even when nothing matches them, so they can still be unchecked.
+    """
+    def matching(facet, *columns):
+        query = select(*columns).where(availability, *filter_conditions(filters, exclude=facet))
+        # Brand is the only filter on the car table
+        if filters['brand'] and facet != 'brand':
+            query = query.join(Car, Car.id == CarModel.car_id)
+        return query
+
+    # Brands: count per car first, so only one row per car is joined
+    per_car = matching('brand', CarModel.car_id, func.count(CarModel.id).label('count')).group_by(
+        CarModel.car_id
+    ).subquery()
+    branches = [
+        select(literal('brand').label('facet'), Car.brand.label('value'), func.sum(per_car.c.count))
+        .join_from(per_car, Car, Car.id == per_car.c.car_id)
+        .group_by(Car.brand)
+    ]
+    for facet in ('fuel_type', 'transmission'):
+        column = FACETS[facet]
+        branches.append(
+            matching(facet, literal(facet), column, func.count(CarModel.id))
+            .where(column.is_not(None))
+            .group_by(column)
+        )
+
+    counts = {facet: {value: 0 for value in filters[facet]} for facet in FACETS}
+    for facet, value, count in db.session.execute(union_all(*branches)):
+        counts[facet][value] = count
+    return {facet: sorted(values.items()) for facet, values in counts.items()}
+
+
+def catalog_order(filters):
+    return CATALOG_SORTS[filters['sort']][1]
@@ -0,0 +1,56 @@
+import logging
+
+import click
+from flask import current_app
+from flask.cli import with_appcontext
+from sqlalchemy.exc import IntegrityError
+
+from app import db
+from models import User
+from passwords import hash_password
+from search_index import install_search_index
+
+
+def init_db():
+    # Create all tables, then the full-text search index and its triggers
+    db.create_all()
+    install_search_index()
+
+
+def seed_admin(username, email, password):
+    """Create the admin account unless it exists; returns True if created."""
+    if User.query.filter_by(username=username).first():
+        return False
+
+    admin = User(
+        username=username,
+        email=email,
+        password_hash=hash_password(password),
+        is_admin=True
+    )
+    db.session.add(admin)
+    try:
+        db.session.commit()
+    except IntegrityError:
+        # Another process seeded it concurrently
+        db.session.rollback()
+        return False
+    logging.info("Admin user created")
+    return True
+
+
+@click.command('init-db')
+@with_appcontext
+def init_db_command():
+    """Create database tables and the search index (safe to re-run)."""
+    init_db()
+    click.echo('Database initialised.')
+
+
+@click.command('seed-admin')
+@with_appcontext
+def seed_admin_command():
+    """Create the admin user from ADMIN_USERNAME/ADMIN_EMAIL/ADMIN_PASSWORD."""
+    config = current_app.config
+    created = seed_admin(config['ADMIN_USERNAME'], config['ADMIN_EMAIL'], config['ADMIN_PASSWORD'])
+    click.echo('Admin user created.' if created else 'Admin user already exists.')
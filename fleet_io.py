@@ -0,0 +1,319 @@
+import csv
+import io
+import json
+import time
+from datetime import datetime
+from itertools import islice
+
+import click
+from flask.cli import AppGroup
+from sqlalchemy import insert, select, tuple_, update
+from werkzeug.datastructures import MultiDict
+
+from app import db
+from cache import bump_catalog_version
+from forms import CarForm, CarModelForm
+from models import Car, CarModel
+
+# Rows validated and written per transaction
+DEFAULT_CHUNK_SIZE = 1000
+# Errors kept in a report; the error count itself is always exact
+MAX_REPORTED_ERRORS = 500
+
+# One row per car model, with its car's fields denormalised onto it
+FLEET_COLUMNS = [
+    'brand', 'year', 'description', 'name', 'price_per_day', 'mileage',
+    'fuel_type', 'transmission', 'seats', 'air_conditioning', 'image_url',
+]
+MODEL_COLUMNS = [
+    'name', 'price_per_day', 'mileage', 'fuel_type', 'transmission',
+    'seats', 'air_conditioning', 'image_url',
+]
+
+
+class FleetFileError(ValueError):
+    """Raised when an upload cannot be read as a CSV or JSONL text file at all."""
+
+
+class ImportReport:
+    def __init__(self):
+        self.rows = 0
+        self.cars_created = 0
+        self.models_created = 0
+        self.models_updated = 0
+        self.error_count = 0
+        self.errors = []
+        # Set when the file itself stopped being readable part way through
+        self.file_error = None
+        self.seconds = 0.0
+
+    def add_error(self, line, message):
+        self.error_count += 1
+        if len(self.errors) < MAX_REPORTED_ERRORS:
+            self.errors.append((line, message))
+
+    def summary(self):
+        return (f'{self.rows} rows in {self.seconds:.2f}s: {self.cars_created} cars created, '
+                f'{self.models_created} models created, {self.models_updated} models updated, '
+                f'{self.error_count} rows rejected')
+
+
+def read_csv(stream):
+    reader = csv.DictReader(stream)
+    for row in reader:
+        yield reader.line_num, row
+
+
+def read_jsonl(stream):
+    for line_no, line in enumerate(stream, start=1):
+        if not line.strip():
+            continue
+        try:
+            row = json.loads(line)
+        except ValueError as error:
+            yield line_no, {'__error__': f'Invalid JSON: {error}'}
+            continue
+        yield line_no, row if isinstance(row, dict) else {'__error__': 'Expected a JSON object.'}
+
+
+def _readable(rows):
+    # Binary or non-UTF-8 uploads only fail once the bad bytes are decoded
+    try:
+        yield from rows
+    except UnicodeDecodeError:
+        raise FleetFileError('The file is not UTF-8 text. Save it as UTF-8 and upload it again.') from None
+    except csv.Error as error:
+        raise FleetFileError(f'The file is not valid CSV: {error}.') from None
+
+
+def read_rows(stream, fmt):
+    if fmt == 'csv':
+        return _readable(read_csv(stream))
+    if fmt == 'jsonl':
+        return _readable(read_jsonl(stream))
+    raise ValueError(f'Unsupported format: {fmt}')
+
+
+def _formdata(row):
+    data = MultiDict()
+    for key in FLEET_COLUMNS:
+        value = row.get(key)
+        if value is None:
+            continue
+        if key == 'air_conditioning':
+            # BooleanField treats any non-empty string as true
+            value = 'y' if str(value).strip().lower() in ('1', 'true', 'yes', 'y') else ''
+        data[key] = str(value).strip()
+    return data
+
+
+def validate_row(row):
+    """Validate a row with the same constraints as CarForm/CarModelForm.
+
+    Returns ``(car_fields, model_fields)`` or raises ``ValueError`` with the
+    collected field errors.
+    """
+    if '__error__' in row:
+        raise ValueError(row['__error__'])
+
+    formdata = _formdata(row)
+    car_form = CarForm(formdata=formdata, meta={'csrf': False})
+    model_form = CarModelForm(formdata=formdata, meta={'csrf': False})
+    # The car is resolved from brand/year rather than picked from a list
+    del model_form['car_id']
+
+    errors = []
+    for form in (car_form, model_form):
+        if not form.validate():
+            errors.extend(f'{name}: {"; ".join(messages)}' for name, messages in form.errors.items())
+    if errors:
+        raise ValueError(', '.join(errors))
+
+    car_fields = {
+        'brand': car_form.brand.data,
+        'year': car_form.year.data,
+        'description': car_form.description.data or None,
+    }
+    model_fields = {column: model_form[column].data for column in MODEL_COLUMNS}
+    model_fields['image_url'] = model_fields['image_url'] or None
+    return car_fields, model_fields
+
+
+def _existing_ids(model, first, second, keys):
+    # Map (first, second) natural keys to primary keys in a single query
+    rows = db.session.execute(
+        select(first, second, model.id).where(tuple_(first, second).in_(list(keys)))
+    )
+    return {(a, b): row_id for a, b, row_id in rows}
+
+
+def _upsert_chunk(rows, report):
+    now = datetime.utcnow()
+
+    # Resolve every (brand, year) in the chunk with one query, insert the rest
+    car_keys = {(car['brand'], car['year']): car for car, _ in rows}
+    car_ids = _existing_ids(Car, Car.brand, Car.year, car_keys)
+
+    # Existing cars only pick up a description when the file provides one
+    car_updates = [
+        {'id': car_ids[key], 'description': car['description'], 'updated_at': now}
+        for key, car in car_keys.items() if key in car_ids and car['description']
+    ]
+    if car_updates:
+        db.session.execute(update(Car), car_updates)
+
+    new_cars = [
+        dict(car, is_available=True, created_at=now, updated_at=now)
+        for key, car in car_keys.items() if key not in car_ids
+    ]
+    if new_cars:
+        db.session.execute(insert(Car), new_cars)
+        report.cars_created += len(new_cars)
+        car_ids.update(_existing_ids(Car, Car.brand, Car.year, [(car['brand'], car['year']) for car in new_cars]))
+
+    # Later rows for the same (car, model name) win
+    models = {}
+    for car, model in rows:
+        car_id = car_ids[(car['brand'], car['year'])]
+        models[(car_id, model['name'])] = dict(model, car_id=car_id)
+
+    model_ids = _existing_ids(CarModel, CarModel.car_id, CarModel.name, models)
+
+    # A stored image only stays while its URL does; a changed URL drops the
+    # stored variants, and `flask images ingest` stores the new picture
+    images = {
+        row.id: row for row in db.session.execute(
+            select(CarModel.id, CarModel.image_url, CarModel.image_key, CarModel.image_width, CarModel.image_height)
+            .where(CarModel.id.in_(list(model_ids.values())))
+        )
+    }
+    updates = []
+    for key, model in models.items():
+        if key not in model_ids:
+            continue
+        current = images[model_ids[key]]
+        kept = model['image_url'] == current.image_url
+        updates.append(dict(
+            model, id=current.id, updated_at=now,
+            image_key=current.image_key if kept else None,
+            image_width=current.image_width if kept else None,
+            image_height=current.image_height if kept else None,
+        ))
+    inserts = [
+        dict(model, is_available=True, created_at=now, updated_at=now)
+        for key, model in models.items() if key not in model_ids
+    ]
+    if updates:
+        db.session.execute(update(CarModel), updates)
+    if inserts:
+        db.session.execute(insert(CarModel), inserts)
+    report.models_updated += len(updates)
+    report.models_created += len(inserts)
+
+
+def import_fleet(rows, chunk_size=DEFAULT_CHUNK_SIZE, dry_run=False):
+    """Validate and upsert ``(line, row)`` pairs in bounded transactions.
+
+    Cars are matched on ``(brand, year)`` and models on ``(car, name)``.
+    Each chunk commits on its own, so a failure only loses that chunk. A file
+    that becomes unreadable stops the import with ``report.file_error`` set;
+    chunks before it stay imported.
+    """
+    report = ImportReport()
+    started = time.perf_counter()
+    rows = iter(rows)
+    while True:
+        try:
+            chunk = list(islice(rows, chunk_size))
+        except FleetFileError as error:
+            report.file_error = str(error)
+            break
+        if not chunk:
+            break
+        report.rows += len(chunk)
+
+        valid = []
+        for line, row in chunk:
+            try:
+                valid.append(validate_row(row))
+            except ValueError as error:
+                report.add_error(line, str(error))
+
+        if valid and not dry_run:
+            try:
+                _upsert_chunk(valid, report)
+                db.session.commit()
+            except Exception:
+                db.session.rollback()
+                raise
+
+    if report.rows and not dry_run:
+        bump_catalog_version()
+    report.seconds = time.perf_counter() - started
+    return report
+
+
+def _export_rows(chunk_size):
+    query = db.session.query(
+        Car.brand, Car.year, Car.description, CarModel.name, CarModel.price_per_day,
+        CarModel.mileage, CarModel.fuel_type, CarModel.transmission, CarModel.seats,
+        CarModel.air_conditioning, CarModel.image_url
+    ).join(Car, Car.id == CarModel.car_id).order_by(Car.id, CarModel.id)
+    return query.yield_per(chunk_size)
+
+
+def export_fleet(fmt='csv', chunk_size=DEFAULT_CHUNK_SIZE):
+    """Yield the catalog as CSV or JSONL text, one chunk of rows at a time."""
+    buffer = io.StringIO()
+    if fmt == 'csv':
+        writer = csv.writer(buffer)
+        writer.writerow(FLEET_COLUMNS)
+    elif fmt != 'jsonl':
+        raise ValueError(f'Unsupported format: {fmt}')
+
+    for count, row in enumerate(_export_rows(chunk_size), start=1):
+        if fmt == 'csv':
+            writer.writerow(row)
+        else:
+            buffer.write(json.dumps(dict(zip(FLEET_COLUMNS, row))) + '\n')
+        if count % chunk_size == 0:
+            yield buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate()
+    yield buffer.getvalue()
+
+
+fleet_cli = AppGroup('fleet', help='Bulk import and export of cars and car models.')
+
+
+def _format_for(path, fmt):
+    if fmt:
+        return fmt
+    return 'jsonl' if path.endswith(('.jsonl', '.ndjson')) else 'csv'
+
+
+@fleet_cli.command('import')
+@click.argument('path', type=click.Path(exists=True, dir_okay=False))
+@click.option('--format', 'fmt', type=click.Choice(['csv', 'jsonl']), help='Defaults to the file extension.')
+@click.option('--chunk-size', default=DEFAULT_CHUNK_SIZE, show_default=True)
+@click.option('--dry-run', is_flag=True, help='Validate only; write nothing.')
+def import_command(path, fmt, chunk_size, dry_run):
+    """Upsert cars and car models from a CSV or JSONL file."""
+    with open(path, newline='', encoding='utf-8') as stream:
+        report = import_fleet(read_rows(stream, _format_for(path, fmt)), chunk_size, dry_run)
+    for line, message in report.errors:
+        click.echo(f'line {line}: {message}', err=True)
+    click.echo(report.summary())
+    if report.file_error:
+        raise click.ClickException(report.file_error)
+
+
+@fleet_cli.command('export')
+@click.argument('path', type=click.Path(dir_okay=False, writable=True))
+@click.option('--format', 'fmt', type=click.Choice(['csv', 'jsonl']), help='Defaults to the file extension.')
+def export_command(path, fmt):
+    """Write every car model, with its car, to a CSV or JSONL file."""
+    with open(path, 'w', newline='', encoding='utf-8') as stream:
+        for text in export_fleet(_format_for(path, fmt)):
+            stream.write(text)
+    click.echo(f'Exported catalog to {path}')
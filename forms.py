@@ -1,7 +1,12 @@
 from flask_wtf import FlaskForm
+from flask_wtf.file import FileField, FileRequired, FileAllowed
 from wtforms import StringField, PasswordField, SubmitField, BooleanField, TextAreaField, IntegerField, FloatField, SelectField, HiddenField, DateField
 from wtforms.validators import DataRequired, Length, Email, EqualTo, ValidationError, NumberRange, Optional
+from sqlalchemy import or_
 from models import User
+from pricing import RULE_KINDS, validate_quote_dates
+from images import ALLOWED_EXTENSIONS
+from bulk import BULK_ACTIONS
 
 class LoginForm(FlaskForm):
     username = StringField('Username', validators=[DataRequired(), Length(min=2, max=64)])
@@ -16,15 +21,19 @@ class RegistrationForm(FlaskForm):
     confirm_password = PasswordField('Confirm Password', validators=[DataRequired(), EqualTo('password')])
     submit = SubmitField('Sign Up')
 
-    def validate_username(self, username):
-        user = User.query.filter_by(username=username.data).first()
-        if user:
-            raise ValidationError('Username is already taken. Please choose a different one.')
-
-    def validate_email(self, email):
-        user = User.query.filter_by(email=email.data).first()
-        if user:
-            raise ValidationError('Email is already registered. Please use a different one.')
+    def validate(self, extra_validators=None):
+        valid = super().validate(extra_validators)
+        if not self.username.errors and not self.email.errors:
+            # Both uniqueness checks in one query
+            taken = User.query.with_entities(User.username, User.email).filter(
+                or_(User.username == self.username.data, User.email == self.email.data)
+            ).all()
+            if any(username == self.username.data for username, _ in taken):
+                self.username.errors.append('Username is already taken. Please choose a different one.')
+            if any(email == self.email.data for _, email in taken):
+                self.email.errors.append('Email is already registered. Please use a different one.')
+            valid = valid and not taken
+        return valid
 
 class CarForm(FlaskForm):
     brand = StringField('Brand', validators=[DataRequired(), Length(max=100)])
@@ -49,9 +58,52 @@ class CarModelForm(FlaskForm):
     ])
     seats = IntegerField('Number of Seats', validators=[Optional(), NumberRange(min=1, max=10)])
     air_conditioning = BooleanField('Air Conditioning')
+    image_file = FileField('Upload Image', validators=[FileAllowed(ALLOWED_EXTENSIONS, 'JPEG, PNG, GIF or WebP images only.')])
     image_url = StringField('Image URL', validators=[Optional(), Length(max=255)])
     submit = SubmitField('Add Car Model')
 
+class BulkActionForm(FlaskForm):
+    action = SelectField('Action', choices=list(BULK_ACTIONS.items()))
+    value = FloatField('Percent or Price', validators=[Optional()])
+    brand = StringField('Brand', validators=[Optional(), Length(max=100)])
+    year = IntegerField('Year', validators=[Optional(), NumberRange(min=1900, max=2100)])
+    # Set by the preview page once the dry run has been shown
+    confirm = HiddenField()
+    submit = SubmitField('Preview')
+
+class PricingRuleForm(FlaskForm):
+    name = StringField('Name', validators=[DataRequired(), Length(max=100)])
+    kind = SelectField('Type', choices=list(RULE_KINDS.items()))
+    adjustment_percent = FloatField('Adjustment (%)', validators=[DataRequired(), NumberRange(min=-90, max=500)])
+    start_date = DateField('Season Start', validators=[Optional()])
+    end_date = DateField('Season End', validators=[Optional()])
+    min_days = IntegerField('Minimum Rental Days', validators=[Optional(), NumberRange(min=1)])
+    min_utilization = FloatField('Minimum Fleet Utilization (%)', validators=[Optional(), NumberRange(min=0, max=100)])
+    is_active = BooleanField('Active', default=True)
+    submit = SubmitField('Save Rule')
+
+    def validate(self, extra_validators=None):
+        if not super().validate(extra_validators):
+            return False
+        # Each rule type needs its own parameter
+        required = {
+            'season': ('start_date', 'end_date'),
+            'long_rental': ('min_days',),
+            'demand': ('min_utilization',),
+        }.get(self.kind.data, ())
+        missing = [name for name in required if getattr(self, name).data is None]
+        for name in missing:
+            getattr(self, name).errors.append('Required for this rule type.')
+        if self.kind.data == 'season' and not missing and self.end_date.data < self.start_date.data:
+            self.end_date.errors.append('Season end must be on or after its start.')
+            return False
+        return not missing
+
+class FleetImportForm(FlaskForm):
+    file = FileField('Fleet File', validators=[FileRequired(), FileAllowed(['csv', 'jsonl'], 'CSV or JSONL files only.')])
+    dry_run = BooleanField('Validate only (dry run)')
+    submit = SubmitField('Import Fleet')
+
 class SearchForm(FlaskForm):
     query = StringField('Search', validators=[Optional()])
     submit = SubmitField('Search')
@@ -64,5 +116,7 @@ class RentalForm(FlaskForm):
     
     def validate_end_date(self, end_date):
         if self.start_date.data and end_date.data:
-            if end_date.data < self.start_date.data:
-                raise ValidationError('End date must be after start date.')
+            try:
+                validate_quote_dates(self.start_date.data, end_date.data)
+            except ValueError as error:
+                raise ValidationError(str(error))
@@ -0,0 +1,72 @@
+# Gunicorn settings; the Procfile runs `gunicorn -c gunicorn.conf.py`
+import glob
+import multiprocessing
+import os
+import tempfile
+
+wsgi_app = "app:create_app()"
+
+# Build the app once in the master and fork workers from it. create_app()
+# does no database work, so workers boot without schema reflection or
+# password hashing.
+preload_app = True
+
+# Serving mode, see "Serving modes" in the README:
+#   sync     one request at a time per worker (default)
+#   gthread  GUNICORN_THREADS requests per worker, one OS thread each
+#   gevent   up to GUNICORN_WORKER_CONNECTIONS requests per worker, as greenlets
+worker_class = os.environ.get("GUNICORN_WORKER_CLASS", "sync")
+workers = int(os.environ.get("WEB_CONCURRENCY", multiprocessing.cpu_count() * 2 + 1))
+threads = int(os.environ.get("GUNICORN_THREADS", 1))
+worker_connections = int(os.environ.get("GUNICORN_WORKER_CONNECTIONS", 100))
+timeout = int(os.environ.get("GUNICORN_TIMEOUT", 30))
+
+if worker_class == "gevent":
+    # Patch before the preloaded app creates its engine, so the connection
+    # pool, caches and locks are built from cooperative primitives
+    from gevent import monkey
+
+    monkey.patch_all()
+    try:
+        # Without it psycopg2 blocks the whole worker while waiting on PostgreSQL
+        from psycogreen.gevent import patch_psycopg
+    except ImportError:
+        pass
+    else:
+        patch_psycopg()
+    requests_per_worker = worker_connections
+elif worker_class == "sync" and threads == 1:
+    requests_per_worker = 1
+else:
+    # gunicorn switches "sync" to gthread on its own when threads > 1
+    requests_per_worker = threads
+
+# One pooled connection per concurrently served request, capped so that a
+# gevent worker's hundreds of greenlets queue for connections instead of
+# exhausting the database; app.py reads these when building the engine
+os.environ.setdefault("DB_POOL_SIZE", str(min(requests_per_worker, 10)))
+os.environ.setdefault("DB_MAX_OVERFLOW", "2")
+
+# Workers write metric snapshots here so /metrics can sum all of them
+os.environ.setdefault("METRICS_DIR", os.path.join(tempfile.gettempdir(), "carrental-metrics"))
+
+
+# Rental lifecycle jobs run in their own process (the Procfile's `worker`
+# entry), never as a thread in this master: workers forked while that thread
+# held a cache or metrics lock would inherit the lock held forever
+
+
+def on_starting(server):
+    # Counters start from zero with each deploy, not from an earlier master's workers
+    for path in glob.glob(os.path.join(os.environ["METRICS_DIR"], "metrics-*.json")):
+        os.remove(path)
+
+
+def post_fork(server, worker):
+    # Never share pooled connections opened in the master with a worker
+    from app import db
+
+    flask_app = server.app.wsgi()
+    with flask_app.app_context():
+        for engine in db.engines.values():
+            engine.dispose(close=False)
@@ -0,0 +1,316 @@
+import hashlib
+import http.client
+import io
+import ipaddress
+import os
+import socket
+import threading
+import time
+import urllib.request
+from collections import namedtuple
+from urllib.parse import urlparse
+
+import click
+from flask import Blueprint, current_app, send_from_directory, url_for
+from flask.cli import AppGroup
+from sqlalchemy import select
+
+from app import db
+from cache import bump_catalog_version
+from models import CarModel
+
+try:
+    from PIL import Image, ImageOps
+except ImportError:  # pragma: no cover - without Pillow only the original is stored
+    Image = None
+
+# Widths of the generated variants; images are never upscaled
+IMAGE_WIDTHS = (320, 640, 1280)
+# Variant formats and their file extensions
+VARIANT_FORMATS = (('WEBP', 'webp'), ('JPEG', 'jpg'))
+VARIANT_QUALITY = 80
+# Transparent uploads are flattened onto this colour, as JPEG has no alpha
+BACKGROUND = (255, 255, 255)
+# Accepted uploads, recognised by their leading bytes rather than the filename
+SIGNATURES = ((b'\xff\xd8\xff', 'jpg'), (b'\x89PNG\r\n\x1a\n', 'png'), (b'GIF8', 'gif'))
+ALLOWED_EXTENSIONS = ['jpg', 'jpeg', 'png', 'gif', 'webp']
+# Files are named after their content, so they can be cached forever
+CACHE_MAX_AGE = 365 * 24 * 3600
+# Files younger than this may belong to an upload that is not committed yet
+PRUNE_GRACE_SECONDS = 3600
+
+StoredImage = namedtuple('StoredImage', 'key width height url')
+
+images = Blueprint('images', __name__)
+
+
+class ImageError(Exception):
+    pass
+
+
+def storage_dir():
+    return current_app.config['IMAGE_STORAGE_DIR']
+
+
+def variant_widths(width):
+    widths = [size for size in IMAGE_WIDTHS if size < width]
+    return widths if width > IMAGE_WIDTHS[-1] else widths + [width]
+
+
+def image_src(model, ext='jpg', width=None):
+    """URL of one variant of ``model``'s stored image, the largest by default."""
+    widths = variant_widths(model.image_width)
+    size = max((w for w in widths if w <= width), default=widths[0]) if width else widths[-1]
+    return url_for('images.media', filename=f'{model.image_key}-{size}.{ext}')
+
+
+def image_srcset(model, ext):
+    return ', '.join(
+        f"{url_for('images.media', filename=f'{model.image_key}-{size}.{ext}')} {size}w"
+        for size in variant_widths(model.image_width)
+    )
+
+
+images.add_app_template_global(image_src)
+images.add_app_template_global(image_srcset)
+
+
+def _sniff(data):
+    for signature, ext in SIGNATURES:
+        if data.startswith(signature):
+            return ext
+    if data[:4] == b'RIFF' and data[8:12] == b'WEBP':
+        return 'webp'
+    raise ImageError('Unsupported image format; use JPEG, PNG, GIF or WebP.')
+
+
+def _write(path, data):
+    # Same name means same content, so an existing file is already right
+    if os.path.exists(path):
+        return
+    # Unique per thread too: gthread workers may store the same upload at once
+    temp_path = f'{path}.{os.getpid()}.{threading.get_ident()}.tmp'
+    with open(temp_path, 'wb') as stream:
+        stream.write(data)
+    os.replace(temp_path, path)
+
+
+def _flatten(image):
+    """RGB copy of ``image`` with any transparency composited onto :data:`BACKGROUND`."""
+    if image.mode in ('RGBA', 'LA', 'PA') or 'transparency' in image.info:
+        image = image.convert('RGBA')
+        background = Image.new('RGB', image.size, BACKGROUND)
+        background.paste(image, mask=image.getchannel('A'))
+        return background
+    return image.convert('RGB')
+
+
+def _encode(image, fmt):
+    buffer = io.BytesIO()
+    if fmt == 'JPEG':
+        image.save(buffer, fmt, quality=VARIANT_QUALITY, optimize=True, progressive=True)
+    else:
+        image.save(buffer, fmt, quality=VARIANT_QUALITY, method=4)
+    return buffer.getvalue()
+
+
+def store_image(data):
+    """Store image bytes under a content hash and build its variants.
+
+    With Pillow installed, every width in :data:`IMAGE_WIDTHS` up to the
+    original's is written as WebP and JPEG; otherwise only the validated
+    original is kept. Returns a :class:`StoredImage`.
+    """
+    if len(data) > current_app.config['IMAGE_MAX_BYTES']:
+        raise ImageError('Image is too large.')
+    ext = _sniff(data)
+    key = hashlib.sha256(data).hexdigest()[:24]
+    directory = storage_dir()
+    os.makedirs(directory, exist_ok=True)
+
+    if Image is None:
+        filename = f'{key}.{ext}'
+        _write(os.path.join(directory, filename), data)
+        return StoredImage(key, None, None, url_for('images.media', filename=filename))
+
+    try:
+        image = Image.open(io.BytesIO(data))
+        if image.width * image.height > current_app.config['IMAGE_MAX_PIXELS']:
+            raise ImageError('Image dimensions are too large.')
+        image = _flatten(ImageOps.exif_transpose(image))
+    except (OSError, Image.DecompressionBombError) as error:
+        raise ImageError('The file is not a readable image.') from error
+
+    for size in variant_widths(image.width):
+        variant = image if size == image.width else image.resize(
+            (size, round(image.height * size / image.width)), Image.LANCZOS
+        )
+        for fmt, variant_ext in VARIANT_FORMATS:
+            path = os.path.join(directory, f'{key}-{size}.{variant_ext}')
+            if not os.path.exists(path):
+                _write(path, _encode(variant, fmt))
+    url = url_for('images.media', filename=f'{key}-{variant_widths(image.width)[-1]}.jpg')
+    return StoredImage(key, image.width, image.height, url)
+
+
+def _is_public(ip):
+    address = ipaddress.ip_address(ip.split('%', 1)[0])
+    if getattr(address, 'ipv4_mapped', None):
+        address = address.ipv4_mapped
+    # Excludes private, loopback, link-local (cloud metadata) and reserved ranges
+    return address.is_global and not address.is_multicast
+
+
+def _public_connection(address, timeout=socket._GLOBAL_DEFAULT_TIMEOUT, source_address=None, **kwargs):
+    """socket.create_connection() that only connects to public addresses.
+
+    The host is resolved once and the socket connects to the checked address,
+    so DNS cannot answer differently between the check and the connection.
+    """
+    host, port = address
+    try:
+        addresses = socket.getaddrinfo(host, port, type=socket.SOCK_STREAM)
+    except socket.gaierror as error:
+        raise OSError(f'Cannot resolve {host}') from error
+    if not addresses or not all(_is_public(sockaddr[0]) for *_, sockaddr in addresses):
+        raise ImageError('Image URLs must point to a public host.')
+    last_error = None
+    for family, type_, proto, _, sockaddr in addresses:
+        sock = socket.socket(family, type_, proto)
+        try:
+            if timeout is not socket._GLOBAL_DEFAULT_TIMEOUT:
+                sock.settimeout(timeout)
+            if source_address:
+                sock.bind(source_address)
+            sock.connect(sockaddr)
+            return sock
+        except OSError as error:
+            last_error = error
+            sock.close()
+    raise last_error
+
+
+class _PublicHTTPConnection(http.client.HTTPConnection):
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._create_connection = _public_connection
+
+
+class _PublicHTTPSConnection(http.client.HTTPSConnection):
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._create_connection = _public_connection
+
+
+class _PublicHTTPHandler(urllib.request.HTTPHandler):
+    def http_open(self, req):
+        return self.do_open(_PublicHTTPConnection, req)
+
+
+class _PublicHTTPSHandler(urllib.request.HTTPSHandler):
+    def https_open(self, req):
+        return self.do_open(_PublicHTTPSConnection, req, context=self._context)
+
+
+class _RedirectHandler(urllib.request.HTTPRedirectHandler):
+    max_redirections = 5
+
+    def redirect_request(self, req, fp, code, msg, headers, newurl):
+        # Each hop connects through the handlers above, so its host is checked too
+        if urlparse(newurl).scheme not in ('http', 'https'):
+            raise ImageError('Image URLs must start with http:// or https://.')
+        return super().redirect_request(req, fp, code, msg, headers, newurl)
+
+
+# No proxies from the environment: the address checks apply to the image host itself
+_opener = urllib.request.build_opener(
+    urllib.request.ProxyHandler({}), _PublicHTTPHandler, _PublicHTTPSHandler, _RedirectHandler
+)
+
+
+def fetch_image(url):
+    """Download a remote image from a public http(s) host, refusing oversized bodies.
+
+    Hosts resolving to private, loopback or link-local addresses are refused,
+    on the first request and on every redirect.
+    """
+    if urlparse(url).scheme not in ('http', 'https'):
+        raise ImageError('Image URLs must start with http:// or https://.')
+    limit = current_app.config['IMAGE_MAX_BYTES']
+    try:
+        with _opener.open(url, timeout=current_app.config['IMAGE_FETCH_TIMEOUT']) as response:
+            data = response.read(limit + 1)
+    except (OSError, ValueError, http.client.HTTPException) as error:
+        # The details stay in the log; they may describe internal hosts
+        current_app.logger.warning('Image download from %s failed: %s', url, error)
+        raise ImageError('Could not download the image.') from error
+    if len(data) > limit:
+        raise ImageError('Image is too large.')
+    return data
+
+
+def is_stored_url(url):
+    return bool(url) and url.startswith(url_for('images.media', filename=''))
+
+
+def attach_image(car_model, data):
+    stored = store_image(data)
+    car_model.image_key = stored.key
+    car_model.image_width = stored.width
+    car_model.image_height = stored.height
+    car_model.image_url = stored.url
+
+
+def detach_image(car_model, url=None):
+    car_model.image_key = car_model.image_width = car_model.image_height = None
+    car_model.image_url = url
+
+
+@images.route('/media/<path:filename>')
+def media(filename):
+    response = send_from_directory(storage_dir(), filename, max_age=CACHE_MAX_AGE)
+    response.cache_control.public = True
+    response.cache_control.immutable = True
+    return response
+
+
+images_cli = AppGroup('images', help='Local storage of car model images.')
+
+
+@images_cli.command('ingest')
+def ingest_command():
+    """Download remote image URLs into local storage and build their variants."""
+    models = db.session.scalars(
+        select(CarModel).where(CarModel.image_url.is_not(None), CarModel.image_key.is_(None))
+    ).all()
+    stored = 0
+    # The stored URLs are built with url_for, which needs a request
+    with current_app.test_request_context():
+        for car_model in models:
+            if is_stored_url(car_model.image_url):
+                continue
+            try:
+                attach_image(car_model, fetch_image(car_model.image_url))
+            except ImageError as error:
+                click.echo(f'Car model {car_model.id}: {error}', err=True)
+                continue
+            db.session.commit()
+            stored += 1
+    if stored:
+        bump_catalog_version()
+    click.echo(f'{stored} of {len(models)} images stored.')
+
+
+@images_cli.command('prune')
+def prune_command():
+    """Delete stored files no car model refers to any more."""
+    keys = set(db.session.scalars(select(CarModel.image_key).where(CarModel.image_key.is_not(None))))
+    directory = storage_dir()
+    cutoff = time.time() - PRUNE_GRACE_SECONDS
+    removed = 0
+    for filename in os.listdir(directory) if os.path.isdir(directory) else []:
+        path = os.path.join(directory, filename)
+        if filename.split('-')[0].split('.')[0] not in keys and os.path.getmtime(path) < cutoff:
+            os.remove(path)
+            removed += 1
+    click.echo(f'{removed} files removed.')
@@ -0,0 +1,457 @@
+import atexit
+import glob
+import hmac
+import json
+import logging
+import os
+import threading
+import time
+import uuid
+from bisect import bisect_left
+
+from flask import (Blueprint, abort, before_render_template, current_app, g, has_request_context,
+                   request, template_rendered)
+from sqlalchemy import event, select
+from sqlalchemy.engine import Engine
+from sqlalchemy.exc import SQLAlchemyError
+
+from cache import cache_stats
+
+logger = logging.getLogger('carrental.instrumentation')
+slow_query_logger = logging.getLogger('carrental.sql.slow')
+
+# Request latency buckets in seconds (Prometheus "le" bounds)
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+METRIC_PREFIX = 'carrental'
+
+# Rows of the Setting table shared by every worker
+ENABLED_SETTING = 'instrumentation_enabled'
+RESET_SETTING = 'metrics_reset'
+
+
+class Histogram:
+    def __init__(self, buckets=LATENCY_BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def cumulative(self):
+        total = 0
+        for bound, count in zip((*self.buckets, '+Inf'), self.counts):
+            total += count
+            yield bound, total
+
+
+class Metrics:
+    """Request and SQL metrics, rendered in Prometheus text format.
+
+    Each process records its own series. With ``directory`` set, processes
+    also write a snapshot there every ``flush_seconds`` and ``collect()``
+    sums them, so any worker can answer a scrape for all of them; without
+    it, series carry a ``pid`` label and each scrape shows one worker.
+    """
+
+    def __init__(self, directory=None, flush_seconds=5.0):
+        self.directory = directory
+        self.flush_seconds = flush_seconds
+        self._flushed_at = None
+        self._exit_hook = False
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self._lock:
+            self.latency = {}
+            self.responses = {}
+            self.sql_queries = {}
+            self.sql_seconds = {}
+            self.template_seconds = {}
+            self.slow_queries = 0
+            self.jobs = {}
+
+    def record_request(self, endpoint, method, status, seconds, queries, sql_seconds, template_seconds):
+        with self._lock:
+            histogram = self.latency.get((endpoint, method))
+            if histogram is None:
+                histogram = self.latency[(endpoint, method)] = Histogram()
+            histogram.observe(seconds)
+            key = (endpoint, method, status)
+            self.responses[key] = self.responses.get(key, 0) + 1
+            self.sql_queries[endpoint] = self.sql_queries.get(endpoint, 0) + queries
+            self.sql_seconds[endpoint] = self.sql_seconds.get(endpoint, 0.0) + sql_seconds
+            self.template_seconds[endpoint] = self.template_seconds.get(endpoint, 0.0) + template_seconds
+        self.flush()
+
+    def record_job(self, name, seconds, rows):
+        with self._lock:
+            runs, total_seconds, total_rows, _, _ = self.jobs.get(name, (0, 0.0, 0, 0.0, 0.0))
+            self.jobs[name] = (runs + 1, total_seconds + seconds, total_rows + rows, seconds, time.time())
+        self.flush()
+
+    def record_slow_query(self):
+        with self._lock:
+            self.slow_queries += 1
+
+    # Sharing between processes
+
+    def snapshot(self):
+        with self._lock:
+            return {
+                'pid': os.getpid(),
+                'latency': [[endpoint, method, histogram.counts, histogram.sum, histogram.count]
+                            for (endpoint, method), histogram in self.latency.items()],
+                'responses': [[*key, count] for key, count in self.responses.items()],
+                'sql_queries': dict(self.sql_queries),
+                'sql_seconds': dict(self.sql_seconds),
+                'template_seconds': dict(self.template_seconds),
+                'slow_queries': self.slow_queries,
+                'jobs': {name: list(values) for name, values in self.jobs.items()},
+                'caches': cache_stats(),
+            }
+
+    def flush(self, force=False):
+        """Write this process's snapshot to ``directory``, at most every ``flush_seconds``."""
+        if not self.directory:
+            return
+        now = time.monotonic()
+        if not force and self._flushed_at is not None and now - self._flushed_at < self.flush_seconds:
+            return
+        self._flushed_at = now
+        if not self._exit_hook:
+            atexit.register(self.flush, force=True)
+            self._exit_hook = True
+
+        path = os.path.join(self.directory, f'metrics-{os.getpid()}.json')
+        try:
+            os.makedirs(self.directory, exist_ok=True)
+            with open(f'{path}.tmp', 'w') as f:
+                json.dump(self.snapshot(), f)
+            os.replace(f'{path}.tmp', path)
+        except OSError:
+            logger.warning('Could not write metrics to %s', path, exc_info=True)
+
+    def _snapshots(self):
+        for path in glob.glob(os.path.join(self.directory, 'metrics-*.json')):
+            try:
+                with open(path) as f:
+                    yield path, json.load(f)
+            except (OSError, ValueError):
+                continue  # removed or being replaced; picked up next scrape
+
+    def collect(self):
+        """All processes' metrics summed, with their cache statistics.
+
+        Counters of processes that have exited are kept, as Prometheus
+        expects of counters; their cache sizes are not.
+        """
+        combined, caches = Metrics(), {}
+        pid = os.getpid()
+        snapshots = [snapshot for _, snapshot in self._snapshots() if snapshot.get('pid') != pid]
+        for snapshot in [self.snapshot(), *snapshots]:
+            combined._merge(snapshot)
+            alive = _is_alive(snapshot['pid'])
+            for name, values in snapshot['caches'].items():
+                totals = caches.setdefault(name, {'hits': 0, 'misses': 0, 'size': 0})
+                totals['hits'] += values.get('hits', 0)
+                totals['misses'] += values.get('misses', 0)
+                if alive:
+                    totals['size'] += values.get('size', 0)
+        return combined, caches
+
+    def prune(self):
+        """Drop the snapshots of processes that have exited, e.g. after a reset."""
+        if not self.directory:
+            return
+        for path, snapshot in self._snapshots():
+            if not _is_alive(snapshot['pid']):
+                try:
+                    os.remove(path)
+                except OSError:
+                    pass
+
+    def _merge(self, snapshot):
+        for endpoint, method, counts, total, count in snapshot['latency']:
+            histogram = self.latency.get((endpoint, method))
+            if histogram is None:
+                histogram = self.latency[(endpoint, method)] = Histogram()
+            histogram.counts = [a + b for a, b in zip(histogram.counts, counts)]
+            histogram.sum += total
+            histogram.count += count
+        for endpoint, method, status, count in snapshot['responses']:
+            key = (endpoint, method, status)
+            self.responses[key] = self.responses.get(key, 0) + count
+        for name in ('sql_queries', 'sql_seconds', 'template_seconds'):
+            totals = getattr(self, name)
+            for endpoint, value in snapshot[name].items():
+                totals[endpoint] = totals.get(endpoint, 0) + value
+        self.slow_queries += snapshot['slow_queries']
+        for name, (runs, seconds, rows, last, finished) in snapshot['jobs'].items():
+            current = self.jobs.get(name, (0, 0.0, 0, 0.0, 0.0))
+            # The latest duration is that of whichever process ran the job last
+            if finished < current[4]:
+                last, finished = current[3], current[4]
+            self.jobs[name] = (current[0] + runs, current[1] + seconds, current[2] + rows, last, finished)
+
+    # Exposition
+
+    def render(self, caches=None, pid=True):
+        """Prometheus text; ``pid=False`` for series summed across processes."""
+        process = {'pid': os.getpid()} if pid else {}
+        lines = []
+
+        def family(name, kind, help_text):
+            lines.append(f'# HELP {METRIC_PREFIX}_{name} {help_text}')
+            lines.append(f'# TYPE {METRIC_PREFIX}_{name} {kind}')
+
+        def sample(name, labels, value):
+            rendered = ','.join(f'{key}="{_escape(value)}"' for key, value in labels.items())
+            lines.append(f'{METRIC_PREFIX}_{name}{{{rendered}}} {value}')
+
+        with self._lock:
+            family('request_duration_seconds', 'histogram', 'Request latency by endpoint.')
+            for (endpoint, method), histogram in sorted(self.latency.items()):
+                labels = {'endpoint': endpoint, 'method': method, **process}
+                for bound, total in histogram.cumulative():
+                    sample('request_duration_seconds_bucket', {**labels, 'le': bound}, total)
+                sample('request_duration_seconds_sum', labels, round(histogram.sum, 6))
+                sample('request_duration_seconds_count', labels, histogram.count)
+
+            family('responses_total', 'counter', 'Responses by endpoint and status code.')
+            for (endpoint, method, status), count in sorted(self.responses.items()):
+                sample('responses_total', {'endpoint': endpoint, 'method': method, 'status': status, **process}, count)
+
+            family('sql_queries_total', 'counter', 'SQL statements executed while serving each endpoint.')
+            for endpoint, count in sorted(self.sql_queries.items()):
+                sample('sql_queries_total', {'endpoint': endpoint, **process}, count)
+
+            family('sql_duration_seconds_total', 'counter', 'Time spent in SQL while serving each endpoint.')
+            for endpoint, seconds in sorted(self.sql_seconds.items()):
+                sample('sql_duration_seconds_total', {'endpoint': endpoint, **process}, round(seconds, 6))
+
+            family('template_render_seconds_total', 'counter', 'Time spent rendering templates for each endpoint.')
+            for endpoint, seconds in sorted(self.template_seconds.items()):
+                sample('template_render_seconds_total', {'endpoint': endpoint, **process}, round(seconds, 6))
+
+            family('slow_queries_total', 'counter', 'SQL statements slower than the configured threshold.')
+            sample('slow_queries_total', process, self.slow_queries)
+
+            job_families = (
+                ('job_runs_total', 'counter', 'Background job runs.', 0),
+                ('job_duration_seconds_total', 'counter', 'Time spent in background jobs.', 1),
+                ('job_rows_total', 'counter', 'Rows changed by background jobs.', 2),
+                ('job_last_duration_seconds', 'gauge', 'Duration of the latest run of each job.', 3),
+            )
+            for metric, kind, help_text, index in job_families:
+                family(metric, kind, help_text)
+                for name, values in sorted(self.jobs.items()):
+                    sample(metric, {'job': name, **process}, round(values[index], 6))
+
+        stats = sorted((cache_stats() if caches is None else caches).items())
+        cache_families = (
+            ('cache_hits_total', 'counter', 'Cache hits by named cache.', 'hits'),
+            ('cache_misses_total', 'counter', 'Cache misses by named cache.', 'misses'),
+            ('cache_entries', 'gauge', 'Entries currently held by each named cache.', 'size'),
+        )
+        for metric, kind, help_text, key in cache_families:
+            family(metric, kind, help_text)
+            for name, values in stats:
+                sample(metric, {'cache': name, **process}, values.get(key, 0))
+
+        return '\n'.join(lines) + '\n'
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _is_alive(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except OSError:
+        return True  # exists, owned by someone else
+    return True
+
+
+class Instrumentation:
+    """Request timing, SQL counting, slow-query logging and ``/metrics``.
+
+    Everything is gated on ``enabled``. The admin dashboard stores the
+    toggle in the Setting table, and each worker re-reads it every
+    ``sync_seconds`` at the start of a request; when off, each hook costs an
+    attribute check and a clock read.
+    """
+
+    def __init__(self, app=None):
+        self.enabled = False
+        self.slow_query_seconds = 0.0
+        self.sync_seconds = 5.0
+        self.metrics = Metrics()
+        self._synced_at = None
+        self._reset_token = None
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self.enabled = app.config['INSTRUMENTATION_ENABLED']
+        self.slow_query_seconds = app.config['SLOW_QUERY_MS'] / 1000
+        self.sync_seconds = app.config['INSTRUMENTATION_SYNC_SECONDS']
+        self.metrics.directory = app.config['METRICS_DIR']
+        self.metrics.flush_seconds = self.sync_seconds
+        self._synced_at = None
+        app.extensions['instrumentation'] = self
+
+        app.before_request(self._start_request)
+        app.after_request(self._finish_request)
+        before_render_template.connect(self._start_template, app)
+        template_rendered.connect(self._finish_template, app)
+        app.register_blueprint(metrics_blueprint)
+
+        # Engine events are registered once per process, for every engine
+        if not event.contains(Engine, 'before_cursor_execute', _before_cursor_execute):
+            event.listen(Engine, 'before_cursor_execute', _before_cursor_execute)
+            event.listen(Engine, 'after_cursor_execute', _after_cursor_execute)
+
+    def sync(self):
+        """Pick up the toggle and reset requests stored by any worker."""
+        now = time.monotonic()
+        if self._synced_at is not None and now - self._synced_at < self.sync_seconds:
+            return
+        self._synced_at = now
+
+        from models import Setting
+        db = current_app.extensions['sqlalchemy']
+        try:
+            # Its own connection, so the request's session and transaction stay untouched
+            with db.engine.connect() as connection:
+                settings = dict(connection.execute(
+                    select(Setting.name, Setting.value).where(Setting.name.in_((ENABLED_SETTING, RESET_SETTING)))
+                ).all())
+        except SQLAlchemyError:
+            # e.g. before `flask init-db` has created the table
+            logger.warning('Could not read the instrumentation settings', exc_info=True)
+            return
+        self._apply(settings)
+
+    def update(self, enabled, reset=False):
+        """Store the toggle, and optionally a metrics reset, for every worker."""
+        from models import Setting
+        db = current_app.extensions['sqlalchemy']
+        settings = {ENABLED_SETTING: '1' if enabled else '0'}
+        if reset:
+            settings[RESET_SETTING] = uuid.uuid4().hex
+        for name, value in settings.items():
+            db.session.merge(Setting(name=name, value=value))
+        db.session.commit()
+        self._apply(settings)
+        if reset:
+            self.metrics.prune()
+
+    def _apply(self, settings):
+        if ENABLED_SETTING in settings:
+            self.enabled = settings[ENABLED_SETTING] == '1'
+        token = settings.get(RESET_SETTING)
+        if token is not None and token != self._reset_token:
+            self._reset_token = token
+            self.metrics.reset()
+            self.metrics.flush(force=True)
+
+    def _start_request(self):
+        self.sync()
+        if not self.enabled:
+            return
+        g.instrumentation = {
+            'started': time.perf_counter(),
+            'queries': 0,
+            'sql_seconds': 0.0,
+            'template_seconds': 0.0,
+            'template_started': [],
+        }
+
+    def _finish_request(self, response):
+        timings = g.pop('instrumentation', None)
+        if timings is None:
+            return response
+        seconds = time.perf_counter() - timings['started']
+        endpoint = request.endpoint or 'unmatched'
+        self.metrics.record_request(
+            endpoint, request.method, response.status_code, seconds,
+            timings['queries'], timings['sql_seconds'], timings['template_seconds']
+        )
+        # Visible in the browser's network panel for the request in question
+        response.headers['Server-Timing'] = (
+            f'app;dur={seconds * 1000:.1f}, '
+            f'db;dur={timings["sql_seconds"] * 1000:.1f};desc="{timings["queries"]} queries", '
+            f'tpl;dur={timings["template_seconds"] * 1000:.1f}'
+        )
+        return response
+
+    def _start_template(self, sender, template, context, **extra):
+        timings = g.get('instrumentation')
+        if timings is not None:
+            timings['template_started'].append(time.perf_counter())
+
+    def _finish_template(self, sender, template, context, **extra):
+        timings = g.get('instrumentation')
+        if timings is not None and timings['template_started']:
+            started = timings['template_started'].pop()
+            # Only count the outermost render; includes are part of it
+            if not timings['template_started']:
+                timings['template_seconds'] += time.perf_counter() - started
+
+
+def get_instrumentation():
+    return current_app.extensions['instrumentation']
+
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    conn.info.setdefault('query_started', []).append(time.perf_counter())
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    started = conn.info.get('query_started')
+    if not started:
+        return
+    seconds = time.perf_counter() - started.pop()
+    if not has_request_context():
+        return
+    instrumentation = current_app.extensions.get('instrumentation')
+    timings = g.get('instrumentation')
+    if instrumentation is None or timings is None:
+        return
+
+    timings['queries'] += 1
+    timings['sql_seconds'] += seconds
+    if instrumentation.slow_query_seconds and seconds >= instrumentation.slow_query_seconds:
+        instrumentation.metrics.record_slow_query()
+        slow_query_logger.warning(
+            'Slow query (%.1f ms) in %s: %s', seconds * 1000, request.endpoint, ' '.join(statement.split())
+        )
+
+
+metrics_blueprint = Blueprint('metrics', __name__)
+
+
+@metrics_blueprint.route('/metrics')
+def metrics():
+    # Scrapers authenticate with a bearer token when METRICS_TOKEN is set
+    token = current_app.config.get('METRICS_TOKEN')
+    if token:
+        scheme, _, supplied = request.headers.get('Authorization', '').partition(' ')
+        if scheme != 'Bearer' or not hmac.compare_digest(supplied.encode(), token.encode()):
+            abort(401)
+    metrics = get_instrumentation().metrics
+    if metrics.directory:
+        # Every worker's series summed, whichever worker answers the scrape
+        combined, caches = metrics.collect()
+        body = combined.render(caches, pid=False)
+    else:
+        body = metrics.render()
+    return current_app.response_class(body, mimetype='text/plain; version=0.0.4')
@@ -0,0 +1,136 @@
+import logging
+import threading
+import time
+from datetime import date, datetime
+
+import click
+from flask import current_app
+from flask.cli import AppGroup
+from sqlalchemy import select, update
+
+from app import db
+from analytics import refresh_rollups
+from availability import as_datetime, free_between
+from cache import bump_catalog_version
+from models import CarModel, Rental
+
+logger = logging.getLogger('carrental.jobs')
+
+# Rentals transitioned per transaction, so row locks are held briefly
+DEFAULT_BATCH_SIZE = 1000
+
+
+def _record(name, started, rows):
+    seconds = time.perf_counter() - started
+    instrumentation = current_app.extensions.get('instrumentation')
+    if instrumentation is not None:
+        instrumentation.metrics.record_job(name, seconds, rows)
+    logger.info('%s: %d rows in %.3fs', name, rows, seconds)
+    return rows
+
+
+def complete_expired_rentals(today=None, batch_size=DEFAULT_BATCH_SIZE):
+    """Mark active rentals whose last day is before ``today`` as completed.
+
+    Runs as repeated ``UPDATE ... WHERE id IN (SELECT ... LIMIT n)``
+    batches, each committed on its own; re-running is a no-op.
+    """
+    started = time.perf_counter()
+    cutoff = as_datetime(today or date.today())
+    total = 0
+    while True:
+        batch = select(Rental.id).where(
+            Rental.status == 'active',
+            Rental.end_date < cutoff
+        ).limit(batch_size)
+        result = db.session.execute(
+            update(Rental)
+            .where(Rental.id.in_(batch.scalar_subquery()))
+            .values(status='completed', updated_at=datetime.utcnow())
+            .execution_options(synchronize_session=False)
+        )
+        db.session.commit()
+        total += result.rowcount
+        if result.rowcount < batch_size:
+            break
+    return _record('complete_expired_rentals', started, total)
+
+
+def recompute_availability(today=None):
+    """Set ``CarModel.is_available`` to whether the model is free ``today``.
+
+    Only rows whose flag actually changes are written, so ``updated_at`` and
+    the catalog cache are left alone when nothing moved.
+    """
+    started = time.perf_counter()
+    today = today or date.today()
+    free_today = free_between(today, today)
+    result = db.session.execute(
+        update(CarModel)
+        .where(CarModel.is_available.is_distinct_from(free_today))
+        .values(is_available=free_today)
+        .execution_options(synchronize_session=False)
+    )
+    db.session.commit()
+    return _record('recompute_availability', started, result.rowcount)
+
+
+def refresh_analytics():
+    started = time.perf_counter()
+    return _record('refresh_analytics', started, refresh_rollups())
+
+
+def run_jobs(today=None, batch_size=DEFAULT_BATCH_SIZE):
+    completed = complete_expired_rentals(today, batch_size)
+    changed = recompute_availability(today)
+    # After the expiry sweep, so completed rentals are folded in this run
+    refreshed = refresh_analytics()
+    if changed or refreshed:
+        # Fresh rollups also move the demand tiers of the pricing calendars
+        bump_catalog_version()
+    return {'completed_rentals': completed, 'availability_changes': changed, 'rentals_rolled_up': refreshed}
+
+
+def start_scheduler(app, interval):
+    """Run :func:`run_jobs` every ``interval`` seconds in a daemon thread.
+
+    Every job is idempotent, so overlapping schedulers (e.g. one per host)
+    only repeat work rather than corrupt it.
+    """
+    def loop():
+        while True:
+            with app.app_context():
+                try:
+                    run_jobs()
+                except Exception:
+                    logger.exception('Scheduled rental jobs failed')
+                finally:
+                    db.session.remove()
+            time.sleep(interval)
+
+    thread = threading.Thread(target=loop, name='rental-jobs', daemon=True)
+    thread.start()
+    return thread
+
+
+jobs_cli = AppGroup('jobs', help='Rental lifecycle and availability maintenance.')
+
+
+@jobs_cli.command('run')
+@click.option('--batch-size', default=DEFAULT_BATCH_SIZE, show_default=True)
+def run_command(batch_size):
+    """Complete expired rentals, recompute availability and refresh analytics once."""
+    result = run_jobs(batch_size=batch_size)
+    click.echo(f"{result['completed_rentals']} rentals completed, "
+               f"{result['availability_changes']} availability flags changed, "
+               f"{result['rentals_rolled_up']} rentals rolled up for analytics")
+
+
+@jobs_cli.command('worker')
+@click.option('--interval', type=int, help='Seconds between runs (default: JOBS_INTERVAL).')
+def worker_command(interval):
+    """Run the jobs forever, every INTERVAL seconds."""
+    app = current_app._get_current_object()
+    interval = interval or app.config['JOBS_INTERVAL'] or 300
+    click.echo(f'Running rental jobs every {interval}s')
+    start_scheduler(app, interval).join()
@@ -1,5 +1,21 @@
-from app import app
+import os
+
+from app import create_app
+from commands import init_db, seed_admin
+from jobs import start_scheduler
+
+app = create_app()
 
 if __name__ == "__main__":
+    # The dev server sets up the database itself; production runs
+    # `flask init-db` and `flask seed-admin` once per deploy instead
+    with app.app_context():
+        init_db()
+        seed_admin(app.config["ADMIN_USERNAME"], app.config["ADMIN_EMAIL"], app.config["ADMIN_PASSWORD"])
+
+    # The reloader re-runs this module in a child process; schedule jobs there only
+    if app.config["JOBS_INTERVAL"] and os.environ.get("WERKZEUG_RUN_MAIN") == "true":
+        start_scheduler(app, app.config["JOBS_INTERVAL"])
+
     # Bind only to localhost so the app is accessible only on this machine
     app.run(host="127.0.0.1", port=5000, debug=True)
@@ -1,10 +1,35 @@
 from app import db, login_manager
+from flask import request
 from flask_login import UserMixin
 from datetime import datetime
+from sqlalchemy import event
+from sqlalchemy.orm import make_transient_to_detached
+
+from cache import get_cache
 
 @login_manager.user_loader
 def load_user(user_id):
-    return User.query.get(int(user_id))
+    user_id = int(user_id)
+    cache = get_cache('identity')
+    
+    # Attach the cached snapshot to this request's session without a SELECT.
+    # The cache lives in each worker, so admin pages always read the row and
+    # admins are never cached: a demotion or deletion made in another worker
+    # must not leave admin rights behind for IDENTITY_CACHE_TTL
+    snapshot = None if request.path.startswith('/admin') else cache.get(user_id)
+    if snapshot is not None:
+        return db.session.merge(snapshot, load=False)
+    
+    user = db.session.get(User, user_id)
+    if user is not None and not user.is_admin:
+        cache.set(user_id, user_snapshot(user))
+    return user
+
+def user_snapshot(user):
+    # A detached copy of the column values, safe to share across sessions
+    snapshot = User(**{column.key: getattr(user, column.key) for column in User.__table__.columns})
+    make_transient_to_detached(snapshot)
+    return snapshot
 
 class User(UserMixin, db.Model):
     id = db.Column(db.Integer, primary_key=True)
@@ -21,6 +46,14 @@ class User(UserMixin, db.Model):
         return f'<User {self.username}>'
 
 class Car(db.Model):
+    __table_args__ = (
+        # Keyset pagination seeks on (created_at, id)
+        db.Index('ix_car_created_at_id', 'created_at', 'id'),
+        # Catalog brand facet/filter and year sort
+        db.Index('ix_car_brand', 'brand'),
+        db.Index('ix_car_year_id', 'year', 'id'),
+    )
+    
     id = db.Column(db.Integer, primary_key=True)
     brand = db.Column(db.String(100), nullable=False)
     year = db.Column(db.Integer, nullable=False)
@@ -36,6 +69,16 @@ class Car(db.Model):
         return f'<Car {self.brand} ({self.year})>'
 
 class CarModel(db.Model):
+    __table_args__ = (
+        db.Index('ix_car_model_created_at_id', 'created_at', 'id'),
+        db.Index('ix_car_model_available_created_at_id', 'is_available', 'created_at', 'id'),
+        # Catalog price sort and the fuel type / transmission facets
+        db.Index('ix_car_model_available_price_id', 'is_available', 'price_per_day', 'id'),
+        db.Index('ix_car_model_available_fuel_transmission', 'is_available', 'fuel_type', 'transmission'),
+        # Joins from cars (year sort, brand facet and filter)
+        db.Index('ix_car_model_car_id_available', 'car_id', 'is_available'),
+    )
+    
     id = db.Column(db.Integer, primary_key=True)
     car_id = db.Column(db.Integer, db.ForeignKey('car.id'), nullable=False)
     name = db.Column(db.String(100), nullable=False)
@@ -46,7 +89,13 @@ class CarModel(db.Model):
     seats = db.Column(db.Integer)
     air_conditioning = db.Column(db.Boolean, default=False)
     image_url = db.Column(db.String(255))
+    # Content hash and size of the locally stored image (see images.py)
+    image_key = db.Column(db.String(64))
+    image_width = db.Column(db.Integer)
+    image_height = db.Column(db.Integer)
     is_available = db.Column(db.Boolean, default=True)
+    # False while pulled from the fleet (e.g. for maintenance); never bookable
+    in_service = db.Column(db.Boolean, default=True, nullable=False)
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
     
@@ -57,6 +106,17 @@ class CarModel(db.Model):
         return f'<CarModel {self.name} for {self.car.brand}>'
 
 class Rental(db.Model):
+    __table_args__ = (
+        db.Index('ix_rental_status_created_at_id', 'status', 'created_at', 'id'),
+        db.Index('ix_rental_user_created_at_id', 'user_id', 'created_at', 'id'),
+        # Serves the overlap check in availability.py
+        db.Index('ix_rental_availability', 'car_model_id', 'status', 'start_date', 'end_date'),
+        # Serves the expiry sweep in jobs.py
+        db.Index('ix_rental_status_end_date', 'status', 'end_date'),
+        # Serves the change feed read by analytics.refresh_rollups()
+        db.Index('ix_rental_updated_at_id', 'updated_at', 'id'),
+    )
+    
     id = db.Column(db.Integer, primary_key=True)
     user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
     car_model_id = db.Column(db.Integer, db.ForeignKey('car_model.id'), nullable=False)
@@ -69,3 +129,89 @@ class Rental(db.Model):
     
     def __repr__(self):
         return f'<Rental {self.user_id} - {self.car_model_id}>'
+
+# Analytics rollups, maintained incrementally by analytics.refresh_rollups()
+class RentalDailyStat(db.Model):
+    __table_args__ = (
+        db.Index('ix_rental_daily_stat_day', 'day'),
+    )
+    
+    # No foreign key: history outlives car models removed from the catalog
+    car_model_id = db.Column(db.Integer, primary_key=True)
+    day = db.Column(db.Date, primary_key=True)
+    booked_days = db.Column(db.Integer, nullable=False, default=0)
+    revenue = db.Column(db.Float, nullable=False, default=0.0)
+    rentals_started = db.Column(db.Integer, nullable=False, default=0)
+    rental_days_started = db.Column(db.Integer, nullable=False, default=0)
+    
+    def __repr__(self):
+        return f'<RentalDailyStat {self.car_model_id} {self.day}>'
+
+class RentalMonthlyStat(db.Model):
+    # RentalDailyStat summed per calendar month; ``month`` is its first day
+    car_model_id = db.Column(db.Integer, primary_key=True)
+    month = db.Column(db.Date, primary_key=True, index=True)
+    booked_days = db.Column(db.Integer, nullable=False, default=0)
+    revenue = db.Column(db.Float, nullable=False, default=0.0)
+    rentals_started = db.Column(db.Integer, nullable=False, default=0)
+    rental_days_started = db.Column(db.Integer, nullable=False, default=0)
+    
+    def __repr__(self):
+        return f'<RentalMonthlyStat {self.car_model_id} {self.month}>'
+
+class RentalRollupEntry(db.Model):
+    # What each rental currently contributes to the rollups, so a changed
+    # rental can be subtracted before it is re-added
+    rental_id = db.Column(db.Integer, primary_key=True)
+    car_model_id = db.Column(db.Integer, nullable=False)
+    start_day = db.Column(db.Date, nullable=False)
+    end_day = db.Column(db.Date, nullable=False)
+    total_price = db.Column(db.Float, nullable=False)
+    
+    def __repr__(self):
+        return f'<RentalRollupEntry {self.rental_id}>'
+
+class AnalyticsWatermark(db.Model):
+    name = db.Column(db.String(50), primary_key=True)
+    updated_at = db.Column(db.DateTime, nullable=False)
+    rental_id = db.Column(db.Integer, nullable=False, default=0)
+
+
+# Price adjustments applied by pricing.py; see PricingRule.kind for the types
+class PricingRule(db.Model):
+    id = db.Column(db.Integer, primary_key=True)
+    name = db.Column(db.String(100), nullable=False)
+    # 'season', 'weekend', 'long_rental' or 'demand'
+    kind = db.Column(db.String(20), nullable=False)
+    # Percentage change to the daily rate: 20 is a surcharge, -10 a discount
+    adjustment_percent = db.Column(db.Float, nullable=False)
+    # Season rules: the inclusive date range they cover
+    start_date = db.Column(db.Date)
+    end_date = db.Column(db.Date)
+    # Long-rental rules: the shortest rental they apply to
+    min_days = db.Column(db.Integer)
+    # Demand rules: the share of the fleet booked on a day, in percent
+    min_utilization = db.Column(db.Float)
+    is_active = db.Column(db.Boolean, default=True, nullable=False)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+    
+    def __repr__(self):
+        return f'<PricingRule {self.kind} {self.name}>'
+
+
+# Runtime settings shared by every worker, e.g. the instrumentation toggle
+class Setting(db.Model):
+    name = db.Column(db.String(50), primary_key=True)
+    value = db.Column(db.String(255), nullable=False)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+
+    def __repr__(self):
+        return f'<Setting {self.name}={self.value}>'
+
+
+# Drop cached identities whenever the underlying user row changes
+@event.listens_for(User, 'after_update')
+@event.listens_for(User, 'after_delete')
+def invalidate_cached_user(mapper, connection, target):
+    get_cache('identity').delete(target.id)
@@ -0,0 +1,351 @@
+import calendar
+import threading
+import time
+from datetime import date, datetime, timedelta
+from functools import reduce
+from operator import or_
+
+from flask import current_app
+from sqlalchemy import and_, select, true
+
+from app import db
+from availability import BLOCKING_STATUSES, as_datetime, free_between
+from models import CarModel, Rental
+
+# Rows changed shortly before the last sync are read again, in case their
+# transaction committed after it
+SYNC_OVERLAP = timedelta(minutes=5)
+# Most model ids bound into one listing query; beyond this SQL's own
+# NOT EXISTS subquery is cheaper than the parameter list
+MAX_BOUND_IDS = 200
+
+
+def _bits(value):
+    # Indices of the set bits, lowest first; bin() and find() walk them at C
+    # speed, where peeling off one bit at a time copies the whole integer
+    digits = bin(value)[:1:-1]
+    index = digits.find('1')
+    while index != -1:
+        yield index
+        index = digits.find('1', index + 1)
+
+
+def _day(value):
+    return value.date() if isinstance(value, datetime) else value
+
+
+class OccupancyIndex:
+    """Booked days of every car model as bitmaps, from today to ``horizon`` days ahead.
+
+    The same bits are kept both ways round: ``_days[d]`` has bit ``slot``
+    set when the model in that slot is booked on ``origin + d``, and
+    ``_models[slot]`` has bit ``d`` set for the same booking. Fleet-wide
+    range questions OR one integer per day of the range; questions about one
+    model shift and mask one integer. Memory is about ``2 * horizon * models``
+    bits, e.g. about 460 KB for 5,000 models a year ahead.
+
+    Bookings and cancellations in this process update the bits in place;
+    changes made elsewhere (other workers, jobs, admin edits) are picked up
+    every ``sync_seconds`` from ``updated_at``, and everything is rebuilt
+    when the date changes.
+    """
+
+    def __init__(self, horizon=366, sync_seconds=5):
+        self.horizon = horizon
+        self.sync_seconds = sync_seconds
+        self.origin = None
+        self._slots = {}
+        self._ids = []
+        self._days = []
+        self._models = []
+        self._in_service = 0
+        self._watermark = None
+        self._synced_at = 0.0
+        self._lock = threading.RLock()
+
+    def __contains__(self, model_id):
+        return model_id in self._slots
+
+    # Loading and syncing
+
+    def sync(self):
+        today = date.today()
+        if self.origin == today and time.monotonic() - self._synced_at < self.sync_seconds:
+            return self
+        with self._lock:
+            if self.origin != today:
+                self.rebuild(today)
+            elif time.monotonic() - self._synced_at >= self.sync_seconds:
+                self._catch_up()
+        return self
+
+    def rebuild(self, today=None):
+        today = today or date.today()
+        watermark = datetime.utcnow()
+        models = db.session.execute(select(CarModel.id, CarModel.in_service)).all()
+        rentals = db.session.execute(
+            select(Rental.car_model_id, Rental.start_date, Rental.end_date)
+            .where(Rental.status.in_(BLOCKING_STATUSES), Rental.end_date >= as_datetime(today))
+        ).all()
+        with self._lock:
+            self.load(today, models, rentals)
+            self._watermark = watermark
+            self._synced_at = time.monotonic()
+
+    def load(self, today, models, rentals):
+        """Replace the index with ``(id, in_service)`` models and ``(model_id, start, end)`` bookings."""
+        with self._lock:
+            self.origin = today
+            self._ids = [model_id for model_id, _ in models]
+            self._slots = {model_id: slot for slot, model_id in enumerate(self._ids)}
+            self._in_service = sum(1 << slot for slot, (_, in_service) in enumerate(models) if in_service)
+            self._models = [0] * len(self._ids)
+            for model_id, start_date, end_date in rentals:
+                slot = self._slots.get(model_id)
+                if slot is not None:
+                    self._models[slot] |= self._mask(start_date, end_date)
+
+            # Transposed a byte at a time, then turned into one integer per day
+            rows = [bytearray((len(self._ids) + 7) // 8) for _ in range(self.horizon)]
+            for slot, days in enumerate(self._models):
+                for day in _bits(days):
+                    rows[day][slot >> 3] |= 1 << (slot & 7)
+            self._days = [int.from_bytes(row, 'little') for row in rows]
+
+    def _catch_up(self):
+        since = self._watermark - SYNC_OVERLAP
+        self._watermark = datetime.utcnow()
+        model_ids = set(db.session.scalars(select(CarModel.id).where(CarModel.updated_at >= since)))
+        model_ids.update(db.session.scalars(
+            select(Rental.car_model_id).where(Rental.updated_at >= since).distinct()
+        ))
+        self.refresh(model_ids)
+        self._synced_at = time.monotonic()
+
+    def refresh(self, model_ids):
+        """Reload the bookings and service state of ``model_ids`` from the database."""
+        model_ids = list(model_ids)
+        if not model_ids or self.origin is None:
+            return
+        in_service = dict(db.session.execute(
+            select(CarModel.id, CarModel.in_service).where(CarModel.id.in_(model_ids))
+        ).all())
+        booked = dict.fromkeys(model_ids, 0)
+        for model_id, start_date, end_date in db.session.execute(
+            select(Rental.car_model_id, Rental.start_date, Rental.end_date).where(
+                Rental.car_model_id.in_(model_ids), Rental.status.in_(BLOCKING_STATUSES),
+                Rental.end_date >= as_datetime(self.origin)
+            )
+        ):
+            booked[model_id] |= self._mask(start_date, end_date)
+        with self._lock:
+            for model_id in model_ids:
+                # Deleted models keep their slot, empty, until the next rebuild
+                slot = self._slot(model_id)
+                self._set_days(slot, booked[model_id])
+                self._set_in_service(slot, in_service.get(model_id, False))
+
+    def add(self, model_id, start_date, end_date):
+        # A new booking only ever sets bits
+        with self._lock:
+            if self.origin is not None:
+                slot = self._slot(model_id)
+                self._set_days(slot, self._models[slot] | self._mask(start_date, end_date))
+
+    # Bit bookkeeping
+
+    def _slot(self, model_id):
+        slot = self._slots.get(model_id)
+        if slot is None:
+            slot = self._slots[model_id] = len(self._ids)
+            self._ids.append(model_id)
+            self._models.append(0)
+            # Not known to be in service until refreshed from the database
+        return slot
+
+    def _span(self, start_date, end_date):
+        # Day offsets of the range, or None when it leaves the tracked days
+        first = (_day(start_date) - self.origin).days
+        last = (_day(end_date) - self.origin).days
+        if first < 0 or last >= self.horizon or first > last:
+            return None
+        return first, last
+
+    def _mask(self, start_date, end_date):
+        # Bits of the tracked days a booking covers, clipped to the horizon
+        first = max((_day(start_date) - self.origin).days, 0)
+        last = min((_day(end_date) - self.origin).days, self.horizon - 1)
+        return ((1 << (last - first + 1)) - 1) << first if first <= last else 0
+
+    def _set_days(self, slot, days):
+        old = self._models[slot]
+        bit = 1 << slot
+        for day in _bits(old & ~days):
+            self._days[day] &= ~bit
+        for day in _bits(days & ~old):
+            self._days[day] |= bit
+        self._models[slot] = days
+
+    def _set_in_service(self, slot, in_service):
+        if in_service:
+            self._in_service |= 1 << slot
+        else:
+            self._in_service &= ~(1 << slot)
+
+    # Questions
+
+    def covers(self, start_date, end_date):
+        return self.origin is not None and self._span(start_date, end_date) is not None
+
+    def booked_model_ids(self, start_date, end_date):
+        """Ids of models booked on any day of the range; ``None`` outside the horizon."""
+        span = self.origin is not None and self._span(start_date, end_date)
+        if not span:
+            return None
+        with self._lock:
+            booked = reduce(or_, self._days[span[0]:span[1] + 1], 0)
+            return {self._ids[slot] for slot in _bits(booked)}
+
+    def free_model_ids(self, start_date, end_date):
+        """Ids of in-service models free for the whole range; ``None`` outside the horizon.
+
+        Recently deleted models may still be listed, so callers intersect
+        the result with the models they actually look up.
+        """
+        span = self.origin is not None and self._span(start_date, end_date)
+        if not span:
+            return None
+        with self._lock:
+            booked = reduce(or_, self._days[span[0]:span[1] + 1], 0)
+            return {self._ids[slot] for slot in _bits(self._in_service & ~booked)}
+
+    def is_free(self, model_id, start_date, end_date):
+        span = self.origin is not None and self._span(start_date, end_date)
+        slot = self._slots.get(model_id)
+        if not span or slot is None:
+            return None
+        with self._lock:
+            first, last = span
+            booked = (self._models[slot] >> first) & ((1 << (last - first + 1)) - 1)
+            return bool(self._in_service >> slot & 1) and not booked
+
+    def booked_days(self, model_id, start_date, end_date):
+        """Booked days of ``model_id`` within the range, clipped to the tracked days."""
+        slot = self._slots.get(model_id)
+        if self.origin is None or slot is None:
+            return set()
+        with self._lock:
+            days = self._models[slot] & self._mask(start_date, end_date)
+        return {self.origin + timedelta(days=day) for day in _bits(days)}
+
+    def booked_runs(self, model_id):
+        """Inclusive ``(start, end)`` date pairs of the model's bookings within the horizon."""
+        slot = self._slots.get(model_id)
+        if self.origin is None or slot is None:
+            return []
+        days = self._models[slot]
+        runs = []
+        while days:
+            first = (days & -days).bit_length() - 1
+            # Adding the lowest bit carries through the whole run of ones
+            last = ((days + (1 << first)) & -(days + (1 << first))).bit_length() - 2
+            runs.append((self.origin + timedelta(days=first), self.origin + timedelta(days=last)))
+            days &= ~(((1 << (last - first + 1)) - 1) << first)
+        return runs
+
+    @property
+    def last_day(self):
+        return self.origin + timedelta(days=self.horizon - 1)
+
+    def stats(self):
+        with self._lock:
+            return {
+                'origin': self.origin.isoformat() if self.origin else None,
+                'horizon_days': self.horizon,
+                'models': len(self._ids),
+                'bitmap_bytes': sum((bits.bit_length() + 7) // 8 for bits in self._days + self._models),
+            }
+
+
+def get_occupancy():
+    """The app's occupancy index for this process, built on first use and kept in sync."""
+    index = current_app.extensions.get('occupancy')
+    if index is None:
+        index = current_app.extensions.setdefault('occupancy', OccupancyIndex(
+            current_app.config['OCCUPANCY_HORIZON_DAYS'], current_app.config['OCCUPANCY_SYNC_SECONDS']
+        ))
+    return index.sync()
+
+
+def record_booking(model_id, start_date, end_date):
+    # Only an index this process has already built needs updating
+    index = current_app.extensions.get('occupancy')
+    if index is not None:
+        index.add(model_id, start_date, end_date)
+
+
+def refresh_occupancy(model_ids):
+    index = current_app.extensions.get('occupancy')
+    if index is not None:
+        index.refresh(model_ids)
+
+
+def free_clause(start_date, end_date):
+    """CarModel filter for models bookable for the whole range.
+
+    The occupancy index picks the booked (or free) models, which are inlined
+    into the query when there are at most :data:`MAX_BOUND_IDS` of them.
+    Busier ranges, and ranges beyond the horizon, use the ``NOT EXISTS``
+    subquery rather than send thousands of bind parameters.
+    """
+    index = get_occupancy()
+    booked = index.booked_model_ids(start_date, end_date)
+    if booked is None:
+        return free_between(start_date, end_date)
+    if len(booked) <= MAX_BOUND_IDS:
+        return and_(CarModel.in_service == true(), CarModel.id.not_in(booked))
+    free = index.free_model_ids(start_date, end_date)
+    if len(free) <= MAX_BOUND_IDS:
+        return and_(CarModel.in_service == true(), CarModel.id.in_(free))
+    return free_between(start_date, end_date)
+
+
+def month_calendar(model_id, month):
+    """Weeks of ``month`` as rows of ``(day, state)`` for the availability calendar.
+
+    States are ``outside`` (another month), ``past``, ``booked``, ``free``
+    and ``unknown`` (beyond the tracked days).
+    """
+    index = get_occupancy()
+    if model_id not in index:
+        index.refresh([model_id])
+    weeks = calendar.Calendar().monthdatescalendar(month.year, month.month)
+    booked = index.booked_days(model_id, weeks[0][0], weeks[-1][-1])
+    today = date.today()
+
+    def state(day):
+        if day.month != month.month:
+            return 'outside'
+        if day < today:
+            return 'past'
+        if day > index.last_day:
+            return 'unknown'
+        return 'booked' if day in booked else 'free'
+
+    return [[(day, state(day)) for day in week] for week in weeks]
+
+
+def tracked_months(model_id):
+    """``(first_day, free_days)`` for every month from this one to the end of the horizon."""
+    index = get_occupancy()
+    if model_id not in index:
+        index.refresh([model_id])
+    months = []
+    month = index.origin.replace(day=1)
+    while month <= index.last_day:
+        last = month.replace(day=calendar.monthrange(month.year, month.month)[1])
+        first, last = max(month, index.origin), min(last, index.last_day)
+        free_days = (last - first).days + 1 - len(index.booked_days(model_id, first, last))
+        months.append((month, free_days))
+        month = (month + timedelta(days=32)).replace(day=1)
+    return months
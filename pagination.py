@@ -0,0 +1,154 @@
+import base64
+import binascii
+from collections import namedtuple
+from datetime import datetime
+
+from flask import request, url_for
+from sqlalchemy import tuple_
+
+# Page size limits for every paginated listing
+DEFAULT_PER_PAGE = 20
+MAX_PER_PAGE = 100
+# Integers a cursor may carry: what a signed 64-bit database column holds
+MAX_CURSOR_INT = 2 ** 63 - 1
+
+
+class KeysetPage:
+    """One page of a keyset-paginated listing, newest first."""
+
+    def __init__(self, items, next_cursor=None, prev_cursor=None, per_page=DEFAULT_PER_PAGE):
+        self.items = items
+        self.next_cursor = next_cursor
+        self.prev_cursor = prev_cursor
+        self.per_page = per_page
+
+    @property
+    def has_next(self):
+        return self.next_cursor is not None
+
+    @property
+    def has_prev(self):
+        return self.prev_cursor is not None
+
+    def __iter__(self):
+        return iter(self.items)
+
+    def __len__(self):
+        return len(self.items)
+
+
+# Listing order for keyset pagination: ``column`` (ties broken by id),
+# direction, and a function reading the column's value off an item
+KeysetOrder = namedtuple('KeysetOrder', 'column descending value')
+
+
+def newest_first(model):
+    return KeysetOrder(model.created_at, True, lambda item: item.created_at)
+
+
+def encode_cursor(value, row_id):
+    value = value.isoformat() if isinstance(value, datetime) else value
+    raw = f'{value}|{row_id}'.encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip('=')
+
+
+def decode_cursor(token, value_type=datetime):
+    # Invalid or tampered cursors are treated as "no cursor" (first page)
+    if not token:
+        return None
+    try:
+        raw = base64.urlsafe_b64decode(token + '=' * (-len(token) % 4)).decode()
+        value, row_id = raw.rsplit('|', 1)
+        value = datetime.fromisoformat(value) if value_type is datetime else value_type(value)
+        row_id = int(row_id)
+    except (ValueError, binascii.Error, UnicodeDecodeError):
+        return None
+    # Larger integers would fail as query parameters instead of matching nothing
+    if any(isinstance(number, int) and abs(number) > MAX_CURSOR_INT for number in (value, row_id)):
+        return None
+    return value, row_id
+
+
+def clamp_per_page(value, default=DEFAULT_PER_PAGE):
+    try:
+        per_page = int(value)
+    except (TypeError, ValueError):
+        return default
+    return max(1, min(per_page, MAX_PER_PAGE))
+
+
+def keyset_paginate(query, model, after=None, before=None, per_page=DEFAULT_PER_PAGE, key=None, order=None):
+    """Seek on ``(column, id)`` so deep pages cost the same as page one.
+
+    ``order`` is a :class:`KeysetOrder` and defaults to newest first. ``key``
+    maps a result row to its ORM instance when the query returns tuples
+    (e.g. an entity plus an aggregate column).
+    """
+    key = key or (lambda row: row)
+    order = order or newest_first(model)
+    column = order.column
+    sort_key = tuple_(column, model.id)
+    value_type = column.type.python_type
+    after, before = decode_cursor(after, value_type), decode_cursor(before, value_type)
+
+    def forward(query):
+        if order.descending:
+            return query.order_by(column.desc(), model.id.desc())
+        return query.order_by(column.asc(), model.id.asc())
+
+    def backward(query):
+        if order.descending:
+            return query.order_by(column.asc(), model.id.asc())
+        return query.order_by(column.desc(), model.id.desc())
+
+    if before is not None:
+        # Walk backwards towards the start, then restore the listing order
+        cursor = tuple_(*before)
+        rows = backward(query.filter(sort_key > cursor if order.descending else sort_key < cursor)).limit(
+            per_page + 1
+        ).all()
+        has_more = len(rows) > per_page
+        items = list(reversed(rows[:per_page]))
+        has_next, has_prev = True, has_more
+    else:
+        if after is not None:
+            cursor = tuple_(*after)
+            query = query.filter(sort_key < cursor if order.descending else sort_key > cursor)
+        rows = forward(query).limit(per_page + 1).all()
+        items = rows[:per_page]
+        has_next, has_prev = len(rows) > per_page, after is not None
+
+    next_cursor = prev_cursor = None
+    if items:
+        first, last = key(items[0]), key(items[-1])
+        if has_next:
+            next_cursor = encode_cursor(order.value(last), last.id)
+        if has_prev:
+            prev_cursor = encode_cursor(order.value(first), first.id)
+    return KeysetPage(items, next_cursor, prev_cursor, per_page)
+
+
+def paginate_request(query, model, prefix='', key=None, order=None):
+    # Read cursors and page size from the query string, namespaced by prefix
+    # so several listings can be paginated independently on one page
+    return keyset_paginate(
+        query, model,
+        after=request.args.get(f'{prefix}after'),
+        before=request.args.get(f'{prefix}before'),
+        per_page=clamp_per_page(request.args.get('per_page')),
+        key=key,
+        order=order,
+    )
+
+
+def page_url(prefix='', after=None, before=None):
+    # Build a link to the current view, keeping other listings' cursors and
+    # repeated filter values intact
+    args = request.args.to_dict(flat=False)
+    args.pop(f'{prefix}after', None)
+    args.pop(f'{prefix}before', None)
+    if after:
+        args[f'{prefix}after'] = after
+    if before:
+        args[f'{prefix}before'] = before
+    return url_for(request.endpoint, **(request.view_args or {}), **args)
@@ -0,0 +1,129 @@
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from flask import current_app
+from werkzeug.security import DEFAULT_PBKDF2_ITERATIONS, check_password_hash, generate_password_hash
+
+# Werkzeug's scrypt parameters when the method names none
+SCRYPT_DEFAULTS = '32768:8:1'
+
+
+class HashingBusy(Exception):
+    """Raised when the hashing queue is full; callers should answer 503."""
+
+
+def normalize_method(method):
+    """Spell ``method`` out as werkzeug records it in a hash, defaults included.
+
+    ``pbkdf2`` and ``pbkdf2:sha256`` both become ``pbkdf2:sha256:600000``,
+    so stored hashes compare equal to the configured method.
+    """
+    name, *args = method.split(':')
+    if name == 'pbkdf2' and len(args) < 2:
+        return f"pbkdf2:{args[0] if args else 'sha256'}:{DEFAULT_PBKDF2_ITERATIONS}"
+    if name == 'scrypt' and not args:
+        return f'scrypt:{SCRYPT_DEFAULTS}'
+    return method
+
+
+def _gevent_threadpool():
+    # Under gevent, threading is patched into greenlets; only the hub's
+    # native threadpool keeps hashing off the event loop
+    try:
+        from gevent import get_hub, monkey
+    except ImportError:
+        return None
+    return get_hub().threadpool if monkey.is_module_patched('threading') else None
+
+
+class PasswordHasher:
+    """Hashes and verifies passwords on a bounded pool of native threads.
+
+    hashlib releases the GIL while hashing, so the pool spreads work over
+    every core even inside one worker process, and the request thread (or
+    greenlet) only waits. At most ``workers + queue`` hashes are in flight
+    per process; beyond that callers get :class:`HashingBusy` straight away
+    instead of piling up behind a sign-in burst.
+    """
+
+    def __init__(self, app=None):
+        self.method = normalize_method('pbkdf2')
+        self.workers = 1
+        self.slots = None
+        self._executor = None
+        self._executor_pid = None
+        self._dummy_hash = None
+        self._lock = threading.Lock()
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self.method = normalize_method(app.config['PASSWORD_HASH_METHOD'])
+        self.workers = app.config['PASSWORD_HASH_WORKERS']
+        self.slots = threading.BoundedSemaphore(self.workers + app.config['PASSWORD_HASH_QUEUE'])
+        app.extensions['passwords'] = self
+
+    def _pool(self):
+        # Created lazily and again after a fork, as threads do not survive one
+        with self._lock:
+            if self._executor is None or self._executor_pid != os.getpid():
+                self._executor = ThreadPoolExecutor(self.workers, thread_name_prefix='password-hash')
+                self._executor_pid = os.getpid()
+            return self._executor
+
+    def _run(self, function, *args):
+        if not self.slots.acquire(blocking=False):
+            raise HashingBusy('Too many password operations in progress')
+        try:
+            threadpool = _gevent_threadpool()
+            if threadpool is not None:
+                return threadpool.apply(function, args)
+            return self._pool().submit(function, *args).result()
+        finally:
+            self.slots.release()
+
+    def hash(self, password):
+        return self._run(generate_password_hash, password, self.method)
+
+    def verify(self, password_hash, password):
+        return self._run(check_password_hash, password_hash, password)
+
+    def needs_rehash(self, password_hash):
+        return password_hash.split('$', 1)[0] != self.method
+
+    def dummy_verify(self, password):
+        # Unknown usernames cost as much as wrong passwords, so response
+        # times do not reveal which accounts exist
+        if self._dummy_hash is None:
+            self._dummy_hash = self.hash(os.urandom(16).hex())
+        self.verify(self._dummy_hash, password)
+
+
+def get_password_hasher():
+    return current_app.extensions['passwords']
+
+
+def hash_password(password):
+    return get_password_hasher().hash(password)
+
+
+def authenticate(user, password):
+    """Check ``password`` for ``user`` (which may be ``None``).
+
+    A correct password stored with outdated parameters is rehashed with the
+    configured method; the caller commits. Raises :class:`HashingBusy` when
+    the pool is saturated.
+    """
+    hasher = get_password_hasher()
+    if user is None:
+        hasher.dummy_verify(password)
+        return False
+    if not hasher.verify(user.password_hash, password):
+        return False
+    if hasher.needs_rehash(user.password_hash):
+        try:
+            user.password_hash = hasher.hash(password)
+        except HashingBusy:
+            pass  # Upgraded on a quieter sign-in
+    return True
@@ -0,0 +1,161 @@
+import calendar
+from collections import namedtuple
+from datetime import date, timedelta
+from itertools import accumulate
+
+from sqlalchemy import func, select
+
+from app import db
+from cache import cached_catalog
+from models import CarModel, PricingRule, RentalDailyStat
+
+RULE_KINDS = {
+    'season': 'Season (date range)',
+    'weekend': 'Weekend (Saturday and Sunday)',
+    'long_rental': 'Long rental (minimum days)',
+    'demand': 'Demand (minimum fleet utilization)',
+}
+
+# Plain copies of the active rules, safe to keep in the catalog cache
+Rule = namedtuple('Rule', 'kind factor start_date end_date min_days min_utilization')
+
+# Longest span one quote may price, from the earliest start to the latest
+# end, and how far ahead of today a priced range may end
+MAX_QUOTE_SPAN_DAYS = 731
+MAX_QUOTE_HORIZON_DAYS = 1096
+
+
+def validate_quote_dates(start_date, end_date, today=None):
+    """Raise ``ValueError`` unless the dates form a range :func:`quote` should price.
+
+    Ranges run forwards, lie between today and ``MAX_QUOTE_HORIZON_DAYS``
+    ahead and span fewer than ``MAX_QUOTE_SPAN_DAYS``, which bounds the
+    calendars one request builds and the months it adds to the cache.
+    """
+    today = today or date.today()
+    if end_date < start_date:
+        raise ValueError('End date must be after start date.')
+    if start_date < today:
+        raise ValueError('Dates must not be in the past.')
+    if (end_date - today).days > MAX_QUOTE_HORIZON_DAYS:
+        raise ValueError(f'Dates must be within {MAX_QUOTE_HORIZON_DAYS} days from today.')
+    if (end_date - start_date).days >= MAX_QUOTE_SPAN_DAYS:
+        raise ValueError(f'Dates must fall within {MAX_QUOTE_SPAN_DAYS} days of each other.')
+
+
+def _next_month(month):
+    # None after December 9999, the last month a date can hold
+    if month.month < 12:
+        return month.replace(month=month.month + 1)
+    return month.replace(year=month.year + 1, month=1) if month.year < date.max.year else None
+
+
+def _factor(percent):
+    return 1 + percent / 100
+
+
+def active_rules():
+    def load():
+        return [
+            Rule(rule.kind, _factor(rule.adjustment_percent), rule.start_date, rule.end_date,
+                 rule.min_days, rule.min_utilization)
+            for rule in PricingRule.query.filter_by(is_active=True).order_by(PricingRule.id)
+        ]
+    return cached_catalog('pricing:rules', load)
+
+
+def _month_utilization(first, last):
+    # Share of the fleet booked on each day, from the analytics rollups
+    fleet_size = db.session.scalar(select(func.count(CarModel.id)))
+    if not fleet_size:
+        return {}
+    rows = db.session.execute(
+        select(RentalDailyStat.day, func.sum(RentalDailyStat.booked_days))
+        .where(RentalDailyStat.day.between(first, last))
+        .group_by(RentalDailyStat.day)
+    )
+    return {day: booked * 100 / fleet_size for day, booked in rows}
+
+
+def _month_calendar(first):
+    """Price multiplier for every day of the month starting on ``first``.
+
+    Season and weekend rules multiply together; of the demand rules, only
+    the highest tier reached on a day applies.
+    """
+    last = first.replace(day=calendar.monthrange(first.year, first.month)[1])
+    rules = active_rules()
+    seasons = [rule for rule in rules if rule.kind == 'season']
+    weekends = [rule for rule in rules if rule.kind == 'weekend']
+    demand = sorted((rule for rule in rules if rule.kind == 'demand'), key=lambda rule: rule.min_utilization or 0)
+    utilization = _month_utilization(first, last) if demand else {}
+
+    factors = []
+    for offset in range(last.day):
+        day = first + timedelta(days=offset)
+        factor = 1.0
+        for rule in seasons:
+            if rule.start_date <= day <= rule.end_date:
+                factor *= rule.factor
+        if day.weekday() >= 5:
+            for rule in weekends:
+                factor *= rule.factor
+        reached = [rule for rule in demand if utilization.get(day, 0) >= (rule.min_utilization or 0)]
+        if reached:
+            factor *= reached[-1].factor
+        factors.append(factor)
+    return factors
+
+
+def daily_factors(start_date, end_date):
+    """Price multipliers for each day in ``[start_date, end_date]``.
+
+    Built from per-month calendars cached under the catalog version, which
+    rule changes and bookings bump.
+    """
+    factors = []
+    month = date(start_date.year, start_date.month, 1)
+    first_month = month
+    while month is not None and month <= end_date:
+        factors.extend(cached_catalog(f'pricing:month:{month:%Y-%m}', lambda month=month: _month_calendar(month)))
+        month = _next_month(month)
+    offset = (start_date - first_month).days
+    return factors[offset:offset + (end_date - start_date).days + 1]
+
+
+def _long_rental_factor(rules, days):
+    # The rule with the longest threshold the rental reaches wins
+    reached = [rule for rule in rules if rule.kind == 'long_rental' and days >= (rule.min_days or 0)]
+    return max(reached, key=lambda rule: rule.min_days or 0).factor if reached else 1.0
+
+
+def quote(prices, ranges):
+    """Price every model for every date range in one pass.
+
+    ``prices`` maps car model ids to their daily rate and ``ranges`` holds
+    inclusive ``(start_date, end_date)`` pairs. Returns a dict mapping
+    ``(model_id, start_date, end_date)`` to the total price. The calendar is
+    built once for the whole span and summed as prefix sums, so each quote
+    costs one subtraction and one multiplication.
+    """
+    if not prices or not ranges:
+        return {}
+    span_start = min(start for start, _ in ranges)
+    span_end = max(end for _, end in ranges)
+    prefix = [0.0, *accumulate(daily_factors(span_start, span_end))]
+    rules = active_rules()
+
+    quotes = {}
+    for start_date, end_date in ranges:
+        first = (start_date - span_start).days
+        last = (end_date - span_start).days + 1
+        weight = (prefix[last] - prefix[first]) * _long_rental_factor(rules, last - first)
+        for model_id, price_per_day in prices.items():
+            quotes[(model_id, start_date, end_date)] = round(price_per_day * weight, 2)
+    return quotes
+
+
+def quote_rental(car_model, start_date, end_date):
+    return quote({car_model.id: car_model.price_per_day}, [(start_date, end_date)])[
+        (car_model.id, start_date, end_date)
+    ]
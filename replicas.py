@@ -0,0 +1,80 @@
+import random
+import time
+from functools import wraps
+
+import sqlalchemy as sa
+from flask import current_app, g, has_request_context, session
+from flask_sqlalchemy.session import Session
+
+# Bind keys given to the replica URLs in SQLALCHEMY_BINDS
+REPLICA_BIND_PREFIX = 'replica_'
+# Cookie session key holding the time until which reads stay on the primary
+PRIMARY_UNTIL_KEY = '_primary_until'
+
+
+def replica_binds(urls):
+    return {f'{REPLICA_BIND_PREFIX}{index}': url for index, url in enumerate(urls)}
+
+
+def replica_keys():
+    return [key for key in current_app.config.get('SQLALCHEMY_BINDS', {}) if key.startswith(REPLICA_BIND_PREFIX)]
+
+
+def _is_select_text(clause):
+    return isinstance(clause, sa.TextClause) and clause.text.lstrip()[:6].upper() == 'SELECT'
+
+
+def _is_read(clause):
+    # Anything that is not a plain SELECT (locking reads, DDL, unknown raw
+    # SQL, session.connection()) goes to the primary
+    if isinstance(clause, sa.Select):
+        return clause._for_update_arg is None
+    return isinstance(clause, sa.CompoundSelect) or _is_select_text(clause)
+
+
+def _is_write(clause):
+    return isinstance(clause, (sa.UpdateBase, sa.DDLElement)) or (
+        isinstance(clause, sa.TextClause) and not _is_select_text(clause)
+    )
+
+
+class RoutingSession(Session):
+    """Sends the SELECTs of views marked with :func:`read_replica` to a replica.
+
+    Flushes and every other statement use the primary. After the first
+    write, the rest of the request reads from the primary too, so it sees
+    its own changes.
+    """
+
+    def get_bind(self, mapper=None, clause=None, bind=None, **kwargs):
+        if bind is None and has_request_context():
+            if self._flushing or _is_write(clause):
+                g.read_replica = None
+                g.wrote_primary = True
+            elif _is_read(clause):
+                replica = g.get('read_replica')
+                if replica is not None:
+                    return self._db.engines[replica]
+        return super().get_bind(mapper=mapper, clause=clause, bind=bind, **kwargs)
+
+
+def read_replica(view):
+    """Let a read-only view query a random replica, when any are configured.
+
+    Users who wrote within the last ``REPLICA_STICKY_SECONDS`` keep reading
+    from the primary, so they never miss their own changes to replica lag.
+    """
+    @wraps(view)
+    def wrapper(*args, **kwargs):
+        keys = replica_keys()
+        if keys and session.get(PRIMARY_UNTIL_KEY, 0) < time.time():
+            g.read_replica = random.choice(keys)
+        return view(*args, **kwargs)
+    return wrapper
+
+
+def remember_writes(response):
+    # Keep this user on the primary for a while after any write
+    if g.pop('wrote_primary', False) and replica_keys():
+        session[PRIMARY_UNTIL_KEY] = time.time() + current_app.config['REPLICA_STICKY_SECONDS']
+    return response
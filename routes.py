@@ -1,52 +1,85 @@
-from flask import render_template, url_for, flash, redirect, request, abort
+from flask import Blueprint, current_app, render_template, url_for, flash, redirect, request, abort, jsonify, make_response, stream_with_context
+import io
 from flask_login import login_user, current_user, logout_user, login_required
 from datetime import datetime, timedelta
-from werkzeug.security import generate_password_hash, check_password_hash
-from sqlalchemy import or_
+from sqlalchemy import delete, func, select, true
+from sqlalchemy.orm import contains_eager, joinedload
 
-from app import app, db
-from models import User, Car, CarModel, Rental
-from forms import LoginForm, RegistrationForm, CarForm, CarModelForm, SearchForm, RentalForm
+from app import db
+from models import User, Car, CarModel, PricingRule, Rental
+from forms import (LoginForm, RegistrationForm, CarForm, CarModelForm, SearchForm, RentalForm, FleetImportForm, PricingRuleForm,
+                   BulkActionForm)
+from pagination import paginate_request, page_url
+from search_index import search_car_models
+from availability import is_available, parse_date
+from booking import BookingConflict, create_booking
+from pricing import RULE_KINDS, quote, validate_quote_dates
+from images import ImageError, attach_image, detach_image, fetch_image
+from bulk import model_selection, rental_check, run_bulk
+from passwords import HashingBusy, authenticate, hash_password
+from occupancy import free_clause, get_occupancy, month_calendar, refresh_occupancy, tracked_months
+from cache import bump_catalog_version, cache_stats, cached_catalog
+from catalog import (CATALOG_SORTS, catalog_etag, catalog_facets, catalog_filters, catalog_order, filter_conditions,
+                     is_not_modified, make_conditional)
+from fleet_io import export_fleet, import_fleet, read_rows
+from instrumentation import get_instrumentation
+from replicas import read_replica
+from analytics import (REPORTS, brand_report, last_refreshed, model_report, monthly_report, refresh_rollups,
+                       report_csv, report_period)
+
+main = Blueprint('main', __name__)
+main.add_app_template_global(page_url)
 
 # Home page
-@app.route('/')
+@main.route('/')
+@read_replica
 def home():
-    # Get featured car models (limit to 6)
-    featured_models = CarModel.query.filter_by(is_available=True).limit(6).all()
-    return render_template('home.html', featured_models=featured_models)
+    etag, last_modified = catalog_etag()
+    if is_not_modified(etag):
+        return make_conditional(current_app.response_class(status=304), etag, last_modified)
+    
+    # Get featured car models (limit to 6), rendered once per catalog version
+    featured_html = cached_catalog('home:featured', lambda: render_template(
+        'partials/featured_models.html',
+        featured_models=CarModel.query.options(joinedload(CarModel.car)).filter_by(is_available=True).limit(6).all()
+    ))
+    response = make_response(render_template('home.html', featured_html=featured_html))
+    return make_conditional(response, etag, last_modified)
 
 # Authentication routes
-@app.route('/login', methods=['GET', 'POST'])
+@main.route('/login', methods=['GET', 'POST'])
 def login():
     if current_user.is_authenticated:
-        return redirect(url_for('home'))
+        return redirect(url_for('main.home'))
     
     form = LoginForm()
     if form.validate_on_submit():
         user = User.query.filter_by(username=form.username.data).first()
         
-        if user and check_password_hash(user.password_hash, form.password.data):
+        if authenticate(user, form.password.data):
+            # Saves a hash upgraded to the current PASSWORD_HASH_METHOD
+            db.session.commit()
             login_user(user, remember=form.remember.data)
             next_page = request.args.get('next')
             
             # Redirect to appropriate dashboard based on role
             if user.is_admin:
-                return redirect(next_page or url_for('admin_dashboard'))
+                return redirect(next_page or url_for('main.admin_dashboard'))
             else:
-                return redirect(next_page or url_for('user_dashboard'))
+                return redirect(next_page or url_for('main.user_dashboard'))
         else:
             flash('Login unsuccessful. Please check username and password.', 'danger')
     
     return render_template('auth/login.html', form=form)
 
-@app.route('/register', methods=['GET', 'POST'])
+@main.route('/register', methods=['GET', 'POST'])
 def register():
     if current_user.is_authenticated:
-        return redirect(url_for('home'))
+        return redirect(url_for('main.home'))
     
     form = RegistrationForm()
     if form.validate_on_submit():
-        hashed_password = generate_password_hash(form.password.data)
+        hashed_password = hash_password(form.password.data)
         user = User(
             username=form.username.data,
             email=form.email.data,
@@ -55,35 +88,91 @@ def register():
         db.session.add(user)
         db.session.commit()
         flash('Your account has been created! You can now log in.', 'success')
-        return redirect(url_for('login'))
+        return redirect(url_for('main.login'))
     
     return render_template('auth/register.html', form=form)
 
-@app.route('/logout')
+@main.errorhandler(HashingBusy)
+def hashing_busy(error):
+    # Shed sign-in bursts instead of queueing them behind the hash pool
+    flash('We are handling a lot of sign-ins right now. Please try again in a moment.', 'warning')
+    form = RegistrationForm() if request.endpoint == 'main.register' else LoginForm()
+    template = 'auth/register.html' if request.endpoint == 'main.register' else 'auth/login.html'
+    response = make_response(render_template(template, form=form), 503)
+    response.headers['Retry-After'] = '2'
+    return response
+
+@main.route('/logout')
 def logout():
     logout_user()
-    return redirect(url_for('home'))
+    return redirect(url_for('main.home'))
 
 # Admin routes
-@app.route('/admin/dashboard')
+@main.route('/admin/dashboard')
 @login_required
+@read_replica
 def admin_dashboard():
     if not current_user.is_admin:
         abort(403)
     
-    cars = Car.query.all()
-    car_models = CarModel.query.all()
-    active_rentals = Rental.query.filter_by(status='active').all()
+    # All three stats in a single round trip via scalar subqueries
+    stats_row = db.session.execute(select(
+        select(func.count(Car.id)).scalar_subquery().label('total_cars'),
+        select(func.count(CarModel.id)).scalar_subquery().label('total_models'),
+        select(func.count(Rental.id)).where(Rental.status == 'active').scalar_subquery().label('active_rentals')
+    )).one()
+    stats = dict(stats_row._mapping)
+    
+    # Per-car model counts come from a grouped subquery instead of one COUNT per row
+    model_counts = db.session.query(
+        CarModel.car_id, func.count(CarModel.id).label('model_count')
+    ).group_by(CarModel.car_id).subquery()
+    cars_query = db.session.query(Car, func.coalesce(model_counts.c.model_count, 0)).outerjoin(
+        model_counts, model_counts.c.car_id == Car.id
+    )
+    cars = paginate_request(cars_query, Car, prefix='cars_', key=lambda row: row[0])
+    
+    # Eager-load the relationships the template walks for every row
+    car_models = paginate_request(
+        CarModel.query.options(joinedload(CarModel.car)), CarModel, prefix='models_'
+    )
+    active_rentals = paginate_request(
+        Rental.query.options(
+            joinedload(Rental.renter),
+            joinedload(Rental.car_model).joinedload(CarModel.car)
+        ).filter_by(status='active'),
+        Rental, prefix='rentals_'
+    )
+    
+    return render_template('admin/dashboard.html', stats=stats, cars=cars, car_models=car_models, active_rentals=active_rentals,
+                           instrumentation=get_instrumentation(), bulk_form=BulkActionForm())
+
+@main.route('/admin/cache/stats')
+@login_required
+def admin_cache_stats():
+    if not current_user.is_admin:
+        abort(403)
     
-    stats = {
-        'total_cars': len(cars),
-        'total_models': len(car_models),
-        'active_rentals': len(active_rentals)
-    }
+    stats = cache_stats()
+    # Occupancy bitmaps of the worker that serves this request
+    if 'occupancy' in current_app.extensions:
+        stats['occupancy'] = current_app.extensions['occupancy'].stats()
+    return jsonify(stats)
+
+@main.route('/admin/instrumentation', methods=['POST'])
+@login_required
+def toggle_instrumentation():
+    if not current_user.is_admin:
+        abort(403)
     
-    return render_template('admin/dashboard.html', stats=stats, cars=cars, car_models=car_models, active_rentals=active_rentals)
+    # Stored for every worker; the others pick it up on their next sync
+    instrumentation = get_instrumentation()
+    instrumentation.update(not instrumentation.enabled, reset=bool(request.form.get('reset')))
+    flash(f"Instrumentation {'enabled' if instrumentation.enabled else 'disabled'} for all workers "
+          f"within {instrumentation.sync_seconds:g} seconds.", 'info')
+    return redirect(url_for('main.admin_dashboard'))
 
-@app.route('/admin/car/add', methods=['GET', 'POST'])
+@main.route('/admin/car/add', methods=['GET', 'POST'])
 @login_required
 def add_car():
     if not current_user.is_admin:
@@ -98,12 +187,13 @@ def add_car():
         )
         db.session.add(car)
         db.session.commit()
+        bump_catalog_version()
         flash('Car has been added successfully!', 'success')
-        return redirect(url_for('admin_dashboard'))
+        return redirect(url_for('main.admin_dashboard'))
     
     return render_template('admin/add_car.html', form=form)
 
-@app.route('/admin/car/<int:car_id>/edit', methods=['GET', 'POST'])
+@main.route('/admin/car/<int:car_id>/edit', methods=['GET', 'POST'])
 @login_required
 def edit_car(car_id):
     if not current_user.is_admin:
@@ -119,8 +209,9 @@ def edit_car(car_id):
         car.updated_at = datetime.utcnow()
         
         db.session.commit()
+        bump_catalog_version()
         flash('Car has been updated!', 'success')
-        return redirect(url_for('admin_dashboard'))
+        return redirect(url_for('main.admin_dashboard'))
     
     elif request.method == 'GET':
         form.brand.data = car.brand
@@ -129,7 +220,7 @@ def edit_car(car_id):
     
     return render_template('admin/edit_car.html', form=form, car=car)
 
-@app.route('/admin/car/<int:car_id>/delete', methods=['POST'])
+@main.route('/admin/car/<int:car_id>/delete', methods=['POST'])
 @login_required
 def delete_car(car_id):
     if not current_user.is_admin:
@@ -137,23 +228,23 @@ def delete_car(car_id):
     
     car = Car.query.get_or_404(car_id)
     
-    # Check if any car models are being rented
-    models_with_rentals = False
-    for model in car.models:
-        if Rental.query.filter_by(car_model_id=model.id, status='active').first():
-            models_with_rentals = True
-            break
+    # One aggregate over all of the car's models instead of a query per model
+    _, booked, with_rentals = rental_check(model_selection(car_ids=[car.id]))
     
-    if models_with_rentals:
+    if booked:
         flash('Cannot delete car. One or more models are currently being rented.', 'danger')
+    elif with_rentals:
+        flash('Cannot delete car. Its models have rental history; take them out of service instead.', 'danger')
     else:
+        db.session.execute(delete(CarModel).where(CarModel.car_id == car.id))
         db.session.delete(car)
         db.session.commit()
+        bump_catalog_version()
         flash('Car has been deleted!', 'success')
     
-    return redirect(url_for('admin_dashboard'))
+    return redirect(url_for('main.admin_dashboard'))
 
-@app.route('/admin/car_model/add', methods=['GET', 'POST'])
+@main.route('/admin/car_model/add', methods=['GET', 'POST'])
 @login_required
 def add_car_model():
     if not current_user.is_admin:
@@ -172,17 +263,18 @@ def add_car_model():
             fuel_type=form.fuel_type.data,
             transmission=form.transmission.data,
             seats=form.seats.data,
-            air_conditioning=form.air_conditioning.data,
-            image_url=form.image_url.data
+            air_conditioning=form.air_conditioning.data
         )
-        db.session.add(car_model)
-        db.session.commit()
-        flash('Car model has been added successfully!', 'success')
-        return redirect(url_for('admin_dashboard'))
+        if apply_image_form(car_model, form):
+            db.session.add(car_model)
+            db.session.commit()
+            bump_catalog_version()
+            flash('Car model has been added successfully!', 'success')
+            return redirect(url_for('main.admin_dashboard'))
     
     return render_template('admin/add_car_model.html', form=form)
 
-@app.route('/admin/car_model/<int:model_id>/edit', methods=['GET', 'POST'])
+@main.route('/admin/car_model/<int:model_id>/edit', methods=['GET', 'POST'])
 @login_required
 def edit_car_model(model_id):
     if not current_user.is_admin:
@@ -194,7 +286,8 @@ def edit_car_model(model_id):
     # Get all cars for the car_id select field
     form.car_id.choices = [(car.id, f"{car.brand} ({car.year})") for car in Car.query.all()]
     
-    if form.validate_on_submit():
+    # The image goes first, so a failed download leaves the model untouched
+    if form.validate_on_submit() and apply_image_form(car_model, form):
         car_model.car_id = form.car_id.data
         car_model.name = form.name.data
         car_model.price_per_day = form.price_per_day.data
@@ -203,12 +296,12 @@ def edit_car_model(model_id):
         car_model.transmission = form.transmission.data
         car_model.seats = form.seats.data
         car_model.air_conditioning = form.air_conditioning.data
-        car_model.image_url = form.image_url.data
         car_model.updated_at = datetime.utcnow()
         
         db.session.commit()
+        bump_catalog_version()
         flash('Car model has been updated!', 'success')
-        return redirect(url_for('admin_dashboard'))
+        return redirect(url_for('main.admin_dashboard'))
     
     elif request.method == 'GET':
         form.car_id.data = car_model.car_id
@@ -223,7 +316,23 @@ def edit_car_model(model_id):
     
     return render_template('admin/edit_car_model.html', form=form, car_model=car_model)
 
-@app.route('/admin/car_model/<int:model_id>/delete', methods=['POST'])
+def apply_image_form(car_model, form):
+    # An upload wins over the URL field; a new remote URL is downloaded and
+    # stored locally once, and clearing the field removes the image
+    try:
+        if form.image_file.data:
+            attach_image(car_model, form.image_file.data.read(current_app.config['IMAGE_MAX_BYTES'] + 1))
+        elif not form.image_url.data:
+            detach_image(car_model)
+        elif form.image_url.data != car_model.image_url:
+            attach_image(car_model, fetch_image(form.image_url.data))
+    except ImageError as error:
+        field = form.image_file if form.image_file.data else form.image_url
+        field.errors.append(str(error))
+        return False
+    return True
+
+@main.route('/admin/car_model/<int:model_id>/delete', methods=['POST'])
 @login_required
 def delete_car_model(model_id):
     if not current_user.is_admin:
@@ -231,121 +340,321 @@ def delete_car_model(model_id):
     
     car_model = CarModel.query.get_or_404(model_id)
     
-    # Check if the car model is being rented
-    active_rental = Rental.query.filter_by(car_model_id=model_id, status='active').first()
-    if active_rental:
+    _, booked, with_rentals = rental_check(model_selection(model_ids=[model_id]))
+    if booked:
         flash('Cannot delete car model. It is currently being rented.', 'danger')
+    elif with_rentals:
+        flash('Cannot delete car model. It has rental history; take it out of service instead.', 'danger')
     else:
         db.session.delete(car_model)
         db.session.commit()
+        bump_catalog_version()
         flash('Car model has been deleted!', 'success')
     
-    return redirect(url_for('admin_dashboard'))
+    return redirect(url_for('main.admin_dashboard'))
+
+@main.route('/admin/bulk', methods=['POST'])
+@login_required
+def admin_bulk():
+    if not current_user.is_admin:
+        abort(403)
+    
+    form = BulkActionForm()
+    model_ids = request.form.getlist('model_ids', type=int)
+    if not form.validate_on_submit():
+        flash('; '.join(error for errors in form.errors.values() for error in errors), 'danger')
+        return redirect(url_for('main.admin_dashboard'))
+    
+    # Previewed first as a dry run; the preview page posts back to apply
+    try:
+        selection = model_selection(model_ids or None, brand=form.brand.data, year=form.year.data)
+        report = run_bulk(form.action.data, selection, form.value.data, dry_run=not form.confirm.data)
+    except ValueError as error:
+        flash(str(error), 'danger')
+        return redirect(url_for('main.admin_dashboard'))
+    
+    if report.dry_run:
+        form.confirm.data = '1'
+        return render_template('admin/bulk_preview.html', form=form, model_ids=model_ids, report=report)
+    flash(report.summary(), 'success' if report.changed else 'info')
+    return redirect(url_for('main.admin_dashboard'))
+
+@main.route('/admin/fleet/import', methods=['GET', 'POST'])
+@login_required
+def import_fleet_file():
+    if not current_user.is_admin:
+        abort(403)
+    
+    form = FleetImportForm()
+    report = None
+    
+    if form.validate_on_submit():
+        # Stream the upload through the chunked importer instead of reading it whole
+        upload = form.file.data
+        fmt = 'jsonl' if upload.filename.lower().endswith('.jsonl') else 'csv'
+        stream = io.TextIOWrapper(upload.stream, encoding='utf-8', newline='')
+        report = import_fleet(read_rows(stream, fmt), dry_run=form.dry_run.data)
+        
+        if report.file_error:
+            form.file.errors.append(report.file_error)
+            flash(f'The file could not be read. {report.file_error}', 'danger')
+        elif report.error_count:
+            flash(f'{report.error_count} rows were rejected. See the report below.', 'warning')
+        else:
+            flash('Fleet file imported successfully!' if not form.dry_run.data else 'Fleet file is valid.', 'success')
+    
+    return render_template('admin/import_fleet.html', form=form, report=report)
+
+@main.route('/admin/fleet/export')
+@login_required
+def export_fleet_file():
+    if not current_user.is_admin:
+        abort(403)
+    
+    fmt = request.args.get('format', 'csv')
+    if fmt not in ('csv', 'jsonl'):
+        abort(404)
+    
+    mimetype = 'text/csv' if fmt == 'csv' else 'application/x-ndjson'
+    response = current_app.response_class(stream_with_context(export_fleet(fmt)), mimetype=mimetype)
+    response.headers['Content-Disposition'] = f'attachment; filename=fleet.{fmt}'
+    return response
+
+@main.route('/admin/reports')
+@login_required
+@read_replica
+def admin_reports():
+    if not current_user.is_admin:
+        abort(403)
+    
+    start, end = report_period(request.args)
+    return render_template(
+        'admin/reports.html',
+        start=start,
+        end=end,
+        monthly=monthly_report(start, end),
+        brands=brand_report(start, end),
+        models=model_report(start, end),
+        last_refreshed=last_refreshed()
+    )
+
+@main.route('/admin/reports/export')
+@login_required
+@read_replica
+def export_report():
+    if not current_user.is_admin:
+        abort(403)
+    
+    report = request.args.get('report', 'monthly')
+    if report not in REPORTS:
+        abort(404)
+    
+    start, end = report_period(request.args)
+    response = make_response(report_csv(REPORTS[report](start, end)))
+    response.mimetype = 'text/csv'
+    response.headers['Content-Disposition'] = f'attachment; filename={report}-{start}-{end}.csv'
+    return response
+
+@main.route('/admin/reports/refresh', methods=['POST'])
+@login_required
+def refresh_reports():
+    if not current_user.is_admin:
+        abort(403)
+    
+    processed = refresh_rollups()
+    flash(f'Reports refreshed ({processed} rentals processed).', 'success')
+    return redirect(url_for('main.admin_reports', start=request.form.get('start'), end=request.form.get('end')))
+
+@main.route('/admin/pricing', methods=['GET', 'POST'])
+@login_required
+def admin_pricing():
+    if not current_user.is_admin:
+        abort(403)
+    
+    form = PricingRuleForm()
+    if form.validate_on_submit():
+        rule = PricingRule()
+        apply_pricing_form(rule, form)
+        db.session.add(rule)
+        db.session.commit()
+        # Cached rate calendars and catalog prices depend on the rules
+        bump_catalog_version()
+        flash('Pricing rule has been added!', 'success')
+        return redirect(url_for('main.admin_pricing'))
+    
+    rules = PricingRule.query.order_by(PricingRule.kind, PricingRule.id).all()
+    return render_template('admin/pricing.html', form=form, rules=rules, rule_kinds=RULE_KINDS)
+
+@main.route('/admin/pricing/<int:rule_id>/edit', methods=['GET', 'POST'])
+@login_required
+def edit_pricing_rule(rule_id):
+    if not current_user.is_admin:
+        abort(403)
+    
+    rule = PricingRule.query.get_or_404(rule_id)
+    form = PricingRuleForm(obj=rule)
+    if form.validate_on_submit():
+        apply_pricing_form(rule, form)
+        db.session.commit()
+        bump_catalog_version()
+        flash('Pricing rule has been updated!', 'success')
+        return redirect(url_for('main.admin_pricing'))
+    
+    return render_template('admin/edit_pricing_rule.html', form=form, rule=rule)
+
+@main.route('/admin/pricing/<int:rule_id>/delete', methods=['POST'])
+@login_required
+def delete_pricing_rule(rule_id):
+    if not current_user.is_admin:
+        abort(403)
+    
+    rule = PricingRule.query.get_or_404(rule_id)
+    db.session.delete(rule)
+    db.session.commit()
+    bump_catalog_version()
+    flash('Pricing rule has been deleted!', 'success')
+    return redirect(url_for('main.admin_pricing'))
+
+def apply_pricing_form(rule, form):
+    # Only keep the parameter the rule's type uses
+    rule.name = form.name.data
+    rule.kind = form.kind.data
+    rule.adjustment_percent = form.adjustment_percent.data
+    rule.start_date = form.start_date.data if rule.kind == 'season' else None
+    rule.end_date = form.end_date.data if rule.kind == 'season' else None
+    rule.min_days = form.min_days.data if rule.kind == 'long_rental' else None
+    rule.min_utilization = form.min_utilization.data if rule.kind == 'demand' else None
+    rule.is_active = form.is_active.data
 
 # User routes
-@app.route('/user/dashboard')
+@main.route('/user/dashboard')
 @login_required
+@read_replica
 def user_dashboard():
-    car_models = CarModel.query.filter_by(is_available=True).all()
+    etag, last_modified = catalog_etag()
+    if is_not_modified(etag):
+        return make_conditional(current_app.response_class(status=304), etag, last_modified)
+    
+    # With a date range, list the models free for the whole period in one query
+    start_date = parse_date(request.args.get('start_date'))
+    end_date = parse_date(request.args.get('end_date'))
+    if start_date and end_date:
+        try:
+            validate_quote_dates(start_date, end_date)
+        except ValueError as error:
+            flash(f'{error} Showing all available cars instead.', 'warning')
+            start_date = end_date = None
+    else:
+        start_date = end_date = None
     
-    # Get car brands for filtering
-    brands = db.session.query(Car.brand).distinct().all()
-    brands = [brand[0] for brand in brands]
+    # Filters, facets and sort order all come from the query string
+    filters = catalog_filters(request.args)
+    availability = free_clause(start_date, end_date) if start_date else CarModel.is_available == true()
+    
+    def render_grid():
+        query = CarModel.query.join(CarModel.car).options(contains_eager(CarModel.car)).filter(
+            availability, *filter_conditions(filters)
+        )
+        car_models = paginate_request(query, CarModel, order=catalog_order(filters))
+        # Price the whole page for the chosen dates in one pass
+        range_prices = {}
+        if start_date:
+            quotes = quote({model.id: model.price_per_day for model in car_models}, [(start_date, end_date)])
+            range_prices = {model_id: total for (model_id, _, _), total in quotes.items()}
+        return render_template('partials/car_grid.html', car_models=car_models, range_prices=range_prices,
+                               range_days=(end_date - start_date).days + 1 if start_date else None,
+                               filtered=bool(filter_conditions(filters)))
+    
+    # The listing fragment and facet counts are cached per filter state and page
+    args_key = '&'.join(f'{key}={value}' for key, value in sorted(request.args.items(multi=True)))
+    car_grid_html = cached_catalog('dashboard:' + args_key, render_grid)
+    facet_args_key = '&'.join(
+        f'{key}={value}' for key, value in sorted(request.args.items(multi=True))
+        if key not in ('after', 'before', 'per_page', 'sort')
+    )
+    facets = cached_catalog('facets:' + facet_args_key, lambda: catalog_facets(filters, availability))
     
     # Search form
     form = SearchForm()
     
-    return render_template('user/dashboard.html', car_models=car_models, brands=brands, form=form)
+    response = make_response(render_template(
+        'user/dashboard.html', car_grid_html=car_grid_html, form=form, filters=filters, facets=facets,
+        sorts=CATALOG_SORTS, start_date=start_date, end_date=end_date
+    ))
+    return make_conditional(response, etag, last_modified)
 
-@app.route('/user/search', methods=['GET', 'POST'])
+@main.route('/user/search', methods=['GET', 'POST'])
+@read_replica
 def search():
     form = SearchForm()
     
     if form.validate_on_submit() or request.args.get('query'):
         query = form.query.data or request.args.get('query')
         
-        # Search cars and car models
-        car_results = Car.query.filter(or_(
-            Car.brand.ilike(f'%{query}%'),
-            Car.description.ilike(f'%{query}%')
-        )).all()
-        
-        car_ids = [car.id for car in car_results]
-        
-        # Find car models related to the cars or matching the query directly
-        model_results = CarModel.query.filter(or_(
-            CarModel.car_id.in_(car_ids),
-            CarModel.name.ilike(f'%{query}%'),
-            CarModel.fuel_type.ilike(f'%{query}%'),
-            CarModel.transmission.ilike(f'%{query}%')
-        )).all()
-        
-        # Get car brands for filtering
-        brands = db.session.query(Car.brand).distinct().all()
-        brands = [brand[0] for brand in brands]
+        # Ranked full-text search over brand, description and model fields
+        car_grid_html = cached_catalog(f'search:{query.strip()}', lambda: render_template(
+            'partials/car_grid.html', car_models=search_car_models(query), search_query=query
+        ))
         
         return render_template('user/dashboard.html', 
-                               car_models=model_results, 
+                               car_grid_html=car_grid_html, 
                                search_query=query, 
-                               brands=brands, 
                                form=form)
     
-    return redirect(url_for('user_dashboard'))
+    return redirect(url_for('main.user_dashboard'))
 
-@app.route('/user/car/<int:model_id>', methods=['GET', 'POST'])
+@main.route('/user/car/<int:model_id>', methods=['GET', 'POST'])
 @login_required
 def car_details(model_id):
     car_model = CarModel.query.get_or_404(model_id)
     form = RentalForm()
     
     if form.validate_on_submit():
-        # Calculate number of days and total price
-        start_date = form.start_date.data
-        end_date = form.end_date.data
-        days = (end_date - start_date).days + 1
-        total_price = days * car_model.price_per_day
-        
-        # Check if the car model is available for the requested period
-        conflicting_rentals = Rental.query.filter(
-            Rental.car_model_id == model_id,
-            Rental.status == 'active',
-            or_(
-                # Check if rental period overlaps with existing rentals
-                (Rental.start_date <= start_date) & (Rental.end_date >= start_date),
-                (Rental.start_date <= end_date) & (Rental.end_date >= end_date),
-                (Rental.start_date >= start_date) & (Rental.end_date <= end_date)
-            )
-        ).all()
-        
-        if conflicting_rentals:
-            flash('This car is already booked for the selected dates. Please choose different dates.', 'danger')
+        # Lock the model, re-check for overlapping rentals and insert atomically
+        try:
+            create_booking(current_user.id, model_id, form.start_date.data, form.end_date.data)
+        except BookingConflict:
+            # Another worker's booking this index has not synced yet
+            refresh_occupancy([model_id])
+            if car_model.in_service:
+                flash('This car is already booked for the selected dates. Please choose different dates.', 'danger')
+            else:
+                flash('This car is out of service and cannot be booked right now.', 'danger')
         else:
-            rental = Rental(
-                user_id=current_user.id,
-                car_model_id=car_model.id,
-                start_date=start_date,
-                end_date=end_date,
-                total_price=total_price,
-                status='active'
-            )
-            db.session.add(rental)
-            car_model.is_available = False
-            db.session.commit()
             flash('Car rental confirmed successfully!', 'success')
-            return redirect(url_for('my_rentals'))
+            return redirect(url_for('main.my_rentals'))
     
     form.car_model_id.data = car_model.id
     today = datetime.today().date()
     
-    return render_template('user/car_details.html', car_model=car_model, form=form, today=today)
+    # Availability calendar for the chosen month, from the occupancy bitmaps
+    months = tracked_months(model_id)
+    month = parse_date(request.args.get('month', '') + '-01') if request.args.get('month') else None
+    if month not in [first for first, _ in months]:
+        month = months[0][0]
+    
+    return render_template('user/car_details.html', car_model=car_model, form=form, today=today,
+                           month=month, months=months, weeks=month_calendar(model_id, month),
+                           booked_runs=get_occupancy().booked_runs(model_id))
 
-@app.route('/user/my_rentals')
+@main.route('/user/my_rentals')
 @login_required
 def my_rentals():
-    rentals = Rental.query.filter_by(user_id=current_user.id).order_by(Rental.created_at.desc()).all()
-    return render_template('user/my_rentals.html', rentals=rentals)
+    rentals = paginate_request(
+        Rental.query.options(joinedload(Rental.car_model).joinedload(CarModel.car)).filter_by(user_id=current_user.id),
+        Rental
+    )
+    
+    # Totals cover the whole history, not just the current page
+    rental_stats = db.session.query(
+        func.count(Rental.id).filter(Rental.status == 'active').label('active'),
+        func.count(Rental.id).filter(Rental.status == 'completed').label('completed'),
+        func.coalesce(func.sum(Rental.total_price), 0).label('total_spent')
+    ).filter(Rental.user_id == current_user.id).one()
+    
+    return render_template('user/my_rentals.html', rentals=rentals, rental_stats=rental_stats)
 
-@app.route('/user/rentals/<int:rental_id>/cancel', methods=['POST'])
+@main.route('/user/rentals/<int:rental_id>/cancel', methods=['POST'])
 @login_required
 def cancel_rental(rental_id):
     rental = Rental.query.get_or_404(rental_id)
@@ -358,27 +667,30 @@ def cancel_rental(rental_id):
     if rental.status in ['pending', 'active']:
         rental.status = 'cancelled'
         
-        # Make the car model available again
+        # The model is free today unless another booking still covers today
+        today = datetime.today().date()
         car_model = CarModel.query.get(rental.car_model_id)
-        car_model.is_available = True
+        car_model.is_available = is_available(car_model.id, today, today)
         
         db.session.commit()
+        refresh_occupancy([car_model.id])
+        bump_catalog_version()
         flash('Rental has been cancelled successfully!', 'success')
     else:
         flash('Cannot cancel this rental.', 'danger')
     
-    return redirect(url_for('my_rentals'))
+    return redirect(url_for('main.my_rentals'))
 
 # Error handlers
-@app.errorhandler(404)
+@main.app_errorhandler(404)
 def not_found_error(error):
     return render_template('errors/404.html'), 404
 
-@app.errorhandler(403)
+@main.app_errorhandler(403)
 def forbidden_error(error):
     return render_template('errors/403.html'), 403
 
-@app.errorhandler(500)
+@main.app_errorhandler(500)
 def internal_error(error):
     db.session.rollback()
     return render_template('errors/500.html'), 500
@@ -0,0 +1,228 @@
+import logging
+import re
+
+from sqlalchemy import or_, text
+from sqlalchemy.exc import DBAPIError
+from sqlalchemy.orm import joinedload
+
+from app import db
+from models import Car, CarModel
+
+# Maximum number of ranked results returned for one query
+SEARCH_LIMIT = 100
+# Longer inputs are truncated to keep the match expression small
+MAX_TERMS = 8
+
+# SQLite: an FTS5 table keyed by car_model.id, kept in sync by triggers so
+# that bulk statements and raw SQL writes are indexed too
+SQLITE_DDL = [
+    """CREATE VIRTUAL TABLE IF NOT EXISTS car_model_fts USING fts5(
+        name, brand, description, fuel_type, transmission,
+        tokenize = 'unicode61 remove_diacritics 2',
+        prefix = '2 3'
+    )""",
+    """CREATE TRIGGER IF NOT EXISTS car_model_fts_insert AFTER INSERT ON car_model BEGIN
+        INSERT INTO car_model_fts (rowid, name, brand, description, fuel_type, transmission)
+        SELECT new.id, new.name, car.brand, car.description, new.fuel_type, new.transmission
+        FROM car WHERE car.id = new.car_id;
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS car_model_fts_update
+    AFTER UPDATE OF name, car_id, fuel_type, transmission ON car_model BEGIN
+        DELETE FROM car_model_fts WHERE rowid = old.id;
+        INSERT INTO car_model_fts (rowid, name, brand, description, fuel_type, transmission)
+        SELECT new.id, new.name, car.brand, car.description, new.fuel_type, new.transmission
+        FROM car WHERE car.id = new.car_id;
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS car_model_fts_delete AFTER DELETE ON car_model BEGIN
+        DELETE FROM car_model_fts WHERE rowid = old.id;
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS car_fts_update AFTER UPDATE OF brand, description ON car BEGIN
+        DELETE FROM car_model_fts WHERE rowid IN (SELECT id FROM car_model WHERE car_id = new.id);
+        INSERT INTO car_model_fts (rowid, name, brand, description, fuel_type, transmission)
+        SELECT m.id, m.name, new.brand, new.description, m.fuel_type, m.transmission
+        FROM car_model m WHERE m.car_id = new.id;
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS car_fts_delete AFTER DELETE ON car BEGIN
+        DELETE FROM car_model_fts WHERE rowid IN (SELECT id FROM car_model WHERE car_id = old.id);
+    END""",
+]
+
+SQLITE_REBUILD = [
+    "DELETE FROM car_model_fts",
+    """INSERT INTO car_model_fts (rowid, name, brand, description, fuel_type, transmission)
+    SELECT m.id, m.name, car.brand, car.description, m.fuel_type, m.transmission
+    FROM car_model m JOIN car ON car.id = m.car_id""",
+]
+
+# Column weights for bm25(): name, brand, description, fuel_type, transmission
+SQLITE_SEARCH = """
+    SELECT rowid FROM car_model_fts
+    WHERE car_model_fts MATCH :match
+    ORDER BY bm25(car_model_fts, 10.0, 10.0, 1.0, 2.0, 2.0)
+    LIMIT :limit
+"""
+
+# PostgreSQL: a side table holding one weighted tsvector per car model with
+# a GIN index. The 'simple' configuration is used on both sides so prefix
+# queries match brand and model names without stemming surprises.
+PG_DOCUMENT = """
+    setweight(to_tsvector('simple', coalesce({m}.name, '')), 'A') ||
+    setweight(to_tsvector('simple', coalesce({c}.brand, '')), 'A') ||
+    setweight(to_tsvector('simple', coalesce({m}.fuel_type, '') || ' ' || coalesce({m}.transmission, '')), 'B') ||
+    setweight(to_tsvector('simple', coalesce({c}.description, '')), 'C')
+"""
+
+PG_DDL = [
+    """CREATE TABLE IF NOT EXISTS car_model_search (
+        car_model_id INTEGER PRIMARY KEY REFERENCES car_model (id) ON DELETE CASCADE,
+        document TSVECTOR NOT NULL
+    )""",
+    "CREATE INDEX IF NOT EXISTS ix_car_model_search_document ON car_model_search USING GIN (document)",
+    """CREATE OR REPLACE FUNCTION car_model_search_sync() RETURNS trigger AS $$
+    BEGIN
+        INSERT INTO car_model_search (car_model_id, document)
+        SELECT NEW.id, """ + PG_DOCUMENT.format(m='NEW', c='car') + """
+        FROM car WHERE car.id = NEW.car_id
+        ON CONFLICT (car_model_id) DO UPDATE SET document = EXCLUDED.document;
+        RETURN NEW;
+    END
+    $$ LANGUAGE plpgsql""",
+    "DROP TRIGGER IF EXISTS car_model_search_sync ON car_model",
+    """CREATE TRIGGER car_model_search_sync
+    AFTER INSERT OR UPDATE OF name, car_id, fuel_type, transmission ON car_model
+    FOR EACH ROW EXECUTE FUNCTION car_model_search_sync()""",
+    """CREATE OR REPLACE FUNCTION car_search_sync() RETURNS trigger AS $$
+    BEGIN
+        UPDATE car_model_search s
+        SET document = """ + PG_DOCUMENT.format(m='m', c='NEW') + """
+        FROM car_model m
+        WHERE m.car_id = NEW.id AND s.car_model_id = m.id;
+        RETURN NEW;
+    END
+    $$ LANGUAGE plpgsql""",
+    "DROP TRIGGER IF EXISTS car_search_sync ON car",
+    """CREATE TRIGGER car_search_sync
+    AFTER UPDATE OF brand, description ON car
+    FOR EACH ROW EXECUTE FUNCTION car_search_sync()""",
+]
+
+PG_REBUILD = [
+    """INSERT INTO car_model_search (car_model_id, document)
+    SELECT m.id, """ + PG_DOCUMENT.format(m='m', c='car') + """
+    FROM car_model m JOIN car ON car.id = m.car_id
+    ON CONFLICT (car_model_id) DO UPDATE SET document = EXCLUDED.document""",
+]
+
+PG_SEARCH = """
+    SELECT car_model_id FROM car_model_search
+    WHERE document @@ to_tsquery('simple', :match)
+    ORDER BY ts_rank(document, to_tsquery('simple', :match)) DESC, car_model_id
+    LIMIT :limit
+"""
+
+# Per-dialect flag recording whether the full-text index is installed
+_index_available = {}
+
+
+def _dialect():
+    return db.engine.dialect.name
+
+
+def _table_exists(name):
+    if _dialect() == 'sqlite':
+        sql = "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = :name"
+    else:
+        sql = "SELECT 1 FROM information_schema.tables WHERE table_name = :name"
+    return db.session.execute(text(sql), {'name': name}).first() is not None
+
+
+def install_search_index():
+    # Create the index, its sync triggers, and backfill it when first created
+    dialect = _dialect()
+    if dialect == 'sqlite':
+        ddl, rebuild, table = SQLITE_DDL, SQLITE_REBUILD, 'car_model_fts'
+    elif dialect == 'postgresql':
+        ddl, rebuild, table = PG_DDL, PG_REBUILD, 'car_model_search'
+    else:
+        logging.info("No full-text index for dialect %s; search falls back to ILIKE", dialect)
+        _index_available[dialect] = False
+        return False
+
+    try:
+        created = not _table_exists(table)
+        for statement in ddl:
+            db.session.execute(text(statement))
+        if created:
+            for statement in rebuild:
+                db.session.execute(text(statement))
+        db.session.commit()
+    except DBAPIError:
+        db.session.rollback()
+        logging.exception("Could not install the full-text search index; falling back to ILIKE")
+        _index_available[dialect] = False
+        return False
+
+    _index_available[dialect] = True
+    return True
+
+
+def search_index_available():
+    # Checked once per process; install_search_index() sets it directly
+    dialect = _dialect()
+    if dialect not in _index_available:
+        table = {'sqlite': 'car_model_fts', 'postgresql': 'car_model_search'}.get(dialect)
+        _index_available[dialect] = table is not None and _table_exists(table)
+    return _index_available[dialect]
+
+
+def rebuild_search_index():
+    dialect = _dialect()
+    statements = SQLITE_REBUILD if dialect == 'sqlite' else PG_REBUILD
+    for statement in statements:
+        db.session.execute(text(statement))
+    db.session.commit()
+
+
+def search_terms(query):
+    return re.findall(r'\w+', (query or '').lower())[:MAX_TERMS]
+
+
+def _match_expression(terms, dialect):
+    # Every term must match; the last one is a prefix so partial input works
+    if dialect == 'sqlite':
+        return ' '.join(f'"{term}"*' for term in terms)
+    return ' & '.join(f'{term}:*' for term in terms)
+
+
+def _ilike_search(query, limit):
+    pattern = f'%{query}%'
+    return CarModel.query.options(joinedload(CarModel.car)).join(Car).filter(or_(
+        Car.brand.ilike(pattern),
+        Car.description.ilike(pattern),
+        CarModel.name.ilike(pattern),
+        CarModel.fuel_type.ilike(pattern),
+        CarModel.transmission.ilike(pattern)
+    )).order_by(CarModel.id).limit(limit).all()
+
+
+def search_car_models(query, limit=SEARCH_LIMIT):
+    """Return car models matching ``query``, best matches first."""
+    terms = search_terms(query)
+    if not terms:
+        return []
+
+    if not search_index_available():
+        return _ilike_search(query, limit)
+
+    dialect = _dialect()
+    sql = SQLITE_SEARCH if dialect == 'sqlite' else PG_SEARCH
+    ids = db.session.execute(
+        text(sql), {'match': _match_expression(terms, dialect), 'limit': limit}
+    ).scalars().all()
+    if not ids:
+        return []
+
+    # Load the matching rows in one query and restore the ranked order
+    models = CarModel.query.options(joinedload(CarModel.car)).filter(CarModel.id.in_(ids)).all()
+    by_id = {model.id: model for model in models}
+    return [by_id[model_id] for model_id in ids if model_id in by_id]
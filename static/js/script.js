@@ -8,48 +8,80 @@ document.addEventListener('DOMContentLoaded', function() {
         return new bootstrap.Tooltip(tooltipTriggerEl);
     });
 
-    // Brand filter functionality for user dashboard
-    const brandFilter = document.getElementById('brandFilter');
-    if (brandFilter) {
-        brandFilter.addEventListener('change', function() {
-            const selectedBrand = this.value;
-            const carCards = document.querySelectorAll('.car-card');
-            
-            carCards.forEach(card => {
-                if (selectedBrand === 'all' || card.dataset.brand === selectedBrand) {
-                    card.closest('.car-column').style.display = 'block';
-                } else {
-                    card.closest('.car-column').style.display = 'none';
-                }
+    // "Select all" checkboxes toggle every checkbox with the named field
+    document.querySelectorAll('[data-select-all]').forEach(function(toggle) {
+        toggle.addEventListener('change', function() {
+            document.querySelectorAll(`input[name="${toggle.dataset.selectAll}"]`).forEach(function(checkbox) {
+                checkbox.checked = toggle.checked;
             });
         });
-    }
+    });
 
-    // Rental date validation
+    // Rental price quotes come from the same pricing engine that bills the booking
+    const rentalForm = document.getElementById('rental_form');
     const startDateInput = document.getElementById('start_date');
     const endDateInput = document.getElementById('end_date');
-    const pricePerDayElement = document.getElementById('price_per_day');
     const totalPriceElement = document.getElementById('total_price');
+    const priceNoteElement = document.getElementById('price_note');
     
-    if (startDateInput && endDateInput && pricePerDayElement && totalPriceElement) {
-        const pricePerDay = parseFloat(pricePerDayElement.dataset.price);
+    if (rentalForm && startDateInput && endDateInput && totalPriceElement) {
+        const modelId = parseInt(rentalForm.dataset.modelId, 10);
+        // Booked date ranges as "start,end" pairs of ISO dates, which compare as strings
+        const bookedRuns = (rentalForm.dataset.booked || '').split(' ').filter(Boolean).map(run => run.split(','));
+        let latestRequest = 0;
         
         function updateTotalPrice() {
-            const startDate = new Date(startDateInput.value);
-            const endDate = new Date(endDateInput.value);
-            
-            if (startDate && endDate && !isNaN(startDate) && !isNaN(endDate)) {
-                // Calculate the difference in days
-                const timeDiff = endDate - startDate;
-                const daysDiff = Math.ceil(timeDiff / (1000 * 3600 * 24)) + 1; // +1 to include the start day
-                
-                if (daysDiff > 0) {
-                    const totalPrice = daysDiff * pricePerDay;
-                    totalPriceElement.textContent = `$${totalPrice.toFixed(2)}`;
-                } else {
-                    totalPriceElement.textContent = 'Invalid date range';
-                }
+            if (!startDateInput.value || !endDateInput.value) {
+                return;
             }
+            if (endDateInput.value < startDateInput.value) {
+                totalPriceElement.textContent = 'Invalid date range';
+                priceNoteElement.textContent = '';
+                return;
+            }
+            if (bookedRuns.some(([start, end]) => start <= endDateInput.value && end >= startDateInput.value)) {
+                latestRequest++;
+                totalPriceElement.textContent = 'Unavailable';
+                priceNoteElement.textContent = 'The car is already booked on some of these days.';
+                return;
+            }
+            
+            // Ignore responses to superseded date selections
+            const requestId = ++latestRequest;
+            fetch(rentalForm.dataset.quoteUrl, {
+                method: 'POST',
+                headers: {'Content-Type': 'application/json'},
+                body: JSON.stringify({
+                    model_ids: [modelId],
+                    ranges: [{start_date: startDateInput.value, end_date: endDateInput.value}]
+                })
+            })
+                .then(response => response.json().then(body => ({ok: response.ok, body: body})))
+                .then(({ok, body}) => {
+                    if (requestId !== latestRequest) {
+                        return;
+                    }
+                    if (!ok || !body.quotes.length) {
+                        totalPriceElement.textContent = 'Unavailable';
+                        priceNoteElement.textContent = body.error || '';
+                        return;
+                    }
+                    const quote = body.quotes[0];
+                    totalPriceElement.textContent = `$${quote.total_price.toFixed(2)}`;
+                    const difference = quote.total_price - quote.base_price;
+                    let note = `${quote.days} day${quote.days === 1 ? '' : 's'}`;
+                    if (difference <= -0.01) {
+                        note += ` (you save $${(-difference).toFixed(2)})`;
+                    } else if (difference >= 0.01) {
+                        note += ` (includes $${difference.toFixed(2)} in surcharges)`;
+                    }
+                    priceNoteElement.textContent = note;
+                })
+                .catch(() => {
+                    if (requestId === latestRequest) {
+                        totalPriceElement.textContent = 'Unavailable';
+                    }
+                });
         }
         
         startDateInput.addEventListener('change', updateTotalPrice);
@@ -0,0 +1,75 @@
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+@pytest.fixture
+def app(tmp_path):
+    import cache
+    from app import create_app, db
+    from commands import init_db
+
+    # Caches are per process; start each test's database with empty ones
+    cache._caches.clear()
+
+    app = create_app({
+        'SQLALCHEMY_DATABASE_URI': f"sqlite:///{tmp_path / 'test.db'}",
+        'TESTING': True,
+        'WTF_CSRF_ENABLED': False,
+        'INSTRUMENTATION_ENABLED': False,
+        'PASSWORD_HASH_METHOD': 'pbkdf2:sha256:1000',
+        'IMAGE_STORAGE_DIR': str(tmp_path / 'images'),
+    })
+    with app.app_context():
+        db.drop_all()
+        init_db()
+    yield app
+    with app.app_context():
+        db.session.remove()
+        db.engine.dispose()
+
+
+@pytest.fixture
+def count_queries(app):
+    """Return a function that runs a callable and counts the SQL statements it issues."""
+    from sqlalchemy import event
+
+    from app import db
+
+    def count(function):
+        statements = []
+
+        def record(conn, cursor, statement, *args):
+            statements.append(statement)
+
+        with app.app_context():
+            engine = db.engine
+        event.listen(engine, 'before_cursor_execute', record)
+        try:
+            function()
+        finally:
+            event.remove(engine, 'before_cursor_execute', record)
+        return len(statements)
+
+    return count
+
+
+def make_user(app, username, password='password', is_admin=False):
+    from werkzeug.security import generate_password_hash
+
+    from app import db
+    from models import User
+
+    with app.app_context():
+        user = User(username=username, email=f'{username}@example.com', is_admin=is_admin,
+                    password_hash=generate_password_hash(password, app.config['PASSWORD_HASH_METHOD']))
+        db.session.add(user)
+        db.session.commit()
+        return user.id
+
+
+def login(client, username, password='password'):
+    return client.post('/login', data={'username': username, 'password': password})
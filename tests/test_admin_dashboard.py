@@ -0,0 +1,81 @@
+from datetime import datetime, timedelta
+
+from conftest import login, make_user
+
+
+def seed_fleet(app, cars, models_per_car):
+    from app import db
+    from models import Car, CarModel, Rental
+
+    start = datetime.combine(datetime.utcnow().date(), datetime.min.time())
+    # A renter per car, so rows do not share lazily loaded objects
+    renter_ids = [make_user(app, f'renter{i}') for i in range(cars)]
+    with app.app_context():
+        for i, renter_id in enumerate(renter_ids):
+            car = Car(brand=f'Brand {i}', year=2020)
+            db.session.add(car)
+            db.session.flush()
+            for j in range(models_per_car):
+                model = CarModel(car_id=car.id, name=f'Model {i}-{j}', price_per_day=50)
+                db.session.add(model)
+                db.session.flush()
+                db.session.add(Rental(user_id=renter_id, car_model_id=model.id, start_date=start,
+                                      end_date=start + timedelta(days=2), total_price=150, status='active'))
+        db.session.commit()
+
+
+def dashboard_queries(app, count_queries, cars, models_per_car):
+    from app import db
+
+    with app.app_context():
+        db.drop_all()
+        db.create_all()
+    make_user(app, 'admin', is_admin=True)
+    seed_fleet(app, cars, models_per_car)
+
+    client = app.test_client()
+    login(client, 'admin')
+    # Warm the identity cache, so both runs count only the dashboard's own work
+    assert client.get('/admin/dashboard').status_code == 200
+
+    def fetch():
+        assert client.get('/admin/dashboard').status_code == 200
+    return count_queries(fetch)
+
+
+def test_admin_dashboard_query_count_is_flat(app, count_queries):
+    small = dashboard_queries(app, count_queries, cars=2, models_per_car=1)
+    large = dashboard_queries(app, count_queries, cars=40, models_per_car=3)
+    assert small == large
+
+
+def test_admin_dashboard_status_badges(app):
+    import re
+
+    from app import db
+    from models import Car, CarModel
+
+    make_user(app, 'admin', is_admin=True)
+    with app.app_context():
+        car = Car(brand='Acme', year=2021)
+        db.session.add(car)
+        db.session.flush()
+        db.session.add_all([
+            CarModel(car_id=car.id, name='Ready', price_per_day=50),
+            CarModel(car_id=car.id, name='Booked', price_per_day=50, is_available=False),
+            CarModel(car_id=car.id, name='Workshop', price_per_day=50, in_service=False),
+        ])
+        db.session.commit()
+
+    client = app.test_client()
+    login(client, 'admin')
+    html = client.get('/admin/dashboard').get_data(as_text=True)
+
+    def status(name):
+        row = re.search(rf'<tr>(?:(?!</tr>).)*<td>{name}</td>(?:(?!</tr>).)*</tr>', html, re.S).group(0)
+        return re.findall(r'badge bg-(?:success|danger|secondary)">([^<]+)<', row)[-1]
+
+    assert status('Acme') == 'Available'
+    assert status('Ready') == 'Available'
+    assert status('Booked') == 'Rented'
+    assert status('Workshop') == 'Out of service'
@@ -0,0 +1,108 @@
+from datetime import date, datetime, timedelta
+
+import pytest
+
+from conftest import login, make_user
+
+
+def rollups(app):
+    """Non-empty daily and monthly rollup rows, for comparing refresh and rebuild."""
+    from models import RentalDailyStat, RentalMonthlyStat
+
+    with app.app_context():
+        return {
+            model.__name__: {
+                (row.car_model_id, getattr(row, key)): (row.booked_days, round(row.revenue, 6),
+                                                         row.rentals_started, row.rental_days_started)
+                for row in model.query
+                if row.booked_days or row.rentals_started or round(row.revenue, 6)
+            }
+            for model, key in ((RentalDailyStat, 'day'), (RentalMonthlyStat, 'month'))
+        }
+
+
+def test_incremental_refresh_matches_a_rebuild(app):
+    from analytics import rebuild_rollups, refresh_rollups
+    from app import db
+    from booking import create_booking
+    from jobs import complete_expired_rentals
+    from models import Car, CarModel, Rental
+
+    renter_id = make_user(app, 'renter')
+    today = date.today()
+    with app.app_context():
+        car = Car(brand='Acme', year=2022)
+        db.session.add(car)
+        db.session.flush()
+        first = CarModel(car_id=car.id, name='One', price_per_day=40)
+        second = CarModel(car_id=car.id, name='Two', price_per_day=55)
+        db.session.add_all([first, second])
+        db.session.flush()
+        # Ended a week ago, across a month boundary, still marked active
+        month_end = today.replace(day=1) - timedelta(days=1)
+        ended = Rental(user_id=renter_id, car_model_id=first.id, total_price=400, status='active',
+                       start_date=datetime.combine(month_end - timedelta(days=4), datetime.min.time()),
+                       end_date=datetime.combine(month_end + timedelta(days=5), datetime.min.time()))
+        pending = Rental(user_id=renter_id, car_model_id=second.id, total_price=110, status='pending',
+                         start_date=datetime.combine(today, datetime.min.time()),
+                         end_date=datetime.combine(today + timedelta(days=1), datetime.min.time()))
+        db.session.add_all([ended, pending])
+        db.session.commit()
+        ended_id, model_ids = ended.id, (first.id, second.id)
+
+        refresh_rollups()
+        kept = create_booking(renter_id, model_ids[1], today + timedelta(days=10), today + timedelta(days=14))
+        cancelled = create_booking(renter_id, model_ids[0], today + timedelta(days=20), today + timedelta(days=22))
+        kept_id, cancelled_id = kept.id, cancelled.id
+        refresh_rollups()
+
+    # Cancelled through the site, as a renter would
+    client = app.test_client()
+    login(client, 'renter')
+    client.post(f'/user/rentals/{cancelled_id}/cancel')
+
+    with app.app_context():
+        refresh_rollups()
+        assert complete_expired_rentals(today) == 1
+        assert db.session.get(Rental, ended_id).status == 'completed'
+        # A changed booking moves its days and revenue
+        rental = db.session.get(Rental, kept_id)
+        rental.end_date += timedelta(days=2)
+        rental.total_price += 110
+        pending = Rental.query.filter_by(status='pending').one()
+        pending.status = 'active'
+        db.session.commit()
+        refresh_rollups()
+
+    incremental = rollups(app)
+    daily = incremental['RentalDailyStat']
+    assert (model_ids[0], today + timedelta(days=20)) not in daily
+    assert daily[(model_ids[1], today + timedelta(days=16))][0] == 1
+    assert sum(booked for booked, *_ in daily.values()) == 10 + 2 + 7
+
+    with app.app_context():
+        rebuild_rollups()
+    assert rollups(app) == incremental
+
+
+@pytest.mark.parametrize('args, expected', [
+    ({}, (date(2029, 7, 1), date(2030, 6, 30))),
+    ({'start': '2030-01', 'end': '2030-03'}, (date(2030, 1, 1), date(2030, 3, 31))),
+    ({'start': '2030-03-15', 'end': '2030-01'}, (date(2030, 1, 1), date(2030, 3, 31))),
+    ({'start': '2030-13', 'end': 'soon'}, (date(2029, 7, 1), date(2030, 6, 30))),
+    ({'end': '9999-12'}, (date(2029, 7, 1), date(2030, 6, 30))),
+    ({'start': '0001-01', 'end': '9999-11'}, (date(2029, 7, 1), date(2030, 6, 30))),
+])
+def test_report_period(args, expected):
+    from analytics import report_period
+
+    assert report_period(args, today=date(2030, 6, 14)) == expected
+
+
+@pytest.mark.parametrize('query', ['start=2025-01&end=9999-12', 'start=0001-01&end=9999-11', 'start=x&end=y'])
+def test_reports_page_falls_back_for_bad_months(app, query):
+    make_user(app, 'admin', is_admin=True)
+    client = app.test_client()
+    login(client, 'admin')
+    assert client.get(f'/admin/reports?{query}').status_code == 200
+    assert client.get(f'/admin/reports/export?report=monthly&{query}').status_code == 200
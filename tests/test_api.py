@@ -0,0 +1,125 @@
+from datetime import date, timedelta
+
+import pytest
+
+from conftest import login, make_user
+
+
+def iso(offset):
+    return (date.today() + timedelta(days=offset)).isoformat()
+
+
+@pytest.fixture
+def models(app):
+    """Two bookable models and one out of service."""
+    from app import db
+    from models import Car, CarModel
+
+    with app.app_context():
+        car = Car(brand='Acme', year=2022)
+        db.session.add(car)
+        db.session.flush()
+        rows = [CarModel(car_id=car.id, name='One', price_per_day=100),
+                CarModel(car_id=car.id, name='Two', price_per_day=60),
+                CarModel(car_id=car.id, name='Parked', price_per_day=80, in_service=False)]
+        db.session.add_all(rows)
+        db.session.commit()
+        return [row.id for row in rows]
+
+
+@pytest.fixture
+def client(app):
+    make_user(app, 'renter')
+    client = app.test_client()
+    login(client, 'renter')
+    return client
+
+
+def book(client, *bookings):
+    return client.post('/api/v1/bookings', json={'bookings': list(bookings)})
+
+
+def booking(model_id, start=5, end=7):
+    return {'car_model_id': model_id, 'start_date': iso(start), 'end_date': iso(end)}
+
+
+def test_bookings_require_authentication(app, models):
+    response = book(app.test_client(), booking(models[0]))
+    assert response.status_code == 401
+    assert response.get_json() == {'error': 'Authentication required.'}
+
+
+def test_batch_reports_each_booking_and_commits_the_valid_ones(app, client, models):
+    from models import Rental
+
+    one, two, parked = models
+    response = book(
+        client,
+        booking(one),
+        booking(one, 6, 9),  # overlaps the first, in the same batch
+        booking(two, 7, 5),  # backwards
+        {'car_model_id': 'two'},
+        booking(999),
+        booking(parked),
+        booking(two, -3, 1),  # in the past
+    )
+    assert response.status_code == 201
+    body = response.get_json()
+    assert [result['status'] for result in body['results']] == [
+        'confirmed', 'conflict', 'invalid', 'invalid', 'not_found', 'conflict', 'invalid',
+    ]
+    assert body['confirmed'] == 1
+    assert body['results'][0]['total_price'] == 300
+    with app.app_context():
+        assert [(rental.car_model_id, rental.id) for rental in Rental.query] == [
+            (one, body['results'][0]['rental_id'])
+        ]
+
+
+def test_batch_with_no_confirmed_booking_answers_200(client, models):
+    response = book(client, booking(999))
+    assert response.status_code == 200
+    assert response.get_json()['confirmed'] == 0
+
+
+@pytest.mark.parametrize('payload', [
+    {'bookings': []},
+    {'bookings': 'all of them'},
+    {'bookings': [booking(1)] * 101},
+    [],
+])
+def test_bookings_rejects_malformed_batches(client, models, payload):
+    response = client.post('/api/v1/bookings', json=payload)
+    assert response.status_code == 400
+    assert 'error' in response.get_json()
+
+
+def test_availability(client, models):
+    one, two, parked = models
+    assert book(client, booking(one)).status_code == 201
+    response = client.post('/api/v1/availability', json={
+        'start_date': iso(6), 'end_date': iso(10), 'model_ids': [one, two, parked, 999],
+    })
+    assert response.status_code == 200
+    body = response.get_json()
+    assert body['available'] == [two]
+    assert body['unavailable'] == [one, parked]
+    assert body['unknown'] == [999]
+
+    # Ranges are inclusive, so the model is free again the day after the booking ends
+    response = client.post('/api/v1/availability', json={
+        'start_date': iso(8), 'end_date': iso(8), 'model_ids': [one],
+    })
+    assert response.get_json()['available'] == [one]
+
+
+@pytest.mark.parametrize('payload', [
+    {'start_date': iso(1), 'end_date': iso(2), 'model_ids': list(range(1001))},
+    {'start_date': iso(1), 'end_date': iso(2), 'model_ids': ['1']},
+    {'start_date': iso(3), 'end_date': iso(2), 'model_ids': [1]},
+    {'start_date': 'tomorrow', 'end_date': iso(2), 'model_ids': [1]},
+])
+def test_availability_rejects_invalid_requests(client, models, payload):
+    response = client.post('/api/v1/availability', json=payload)
+    assert response.status_code == 400
+    assert 'error' in response.get_json()
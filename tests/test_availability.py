@@ -0,0 +1,58 @@
+from datetime import date, datetime, timedelta
+
+import pytest
+
+from conftest import make_user
+
+DAY = date(2030, 6, 10)
+
+
+@pytest.fixture
+def fleet(app):
+    """Model 1 booked DAY..DAY+3, model 2 with only a cancelled booking then, model 3 out of service."""
+    from app import db
+    from models import Car, CarModel, Rental
+
+    renter_id = make_user(app, 'renter')
+    with app.app_context():
+        car = Car(brand='Acme', year=2022)
+        db.session.add(car)
+        db.session.flush()
+        db.session.add_all([CarModel(car_id=car.id, name=f'Model {i}', price_per_day=50, in_service=i != 3)
+                            for i in (1, 2, 3)])
+        db.session.flush()
+        for model_id, status in ((1, 'active'), (2, 'cancelled'), (2, 'completed')):
+            db.session.add(Rental(user_id=renter_id, car_model_id=model_id, status=status, total_price=200,
+                                  start_date=datetime.combine(DAY, datetime.min.time()),
+                                  end_date=datetime.combine(DAY + timedelta(days=3), datetime.min.time())))
+        db.session.commit()
+
+
+@pytest.mark.parametrize('start, end, booked', [
+    (-5, -1, False),  # ends the day before
+    (-5, 0, True),  # ends on the first booked day
+    (0, 0, True),
+    (1, 2, True),  # inside
+    (-1, 5, True),  # covers it
+    (3, 3, True),  # starts on the last booked day
+    (4, 6, False),  # starts the day after
+])
+def test_overlap_edges(app, fleet, start, end, booked):
+    from availability import booked_model_ids, find_conflicts, is_available
+
+    start_date, end_date = DAY + timedelta(days=start), DAY + timedelta(days=end)
+    with app.app_context():
+        assert bool(find_conflicts(1, start_date, end_date)) is booked
+        assert is_available(1, start_date, end_date) is not booked
+        assert booked_model_ids(start_date, end_date) == ({1} if booked else set())
+
+
+def test_cancelled_and_completed_rentals_do_not_block(app, fleet):
+    from availability import available_model_ids, find_conflicts
+
+    with app.app_context():
+        assert find_conflicts(2, DAY, DAY + timedelta(days=3)) == []
+        # Out-of-service models are never available, booked or not
+        assert available_model_ids(DAY, DAY) == {2}
+        assert available_model_ids(DAY - timedelta(days=10), DAY - timedelta(days=1)) == {1, 2}
+        assert available_model_ids(DAY, DAY, model_ids=[1, 3]) == set()
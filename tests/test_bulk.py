@@ -0,0 +1,120 @@
+from datetime import datetime, timedelta
+
+import pytest
+
+from conftest import login, make_user
+
+
+@pytest.fixture
+def fleet(app):
+    """Four models of one car: idle, pending, active and with only past rentals."""
+    from app import db
+    from models import Car, CarModel, Rental
+
+    renter_id = make_user(app, 'renter')
+    start = datetime.combine(datetime.utcnow().date(), datetime.min.time()) + timedelta(days=3)
+    with app.app_context():
+        car = Car(brand='Acme', year=2021)
+        db.session.add(car)
+        db.session.flush()
+        models = {name: CarModel(car_id=car.id, name=name, price_per_day=100)
+                  for name in ('idle', 'pending', 'active', 'history')}
+        db.session.add_all(models.values())
+        db.session.flush()
+        for name, status in (('pending', 'pending'), ('active', 'active'), ('history', 'completed'),
+                             ('history', 'cancelled')):
+            db.session.add(Rental(user_id=renter_id, car_model_id=models[name].id, start_date=start,
+                                  end_date=start + timedelta(days=1), total_price=200, status=status))
+        db.session.commit()
+        return {name: model.id for name, model in models.items()}
+
+
+def run(app, action, value=None, dry_run=False, **selection):
+    from bulk import model_selection, run_bulk
+
+    with app.app_context():
+        return run_bulk(action, model_selection(**selection), value, dry_run=dry_run)
+
+
+def model_states(app):
+    from models import CarModel
+
+    with app.app_context():
+        return {model.name: (model.price_per_day, model.in_service) for model in CarModel.query}
+
+
+@pytest.mark.parametrize('action, value, changed, skipped', [
+    ('adjust_price', 10, 4, 0),
+    ('set_price', 80, 4, 0),
+    ('out_of_service', None, 2, 2),
+    ('delete', None, 1, 3),
+])
+def test_preview_matches_apply(app, fleet, action, value, changed, skipped):
+    before = model_states(app)
+    preview = run(app, action, value, dry_run=True, brand='acme')
+    assert model_states(app) == before
+
+    applied = run(app, action, value, brand='acme')
+    for report in (preview, applied):
+        assert (report.matched, report.changed, report.skipped) == (4, changed, skipped)
+
+
+def test_out_of_service_skips_booked_models(app, fleet):
+    report = run(app, 'out_of_service', model_ids=fleet.values())
+    assert report.changed == 2
+    states = model_states(app)
+    assert not states['idle'][1] and not states['history'][1]
+    assert states['pending'][1] and states['active'][1]
+
+    # Returning to service only touches the models taken out
+    assert run(app, 'in_service', model_ids=fleet.values()).changed == 2
+    assert all(in_service for _, in_service in model_states(app).values())
+
+
+def test_delete_keeps_models_with_rental_history(app, fleet):
+    report = run(app, 'delete', model_ids=fleet.values())
+    assert (report.changed, report.skipped) == (1, 3)
+    assert set(model_states(app)) == {'pending', 'active', 'history'}
+
+
+def test_adjust_price_rounds_to_cents(app, fleet):
+    run(app, 'adjust_price', -33.333, model_ids=[fleet['idle']])
+    assert model_states(app)['idle'][0] == 66.67
+
+
+@pytest.mark.parametrize('action, value', [('adjust_price', -100), ('set_price', -1), ('set_price', None)])
+def test_invalid_values_are_rejected(app, fleet, action, value):
+    with pytest.raises(ValueError):
+        run(app, action, value, model_ids=fleet.values())
+
+
+def test_catalog_version_is_bumped_only_by_applied_changes(app, fleet):
+    from cache import catalog_version
+
+    with app.app_context():
+        version = catalog_version()
+    run(app, 'set_price', 90, dry_run=True, model_ids=fleet.values())
+    run(app, 'delete', model_ids=[fleet['active']])  # skipped, nothing changes
+    with app.app_context():
+        assert catalog_version() == version
+    run(app, 'set_price', 90, model_ids=fleet.values())
+    with app.app_context():
+        assert catalog_version() != version
+
+
+def test_admin_bulk_preview_then_apply(app, fleet):
+    make_user(app, 'admin', is_admin=True)
+    client = app.test_client()
+    login(client, 'admin')
+    # Render the dashboard first, so a stale cached copy would show
+    assert 'Out of service' not in client.get('/admin/dashboard').get_data(as_text=True)
+
+    form = {'action': 'out_of_service', 'model_ids': list(fleet.values())}
+    preview = client.post('/admin/bulk', data=form)
+    assert preview.status_code == 200
+    assert 'Models that will change <strong>2</strong>' in preview.get_data(as_text=True)
+
+    response = client.post('/admin/bulk', data={**form, 'confirm': '1'}, follow_redirects=True)
+    html = response.get_data(as_text=True)
+    assert '2 changed, 2 skipped with pending or active bookings' in html
+    assert html.count('badge bg-secondary">Out of service') == 2
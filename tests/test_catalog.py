@@ -0,0 +1,127 @@
+import re
+from itertools import product
+from urllib.parse import urlencode
+
+import pytest
+
+from conftest import login, make_user
+
+FACET_PATTERN = re.compile(
+    r'name="(brand|fuel_type|transmission)" value="([^"]*)"[^>]*>\s*<label[^>]*>\s*'
+    r'<span>[^<]*</span>\s*<span class="badge bg-secondary">(\d+)</span>'
+)
+NEXT_PATTERN = re.compile(r'<a class="page-link" href="([^"#]+)">\s*Next')
+
+
+@pytest.fixture
+def client(app):
+    """Three brands with a mix of fuel, transmission, seats and prices; a few rented out."""
+    from app import db
+    from models import Car, CarModel
+
+    make_user(app, 'renter')
+    with app.app_context():
+        for brand in ('Acme', 'Bolt', 'Crest'):
+            car = Car(brand=brand, year=2022)
+            db.session.add(car)
+            db.session.flush()
+            for i, (fuel, transmission) in enumerate(product(('Petrol', 'Electric', 'Diesel'),
+                                                             ('Manual', 'Automatic'))):
+                db.session.add(CarModel(
+                    car_id=car.id, name=f'{brand} {i}', fuel_type=fuel, transmission=transmission,
+                    price_per_day=40 + 10 * i, seats=2 + i % 4, air_conditioning=i % 2 == 0,
+                    is_available=not (brand == 'Bolt' and i == 1),
+                ))
+        db.session.commit()
+    client = app.test_client()
+    login(client, 'renter')
+    return client
+
+
+def listing(client, **args):
+    """Ids of every model listed for ``args``, following Next links; plus the first page's facets."""
+    response = client.get('/user/dashboard?' + urlencode({'per_page': 4, **args}, doseq=True))
+    assert response.status_code == 200
+    html = response.get_data(as_text=True)
+    facets = {}
+    for facet, value, count in FACET_PATTERN.findall(html):
+        facets.setdefault(facet, {})[value] = int(count)
+    ids = []
+    while True:
+        ids.extend(int(model_id) for model_id in re.findall(r'/user/car/(\d+)"', html))
+        next_link = NEXT_PATTERN.search(html)
+        if not next_link:
+            return ids, facets
+        html = client.get(next_link.group(1).replace('&amp;', '&')).get_data(as_text=True)
+
+
+def expected_ids(app, **criteria):
+    from models import CarModel
+
+    with app.app_context():
+        models = CarModel.query.filter_by(is_available=True).all()
+        return {model.id for model in models if all(
+            check(model) for check in criteria.values()
+        )}
+
+
+def test_filters_combine_across_pages(app, client):
+    ids, _ = listing(client, brand=['Acme', 'Crest'], fuel_type='Petrol', min_seats=3, sort='price_asc')
+    assert len(ids) == len(set(ids))
+    assert set(ids) == expected_ids(
+        app,
+        brand=lambda model: model.car.brand in ('Acme', 'Crest'),
+        fuel=lambda model: model.fuel_type == 'Petrol',
+        seats=lambda model: model.seats >= 3,
+    )
+
+    ids, _ = listing(client, min_price=50, max_price=80, air_conditioning='1')
+    assert len(ids) == len(set(ids)) == 6  # two pages
+    assert set(ids) == expected_ids(
+        app,
+        price=lambda model: 50 <= model.price_per_day <= 80,
+        ac=lambda model: model.air_conditioning,
+    )
+
+
+def test_pages_follow_the_chosen_sort(app, client):
+    from models import CarModel
+
+    ids, _ = listing(client, sort='price_desc')
+    with app.app_context():
+        prices = {model.id: model.price_per_day for model in CarModel.query}
+    assert len(ids) == 17
+    assert [prices[model_id] for model_id in ids] == sorted((prices[model_id] for model_id in ids), reverse=True)
+
+
+@pytest.mark.parametrize('args', [
+    {},
+    {'fuel_type': 'Electric'},
+    {'brand': 'Bolt', 'transmission': 'Manual'},
+    {'min_seats': 4, 'air_conditioning': '1'},
+])
+def test_facet_counts_match_the_listing(client, args):
+    _, facets = listing(client, **args)
+    assert set(facets) == {'brand', 'fuel_type', 'transmission'}
+    for facet, counts in facets.items():
+        # Each facet is counted under every other filter, so a count is what
+        # choosing only that value for the facet lists
+        for value, count in counts.items():
+            ids, _ = listing(client, **{**args, facet: value})
+            assert len(ids) == count, (facet, value)
+
+
+@pytest.mark.parametrize('args', [
+    {'sort': 'cheapest'},
+    {'sort': ['price_asc', 'price_desc']},
+    {'brand': 'Nope'},
+    {'brand': [''] * 3},
+    {'min_price': 'cheap', 'max_price': '1e999', 'min_seats': '2.5'},
+    {'min_seats': '9' * 30, 'min_price': '-' + '9' * 400},
+    {'air_conditioning': 'maybe'},
+    {'per_page': -4},
+    {'colour': 'red'},
+])
+def test_unknown_values_are_ignored(client, args):
+    response = client.get('/user/dashboard?' + urlencode(args, doseq=True))
+    assert response.status_code == 200
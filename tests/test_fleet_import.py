@@ -0,0 +1,66 @@
+import io
+
+import pytest
+
+from conftest import login, make_user
+
+HEADER = 'brand,year,description,name,price_per_day,mileage,fuel_type,transmission,seats,air_conditioning,image_url\n'
+
+
+@pytest.fixture
+def admin_client(app):
+    make_user(app, 'admin', is_admin=True)
+    client = app.test_client()
+    login(client, 'admin')
+    return client
+
+
+def upload(client, content, filename='fleet.csv'):
+    return client.post('/admin/fleet/import', data={'file': (io.BytesIO(content), filename)},
+                       content_type='multipart/form-data')
+
+
+def test_import_creates_models(app, admin_client):
+    from models import CarModel
+
+    response = upload(admin_client, (HEADER + 'Škoda,2021,,Octavia,45,,Petrol,Manual,5,true,\n').encode('utf-8'))
+    assert response.status_code == 200
+    with app.app_context():
+        assert CarModel.query.filter_by(name='Octavia').count() == 1
+
+
+@pytest.mark.parametrize('content', [
+    (HEADER + 'Citroën,2021,,C4,40,,Diesel,Manual,5,true,\n').encode('latin-1'),
+    b'\x89PNG\r\n\x1a\n\x00\x00\x00\rIHDR\xff\xfe',
+])
+def test_unreadable_file_is_a_file_error(app, admin_client, content):
+    response = upload(admin_client, content)
+    assert response.status_code == 200
+    assert b'The file could not be read' in response.data
+
+
+def test_changed_image_url_drops_the_stored_image(app, admin_client):
+    from app import db
+    from models import Car, CarModel
+
+    with app.app_context():
+        car = Car(brand='Volvo', year=2022)
+        db.session.add(car)
+        db.session.flush()
+        db.session.add_all([
+            CarModel(car_id=car.id, name='XC40', price_per_day=80, image_url='/media/aaa-640.jpg',
+                     image_key='aaa', image_width=640, image_height=480),
+            CarModel(car_id=car.id, name='XC60', price_per_day=90, image_url='/media/bbb-640.jpg',
+                     image_key='bbb', image_width=640, image_height=480),
+        ])
+        db.session.commit()
+
+    rows = ('Volvo,2022,,XC40,80,,Petrol,Automatic,5,true,https://example.com/new.jpg\n'
+            'Volvo,2022,,XC60,95,,Petrol,Automatic,5,true,/media/bbb-640.jpg\n')
+    upload(admin_client, (HEADER + rows).encode('utf-8'))
+
+    with app.app_context():
+        changed = CarModel.query.filter_by(name='XC40').one()
+        kept = CarModel.query.filter_by(name='XC60').one()
+        assert (changed.image_url, changed.image_key, changed.image_width) == ('https://example.com/new.jpg', None, None)
+        assert (kept.image_key, kept.image_width, kept.price_per_day) == ('bbb', 640, 95)
@@ -0,0 +1,54 @@
+from conftest import login, make_user
+
+
+def set_admin(app, user_id, is_admin):
+    """Change a role with a plain UPDATE, as another worker would: no ORM events fire here."""
+    from app import db
+    from models import User
+
+    with app.app_context():
+        db.session.execute(db.update(User).where(User.id == user_id).values(is_admin=is_admin))
+        db.session.commit()
+
+
+def test_demotion_takes_effect_on_the_next_request(app):
+    admin_id = make_user(app, 'admin', is_admin=True)
+    client = app.test_client()
+    login(client, 'admin')
+    assert client.get('/admin/dashboard').status_code == 200
+    assert client.get('/user/dashboard').status_code == 200
+
+    set_admin(app, admin_id, False)
+    assert client.get('/admin/dashboard').status_code == 403
+
+
+def test_promotion_takes_effect_on_the_next_request(app):
+    from cache import get_cache
+
+    renter_id = make_user(app, 'renter')
+    client = app.test_client()
+    login(client, 'renter')
+    # Renters are served from the identity cache
+    assert client.get('/user/dashboard').status_code == 200
+    with app.app_context():
+        assert get_cache('identity').get(renter_id) is not None
+    assert client.get('/admin/dashboard').status_code == 403
+
+    set_admin(app, renter_id, True)
+    assert client.get('/admin/dashboard').status_code == 200
+
+
+def test_deleted_admin_is_logged_out_on_the_next_request(app):
+    from app import db
+    from models import User
+
+    admin_id = make_user(app, 'admin', is_admin=True)
+    client = app.test_client()
+    login(client, 'admin')
+    assert client.get('/admin/dashboard').status_code == 200
+
+    with app.app_context():
+        db.session.execute(db.delete(User).where(User.id == admin_id))
+        db.session.commit()
+    response = client.get('/admin/dashboard')
+    assert response.status_code == 302 and '/login' in response.location
@@ -0,0 +1,135 @@
+import threading
+from http.server import BaseHTTPRequestHandler, HTTPServer
+
+import pytest
+
+import images
+from images import ImageError, fetch_image
+
+PNG = b'\x89PNG\r\n\x1a\n' + bytes(32)
+
+
+@pytest.fixture
+def redirect_server():
+    """Local server answering /moved with a redirect to the ``?to=`` URL."""
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            if self.path.startswith('/moved?to='):
+                self.send_response(302)
+                self.send_header('Location', self.path.split('=', 1)[1])
+            elif self.path == '/image.png':
+                self.send_response(200)
+                self.send_header('Content-Length', str(len(PNG)))
+                self.end_headers()
+                self.wfile.write(PNG)
+                return
+            else:
+                self.send_response(500)
+            self.end_headers()
+
+        def log_message(self, *args):
+            pass
+
+    server = HTTPServer(('127.0.0.1', 0), Handler)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield f'http://127.0.0.1:{server.server_port}'
+    server.shutdown()
+
+
+@pytest.fixture
+def allow_test_server(monkeypatch):
+    # Treat the local test server as public; every other private address stays refused
+    check = images._is_public
+    monkeypatch.setattr(images, '_is_public', lambda ip: ip == '127.0.0.1' or check(ip))
+
+
+def test_public_hosts_are_fetched_through_redirects(app, redirect_server, allow_test_server):
+    with app.app_context():
+        assert fetch_image(f'{redirect_server}/moved?to={redirect_server}/image.png') == PNG
+
+
+@pytest.mark.parametrize('url', [
+    'http://localhost/image.jpg',
+    'http://127.0.0.1:5000/image.jpg',
+    'http://169.254.169.254/latest/meta-data/',
+    'http://10.0.0.1/image.jpg',
+    'http://[::1]/image.jpg',
+    'http://[::ffff:127.0.0.1]/image.jpg',
+])
+def test_private_hosts_are_refused(app, url):
+    with app.app_context(), pytest.raises(ImageError, match='public host'):
+        fetch_image(url)
+
+
+def test_redirects_to_private_hosts_are_refused(app, redirect_server, allow_test_server):
+    with app.app_context(), pytest.raises(ImageError, match='public host'):
+        fetch_image(f'{redirect_server}/moved?to=http://169.254.169.254/latest/meta-data/')
+
+
+@pytest.mark.parametrize('target', ['file:///etc/passwd', 'ftp://127.0.0.1/image.jpg'])
+def test_redirects_to_other_schemes_are_refused(app, redirect_server, allow_test_server, target):
+    with app.app_context(), pytest.raises(ImageError):
+        fetch_image(f'{redirect_server}/moved?to={target}')
+
+
+def test_download_errors_are_not_echoed(app, redirect_server, allow_test_server):
+    with app.app_context(), pytest.raises(ImageError) as error:
+        fetch_image(f'{redirect_server}/missing')
+    assert str(error.value) == 'Could not download the image.'
+
+
+@pytest.mark.parametrize('fmt', ['PNG', 'GIF', 'WEBP'])
+def test_transparency_is_flattened_onto_white(app, fmt):
+    Image = pytest.importorskip('PIL.Image')
+    import io
+    import os
+
+    from images import store_image, storage_dir
+
+    # A red square on a transparent canvas
+    image = Image.new('RGBA', (40, 40), (0, 0, 0, 0))
+    image.paste((255, 0, 0, 255), (10, 10, 30, 30))
+    if fmt == 'GIF':
+        image = image.convert('P', palette=Image.ADAPTIVE, colors=2)
+        image.info['transparency'] = image.getpixel((0, 0))
+    buffer = io.BytesIO()
+    image.save(buffer, fmt, **({'transparency': image.info['transparency']} if fmt == 'GIF' else {}))
+
+    with app.test_request_context():
+        stored = store_image(buffer.getvalue())
+        for ext in ('jpg', 'webp'):
+            with Image.open(os.path.join(storage_dir(), f'{stored.key}-40.{ext}')) as variant:
+                variant = variant.convert('RGB')
+                assert all(channel > 240 for channel in variant.getpixel((2, 2))), ext
+                red, green, blue = variant.getpixel((20, 20))
+                assert red > 200 and green < 60 and blue < 60, ext
+
+
+def test_concurrent_writes_of_the_same_file(tmp_path, monkeypatch):
+    # Both threads have written their temporary file before either renames it
+    barrier = threading.Barrier(2, timeout=5)
+    replace = images.os.replace
+
+    def synchronised_replace(source, target):
+        barrier.wait()
+        replace(source, target)
+    monkeypatch.setattr(images.os, 'replace', synchronised_replace)
+
+    path = str(tmp_path / 'image-320.jpg')
+    errors = []
+
+    def write():
+        try:
+            images._write(path, b'content')
+        except Exception as error:
+            errors.append(error)
+    threads = [threading.Thread(target=write) for _ in range(2)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert not errors
+    assert [entry.name for entry in tmp_path.iterdir()] == ['image-320.jpg']
+    assert (tmp_path / 'image-320.jpg').read_bytes() == b'content'
@@ -0,0 +1,79 @@
+import json
+import os
+import subprocess
+import sys
+
+from conftest import login, make_user
+
+
+def test_toggle_reaches_other_workers(app):
+    from instrumentation import get_instrumentation
+
+    make_user(app, 'admin', is_admin=True)
+    client = app.test_client()
+    login(client, 'admin')
+    with app.app_context():
+        instrumentation = get_instrumentation()
+
+    assert client.post('/admin/instrumentation').status_code == 302
+    assert instrumentation.enabled
+
+    # Another worker still holding the old value picks up the stored one
+    instrumentation.enabled = False
+    instrumentation._synced_at = None
+    response = client.get('/login')
+    assert instrumentation.enabled
+    assert 'Server-Timing' in response.headers
+
+
+def test_metrics_sums_every_worker(app, tmp_path):
+    from instrumentation import Metrics
+
+    directory = tmp_path / 'metrics'
+    worker = Metrics(directory=str(directory))
+    worker.record_request('main.login', 'GET', 200, 0.02, 3, 0.01, 0.005)
+
+    # A live sibling (our parent) and one that has exited
+    finished = subprocess.Popen([sys.executable, '-c', 'pass'])
+    finished.wait()
+    for pid in (os.getppid(), finished.pid):
+        sibling = Metrics()
+        sibling.record_request('main.login', 'GET', 200, 0.2, 2, 0.1, 0.0)
+        sibling.record_job('complete_expired_rentals', 1.5, 4)
+        snapshot = {**sibling.snapshot(), 'pid': pid,
+                    'caches': {'catalog': {'hits': 5, 'misses': 1, 'size': 10}}}
+        (directory / f'metrics-{pid}.json').write_text(json.dumps(snapshot))
+
+    own = worker.snapshot()['caches'].get('catalog', {})
+    combined, caches = worker.collect()
+    assert combined.latency[('main.login', 'GET')].count == 3
+    assert combined.responses[('main.login', 'GET', 200)] == 3
+    assert combined.sql_queries['main.login'] == 7
+    assert combined.jobs['complete_expired_rentals'][:3] == (2, 3.0, 8)
+    # Counters of exited workers stay; their cache sizes do not
+    assert caches['catalog']['hits'] == own.get('hits', 0) + 10
+    assert caches['catalog']['size'] == own.get('size', 0) + 10
+
+    text = combined.render(caches, pid=False)
+    assert 'carrental_responses_total{endpoint="main.login",method="GET",status="200"} 3' in text
+    assert 'pid=' not in text
+
+    worker.prune()
+    assert not (directory / f'metrics-{finished.pid}.json').exists()
+    assert (directory / f'metrics-{os.getppid()}.json').exists()
+
+
+def test_metrics_endpoint_combines_workers(app, tmp_path):
+    from instrumentation import Metrics
+
+    directory = tmp_path / 'shared'
+    app.config['METRICS_DIR'] = str(directory)
+    app.extensions['instrumentation'].metrics.directory = str(directory)
+    sibling = Metrics()
+    sibling.record_request('main.index', 'GET', 200, 0.1, 1, 0.01, 0.0)
+    directory.mkdir()
+    (directory / f'metrics-{os.getppid()}.json').write_text(json.dumps({**sibling.snapshot(), 'pid': os.getppid()}))
+
+    text = app.test_client().get('/metrics').get_data(as_text=True)
+    assert 'carrental_responses_total{endpoint="main.index",method="GET",status="200"} 1' in text
+    assert 'pid=' not in text
@@ -0,0 +1,79 @@
+from datetime import date, datetime, timedelta
+
+from conftest import make_user
+
+
+def test_jobs_complete_expired_rentals_and_are_idempotent(app):
+    from app import db
+    from cache import catalog_version
+    from jobs import run_jobs
+    from models import Car, CarModel, Rental
+
+    today = date(2030, 6, 10)
+    renter_id = make_user(app, 'renter')
+
+    def rental(model_id, start, end, status='active'):
+        return Rental(user_id=renter_id, car_model_id=model_id, status=status, total_price=100,
+                      start_date=datetime.combine(today + timedelta(days=start), datetime.min.time()),
+                      end_date=datetime.combine(today + timedelta(days=end), datetime.min.time()))
+
+    with app.app_context():
+        car = Car(brand='Acme', year=2022)
+        db.session.add(car)
+        db.session.flush()
+        # Flags as a stale catalog would have them
+        models = [CarModel(car_id=car.id, name=name, price_per_day=50, is_available=available)
+                  for name, available in (('returned', False), ('out', True), ('later', False), ('cancelled', False))]
+        db.session.add_all(models)
+        db.session.flush()
+        returned, out, later, cancelled = (model.id for model in models)
+        db.session.add_all([
+            rental(returned, -5, -1),  # ended yesterday, still active
+            rental(out, -2, 2),  # rented today
+            rental(later, 3, 6),  # booked from a later day
+            rental(cancelled, -1, 1, status='cancelled'),
+        ])
+        db.session.commit()
+
+        version = catalog_version()
+        first = run_jobs(today)
+        assert first['completed_rentals'] == 1
+        assert first['availability_changes'] == 4
+        assert first['rentals_rolled_up'] == 3  # the cancelled one never counts
+        assert catalog_version() != version
+
+        statuses = {rental.car_model_id: rental.status for rental in Rental.query}
+        assert statuses == {returned: 'completed', out: 'active', later: 'active', cancelled: 'cancelled'}
+        available = {model.id: model.is_available for model in CarModel.query}
+        assert available == {returned: True, out: False, later: True, cancelled: True}
+
+        # Nothing left to do: no writes and no cache invalidation
+        version = catalog_version()
+        assert run_jobs(today) == {'completed_rentals': 0, 'availability_changes': 0, 'rentals_rolled_up': 0}
+        assert catalog_version() == version
+
+
+def test_completion_runs_in_batches(app):
+    from app import db
+    from jobs import complete_expired_rentals
+    from models import Car, CarModel, Rental
+
+    renter_id = make_user(app, 'renter')
+    start = datetime(2030, 1, 1)
+    with app.app_context():
+        car = Car(brand='Acme', year=2022)
+        db.session.add(car)
+        db.session.flush()
+        model = CarModel(car_id=car.id, name='Busy', price_per_day=50)
+        db.session.add(model)
+        db.session.flush()
+        db.session.add_all([
+            Rental(user_id=renter_id, car_model_id=model.id, status='active', total_price=50,
+                   start_date=start + timedelta(days=i), end_date=start + timedelta(days=i))
+            for i in range(7)
+        ])
+        db.session.commit()
+
+        assert complete_expired_rentals(date(2030, 1, 6), batch_size=2) == 5
+        assert Rental.query.filter_by(status='active').count() == 2
+        assert complete_expired_rentals(date(2030, 1, 6), batch_size=2) == 0
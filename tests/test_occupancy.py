@@ -0,0 +1,49 @@
+from datetime import date, datetime, timedelta
+
+import pytest
+
+from occupancy import MAX_BOUND_IDS
+
+
+def seed(app, models, booked):
+    """``models`` in-service car models, the first ``booked`` of them rented for the next week."""
+    from sqlalchemy import insert
+
+    from app import db
+    from conftest import make_user
+    from models import Car, CarModel, Rental
+
+    user_id = make_user(app, 'renter')
+    start = datetime.combine(date.today(), datetime.min.time())
+    with app.app_context():
+        db.session.execute(insert(Car), [{'id': 1, 'brand': 'Brand', 'year': 2024}])
+        db.session.execute(insert(CarModel), [
+            {'id': i, 'car_id': 1, 'name': f'Model {i}', 'price_per_day': 50} for i in range(1, models + 1)
+        ])
+        db.session.execute(insert(Rental), [{
+            'user_id': user_id, 'car_model_id': i, 'start_date': start,
+            'end_date': start + timedelta(days=7), 'total_price': 400, 'status': 'active',
+        } for i in range(1, booked + 1)])
+        db.session.commit()
+
+
+@pytest.mark.parametrize('models, booked, subquery', [
+    (20, 5, False),                                        # few booked: NOT IN the booked ids
+    (MAX_BOUND_IDS + 50, MAX_BOUND_IDS + 10, False),       # few free: IN the free ids
+    (2 * MAX_BOUND_IDS + 100, MAX_BOUND_IDS + 50, True),   # many of both: NOT EXISTS
+])
+def test_free_clause_matches_sql_with_bounded_parameters(app, models, booked, subquery):
+    from app import db
+    from availability import available_model_ids
+    from models import CarModel
+    from occupancy import free_clause
+
+    seed(app, models, booked)
+    start, end = date.today() + timedelta(days=2), date.today() + timedelta(days=3)
+    with app.app_context():
+        clause = free_clause(start, end)
+        compiled = clause.compile(db.engine, compile_kwargs={'render_postcompile': True})
+        assert ('EXISTS' in str(compiled)) == subquery
+        assert len(compiled.params) <= MAX_BOUND_IDS + 1
+        free = set(db.session.scalars(db.select(CarModel.id).where(clause)))
+        assert free == available_model_ids(start, end)
@@ -0,0 +1,129 @@
+import base64
+from datetime import datetime
+
+import pytest
+
+from conftest import login, make_user
+
+CREATED = datetime(2030, 1, 1, 12, 0)
+
+
+@pytest.fixture
+def tied_models(app):
+    """Ten models sharing created_at, with prices tied in pairs."""
+    from app import db
+    from models import Car, CarModel
+
+    with app.app_context():
+        car = Car(brand='Acme', year=2022)
+        db.session.add(car)
+        db.session.flush()
+        db.session.add_all([
+            CarModel(car_id=car.id, name=f'Model {i}', price_per_day=50 + i // 2 * 10, created_at=CREATED)
+            for i in range(10)
+        ])
+        db.session.commit()
+
+
+def walk(app, order, per_page=3):
+    """Follow next cursors to the end, then prev cursors back to the start."""
+    from models import CarModel
+    from pagination import keyset_paginate
+
+    with app.app_context():
+        pages = [keyset_paginate(CarModel.query, CarModel, per_page=per_page, order=order)]
+        while pages[-1].has_next:
+            pages.append(keyset_paginate(CarModel.query, CarModel, after=pages[-1].next_cursor,
+                                         per_page=per_page, order=order))
+        backwards = [pages[-1]]
+        while backwards[-1].has_prev:
+            backwards.append(keyset_paginate(CarModel.query, CarModel, before=backwards[-1].prev_cursor,
+                                             per_page=per_page, order=order))
+        ids = lambda page: [model.id for model in page]
+        return [ids(page) for page in pages], [ids(page) for page in reversed(backwards)]
+
+
+@pytest.mark.parametrize('sort', ['newest', 'price_asc', 'price_desc'])
+def test_ties_are_ordered_by_id_on_every_page(app, tied_models, sort):
+    from catalog import CATALOG_SORTS
+    from models import CarModel
+
+    order = CATALOG_SORTS[sort][1]
+    forwards, backwards = walk(app, order)
+    assert [len(page) for page in forwards] == [3, 3, 3, 1]
+    assert backwards == forwards
+
+    with app.app_context():
+        expected = [model.id for model in CarModel.query.order_by(
+            order.column.desc() if order.descending else order.column,
+            CarModel.id.desc() if order.descending else CarModel.id,
+        )]
+    assert sum(forwards, []) == expected
+
+
+def test_last_page_has_no_next_cursor(app, tied_models):
+    from models import CarModel
+    from pagination import encode_cursor, keyset_paginate
+
+    with app.app_context():
+        everything = keyset_paginate(CarModel.query, CarModel, per_page=10)
+        assert len(everything) == 10 and not everything.has_next and not everything.has_prev
+
+        nine = keyset_paginate(CarModel.query, CarModel, per_page=9)
+        last = keyset_paginate(CarModel.query, CarModel, after=nine.next_cursor, per_page=5)
+        assert [model.id for model in last] == [everything.items[-1].id]
+        assert not last.has_next and last.has_prev
+
+        # A cursor past the last row gives an empty page, not an error
+        beyond = keyset_paginate(CarModel.query, CarModel, after=encode_cursor(CREATED, 0), per_page=5)
+        assert not beyond.items and not beyond.has_next
+
+
+def test_api_listing_walks_every_row_once(app, tied_models):
+    client = app.test_client()
+    seen, cursor = [], None
+    while True:
+        body = client.get('/api/v1/models', query_string={'limit': 4, 'after': cursor}).get_json()
+        seen.extend(item['id'] for item in body['items'])
+        cursor = body['next_cursor']
+        if cursor is None:
+            break
+    assert seen == list(range(10, 0, -1))
+
+
+def token(raw):
+    return base64.urlsafe_b64encode(raw).decode().rstrip('=')
+
+
+BAD_CURSORS = [
+    'not a cursor',
+    '%%%',
+    token(b'\xff\xfe|1'),
+    token(b'2030-01-01T12:00:00'),
+    token(b'2030-01-01T12:00:00|one'),
+    token(b'yesterday|3'),
+    token(b'2030-01-01T12:00:00|' + b'9' * 40),
+    token(b'nan|3'),
+    token(b'1e999|' + b'9' * 40),
+    token(b'9' * 40 + b'|1'),
+]
+
+
+@pytest.mark.parametrize('path, param', [
+    ('/api/v1/models', 'after'),
+    ('/api/v1/cars', 'before'),
+    ('/user/dashboard', 'after'),
+    ('/user/dashboard?sort=price_asc', 'before'),
+    ('/user/dashboard?sort=year_desc', 'after'),
+    ('/admin/dashboard', 'cars_after'),
+    ('/admin/dashboard', 'rentals_before'),
+    ('/user/my_rentals', 'after'),
+])
+def test_invalid_cursors_never_fail(app, tied_models, path, param):
+    make_user(app, 'admin', is_admin=True)
+    client = app.test_client()
+    login(client, 'admin')
+    separator = '&' if '?' in path else '?'
+    for cursor in BAD_CURSORS:
+        response = client.get(f'{path}{separator}{param}={cursor}')
+        assert response.status_code in (200, 400), cursor
@@ -0,0 +1,25 @@
+import pytest
+from werkzeug.security import generate_password_hash
+
+from passwords import PasswordHasher, normalize_method
+
+
+@pytest.mark.parametrize('method', [
+    'pbkdf2', 'pbkdf2:sha256', 'pbkdf2:sha512', 'pbkdf2:sha256:1000', 'scrypt', 'scrypt:1024:8:1',
+])
+def test_normalized_method_matches_stored_prefix(method):
+    stored = generate_password_hash('secret', method)
+    assert stored.split('$', 1)[0] == normalize_method(method)
+
+
+@pytest.mark.parametrize('configured, stored, expected', [
+    ('pbkdf2:sha256', 'pbkdf2:sha256:600000$salt$hash', False),
+    ('pbkdf2', 'pbkdf2:sha256:600000$salt$hash', False),
+    ('scrypt', 'scrypt:32768:8:1$salt$hash', False),
+    ('pbkdf2:sha256', 'pbkdf2:sha256:260000$salt$hash', True),
+    ('scrypt', 'pbkdf2:sha256:600000$salt$hash', True),
+])
+def test_needs_rehash(app, configured, stored, expected):
+    app.config['PASSWORD_HASH_METHOD'] = configured
+    hasher = PasswordHasher(app)
+    assert hasher.needs_rehash(stored) is expected
@@ -0,0 +1,170 @@
+from datetime import date, timedelta
+
+import pytest
+
+from conftest import login, make_user
+
+
+def add_rule(app, kind, percent, **fields):
+    from app import db
+    from cache import bump_catalog_version
+    from models import PricingRule
+
+    with app.app_context():
+        db.session.add(PricingRule(name=kind, kind=kind, adjustment_percent=percent, **fields))
+        db.session.commit()
+        bump_catalog_version()
+
+
+def add_models(app, *prices):
+    from app import db
+    from models import Car, CarModel
+
+    with app.app_context():
+        car = Car(brand='Acme', year=2022)
+        db.session.add(car)
+        db.session.flush()
+        models = [CarModel(car_id=car.id, name=f'Model {i}', price_per_day=price) for i, price in enumerate(prices)]
+        db.session.add_all(models)
+        db.session.commit()
+        return [model.id for model in models]
+
+
+def days(start_date, end_date):
+    return [start_date + timedelta(days=offset) for offset in range((end_date - start_date).days + 1)]
+
+
+def quote_one(app, price, start_date, end_date):
+    from pricing import quote
+
+    with app.app_context():
+        return quote({1: price}, [(start_date, end_date)])[(1, start_date, end_date)]
+
+
+def test_season_rule_across_a_month_boundary(app):
+    add_rule(app, 'season', 50, start_date=date(2030, 1, 30), end_date=date(2030, 2, 2))
+    # Jan 29 and Feb 3 are outside the season, the four days between are in it
+    assert quote_one(app, 100, date(2030, 1, 29), date(2030, 2, 3)) == 2 * 100 + 4 * 150
+
+
+def test_weekend_rule(app):
+    add_rule(app, 'weekend', 20)
+    saturday = date(2030, 6, 1)
+    assert saturday.weekday() == 5
+    assert quote_one(app, 100, saturday - timedelta(days=1), saturday + timedelta(days=2)) == 100 + 120 + 120 + 100
+
+
+def test_long_rental_rule_takes_the_longest_threshold_reached(app):
+    add_rule(app, 'long_rental', -10, min_days=7)
+    add_rule(app, 'long_rental', -20, min_days=14)
+    monday = date(2030, 6, 3)
+    assert quote_one(app, 100, monday, monday + timedelta(days=5)) == 600
+    assert quote_one(app, 100, monday, monday + timedelta(days=6)) == 630
+    assert quote_one(app, 100, monday, monday + timedelta(days=13)) == 1120
+
+
+def test_demand_rule_applies_the_highest_tier_reached(app):
+    from app import db
+    from models import RentalDailyStat
+
+    add_models(app, 100, 100, 100, 100)
+    add_rule(app, 'demand', 10, min_utilization=50)
+    add_rule(app, 'demand', 30, min_utilization=75)
+    busy, busier = date(2030, 6, 4), date(2030, 6, 5)
+    with app.app_context():
+        # Two of four models booked on one day, three on the next
+        db.session.add_all([RentalDailyStat(car_model_id=i, day=busy, booked_days=1) for i in (1, 2)])
+        db.session.add_all([RentalDailyStat(car_model_id=i, day=busier, booked_days=1) for i in (1, 2, 3)])
+        db.session.commit()
+    assert quote_one(app, 100, date(2030, 6, 3), date(2030, 6, 6)) == 100 + 110 + 130 + 100
+
+
+def test_prefix_sums_match_a_per_day_sum(app):
+    from pricing import quote
+
+    add_rule(app, 'season', 25, start_date=date(2030, 2, 20), end_date=date(2030, 3, 10))
+    add_rule(app, 'season', -15, start_date=date(2030, 3, 1), end_date=date(2030, 4, 15))
+    add_rule(app, 'weekend', 10)
+    add_rule(app, 'long_rental', -5, min_days=10)
+
+    def factor(day):
+        value = 1.0
+        if date(2030, 2, 20) <= day <= date(2030, 3, 10):
+            value *= 1.25
+        if date(2030, 3, 1) <= day <= date(2030, 4, 15):
+            value *= 0.85
+        if day.weekday() >= 5:
+            value *= 1.1
+        return value
+
+    ranges = [(date(2030, 2, 1) + timedelta(days=start), date(2030, 2, 1) + timedelta(days=start + length))
+              for start in range(0, 70, 9) for length in (0, 3, 9, 30)]
+    prices = {1: 80, 2: 123.45}
+    with app.app_context():
+        quotes = quote(prices, ranges)
+    for start_date, end_date in ranges:
+        span = days(start_date, end_date)
+        long_rental = 0.95 if len(span) >= 10 else 1.0
+        for model_id, price in prices.items():
+            expected = round(price * sum(factor(day) for day in span) * long_rental, 2)
+            assert quotes[(model_id, start_date, end_date)] == pytest.approx(expected, abs=0.011)
+
+
+def test_quote_reaches_the_last_representable_day(app):
+    # No date arithmetic may step past date.max
+    assert quote_one(app, 10, date(9999, 12, 1), date(9999, 12, 31)) == 310
+
+
+@pytest.mark.parametrize('start, end', [
+    (1, 0),  # backwards
+    (-1, 3),  # in the past
+    (1000, 1100),  # beyond the horizon
+    (0, 800),  # wider than the span limit
+])
+def test_validate_quote_dates_rejects(start, end):
+    from pricing import validate_quote_dates
+
+    today = date(2030, 1, 1)
+    with pytest.raises(ValueError):
+        validate_quote_dates(today + timedelta(days=start), today + timedelta(days=end), today=today)
+
+
+def iso(offset):
+    return (date.today() + timedelta(days=offset)).isoformat()
+
+
+def test_quotes_api(app):
+    model_id, = add_models(app, 100)
+    client = app.test_client()
+    response = client.post('/api/v1/quotes', json={
+        'model_ids': [model_id, 999], 'ranges': [{'start_date': iso(10), 'end_date': iso(12)}],
+    })
+    assert response.status_code == 200
+    body = response.get_json()
+    assert body['quotes'][0]['days'] == 3
+    assert body['quotes'][0]['base_price'] == 300
+    assert body['unknown'] == [999]
+
+
+@pytest.mark.parametrize('ranges', [
+    [{'start_date': iso(1), 'end_date': iso(2)}, {'start_date': iso(700), 'end_date': iso(740)}],
+    [{'start_date': '9999-12-01', 'end_date': '9999-12-31'}],
+    [{'start_date': '0001-01-01', 'end_date': '9999-11-30'}],
+    [{'start_date': iso(-5), 'end_date': iso(2)}],
+])
+def test_quotes_api_rejects_out_of_range_dates(app, ranges):
+    model_id, = add_models(app, 100)
+    response = app.test_client().post('/api/v1/quotes', json={'model_ids': [model_id], 'ranges': ranges})
+    assert response.status_code == 400
+    assert 'error' in response.get_json()
+
+
+@pytest.mark.parametrize('start, end', [('9999-12-01', '9999-12-31'), ('0001-01-01', '9999-11-30')])
+def test_dashboard_ignores_out_of_range_dates(app, start, end):
+    add_models(app, 100)
+    make_user(app, 'renter')
+    client = app.test_client()
+    login(client, 'renter')
+    response = client.get(f'/user/dashboard?start_date={start}&end_date={end}')
+    assert response.status_code == 200
+    assert 'Showing all available cars instead.' in response.get_data(as_text=True)